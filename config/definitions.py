@@ -3,4 +3,5 @@ import os
 
 ROOT_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), '..'))
 CONFIG_PATH = os.path.join(ROOT_DIR, 'config', 'config.ini')
+LINEARIZATION_PATH = os.path.join(ROOT_DIR, 'config', 'linearization.json')
 LOG_PATH = os.path.join(ROOT_DIR, 'log', 'cobalt.log')
\ No newline at end of file
@@ -1,7 +1,16 @@
 import RPi.GPIO as GPIO
 from typing import Literal
 from typing import Union
+import threading
 import enum
+import time
+
+from libs.pins.pins import registry
+from libs.pins.pins import OUT
+
+from .linearization import Linearization
+from .pwm import SoftwarePWM
+from .ramp import Ramp
 
 
 # ---------------------------- decay mode selector --------------------------- #
@@ -44,6 +53,11 @@ class DRV8833:
         pin used to control channel B input 2 of the DRV8833 board
     ENABLE : int
         pin used to enable/disable the board
+    pwm_backend : object
+        backend creating the PWM channels (see pwm.py), RPi.GPIO software
+        PWM by default; a backend passed in may be shared by several
+        drivers and is closed by the caller, close() only closes the
+        default one
         
     Methods
     -------
@@ -58,6 +72,30 @@ class DRV8833:
 
     write(channel, rate)
         sets the speed and direction (rate) on a single motor channel.
+
+    write_both(rate_a, rate_b)
+        sets the speed and direction (rate) on both motor channels.
+
+    load_linearization(linearization)
+        sets the duty-to-speed tables used by write_speed().
+
+    write_speed(channel, speed)
+        drives a motor channel at a linear speed through the tables.
+
+    write_both_speed(speed_a, speed_b)
+        drives both motor channels at a linear speed through the tables.
+
+    get_write_counters()
+        returns the number of duty cycle updates issued and suppressed.
+
+    set_target(channel, rate)
+        moves the rate of a channel towards a target, limiting the slew rate.
+
+    set_slew_rate(channel, slew_rate)
+        sets the maximum change of the rate per second of a channel.
+
+    get_ramp_state(channel)
+        returns the current rate, the target and the time to reach it.
         
     read(channel)
         returns the speed and direction (rate) of the specified motor channel.
@@ -88,7 +126,11 @@ class DRV8833:
                  IN_1_B: int, IN_2_B: int,  # control pins for right motor
                  ENABLE: int,  # control pin to enable the board
                  decay: Decay = Decay.SLOW,  # decay mode
-                 pwm_rate: int = 1000):  # frequency
+                 pwm_rate: int = 1000,  # frequency
+                 epsilon: float = 0.0,  # minimum duty cycle change, in percent
+                 pwm_backend=None,  # PWM channels factory
+                 slew_rate: float = None,  # maximum rate change per second
+                 ramp_period: float = 0.01):  # ramp update interval
 
         # check, for each pair of pins, if they are both None or both not None
         if (IN_1_A is None) ^ (IN_2_A is None):  # one of the two is None while the other is not
@@ -119,6 +161,10 @@ class DRV8833:
         # frequency
         self.pwm_rate = pwm_rate
 
+        # PWM channels, the software PWM works on any pin
+        self._own_backend = pwm_backend is None
+        self.pwm_backend = pwm_backend if pwm_backend is not None else SoftwarePWM()
+
         # decay
         self.decay = decay
 
@@ -126,49 +172,72 @@ class DRV8833:
         self.channel_A_rate = 0  # pwm rate for channel A
         self.channel_B_rate = 0  # pwm rate for channel B
 
+        # duty cycles closer than epsilon to the ones already set on
+        # the pins are not written again
+        self.epsilon = epsilon
+        self._duty = [[0, 0], [0, 0]]  # [channel][input] duty cycle
+        self._pwm = [[None, None], [None, None]]  # [channel][input] pwm object
+
+        # counters of the duty cycle updates
+        self.writes_issued = 0
+        self.writes_suppressed = 0
+
+        # slew rate limiting: set_target() hands the target to a thread
+        # that advances the output every ramp_period seconds, and waits
+        # on the condition while every output is at its target. The lock
+        # serializes the writes of the thread and of the caller
+        self._ramps = [Ramp(slew_rate), Ramp(slew_rate)]
+        self.ramp_period = ramp_period
+        self._ramp_thread = None
+        self._ramp_running = False
+        self._lock = threading.Lock()
+        self._ramp_condition = threading.Condition(self._lock)
+
+        # duty-to-speed tables, see load_linearization()
+        self.linearization = None
+
         self._setup()
 
     def _setup(self):
         """
-        Sets up the hardware by setting the pins as OUTPUT
+        Sets up the hardware by setting the ENABLE pin as OUTPUT
         and creating the pwm objects, one for each channel, with
         which the direction and speed of each channel is controlled.
+        The PWM backend configures the input pins.
         """
 
-        GPIO.setwarnings(False)
-        GPIO.setmode(GPIO.BCM)  # init the library
-
-        if self.channel_A_enabled:
-            GPIO.setup(self.IN_1_A, GPIO.OUT)
-            GPIO.setup(self.IN_2_A, GPIO.OUT)
-        if self.channel_B_enabled:
-            GPIO.setup(self.IN_1_B, GPIO.OUT)
-            GPIO.setup(self.IN_2_B, GPIO.OUT)
-        GPIO.setup(self.ENABLE, GPIO.OUT)
-
-        # enable the board pulling self.ENABLE HIGH
-        # GPIO.output(self.ENABLE, GPIO.HIGH)
-        # self.enable()
-
-        # we could have multiple instasnces of the DRV8833
-        # so we should first check if the enable pin is
-        # already in use
-        if GPIO.gpio_function(18) != GPIO.OUT:
+        # we could have multiple instances of the DRV8833 sharing
+        # the enable pin: only the first one configures and enables it
+        if registry.claim(self.ENABLE, OUT, self, shared=True):
             self.enable()
 
         # create a PWM instance:
-        # p = GPIO.PWM(channel, frequency)
-        if self.channel_A_enabled:
-            self.pwm_1_A = GPIO.PWM(self.IN_1_A, self.pwm_rate)
-            self.pwm_2_A = GPIO.PWM(self.IN_2_A, self.pwm_rate)
-            self.pwm_1_A.start(0)
-            self.pwm_2_A.start(0)
-
-        if self.channel_B_enabled:
-            self.pwm_1_B = GPIO.PWM(self.IN_1_B, self.pwm_rate)
-            self.pwm_2_B = GPIO.PWM(self.IN_2_B, self.pwm_rate)
-            self.pwm_1_B.start(0)
-            self.pwm_2_B.start(0)
+        # p = backend.open(channel, frequency)
+        opened = []
+
+        def open_pwm(pin):
+            pwm = self.pwm_backend.open(pin, self.pwm_rate)
+            opened.append(pwm)
+            pwm.start(0)
+            return pwm
+
+        # if a pin can not be opened (e.g. it is already claimed), give
+        # back the pins claimed so far
+        try:
+            if self.channel_A_enabled:
+                self.pwm_1_A = open_pwm(self.IN_1_A)
+                self.pwm_2_A = open_pwm(self.IN_2_A)
+                self._pwm[0] = [self.pwm_1_A, self.pwm_2_A]
+
+            if self.channel_B_enabled:
+                self.pwm_1_B = open_pwm(self.IN_1_B)
+                self.pwm_2_B = open_pwm(self.IN_2_B)
+                self._pwm[1] = [self.pwm_1_B, self.pwm_2_B]
+        except Exception:
+            for pwm in opened:
+                pwm.stop()
+            registry.release(self.ENABLE, self)
+            raise
 
     def enable(self):
         """
@@ -308,62 +377,343 @@ class DRV8833:
             is out of bounds.
         """
 
+        channel = self._channel_index(_channel)
+
+        with self._lock:
+            self._ramps[channel].jump(max(-1.0, min(1.0, _rate)))
+            self._apply(channel, _rate)
+
+    def write_both(self, rate_a: Union[int, float], rate_b: Union[int, float]):
+        """
+        Set the speed and direction on both motor channels. The duty cycles
+        of the four pins are computed first and then written back to back,
+        so that the two channels change as close in time as possible. Pins
+        whose duty cycle does not change by more than epsilon are skipped.
+
+        Parameters
+        ----------
+        rate_a : float
+            modulation value for channel A between -1.0 and 1.0
+        rate_b : float
+            modulation value for channel B between -1.0 and 1.0
+
+        Raises
+        ------
+        ValueError
+            if one of the channels is not enabled.
+        """
+
+        self._channel_index(0)
+        self._channel_index(1)
+
+        with self._lock:
+            self._ramps[0].jump(max(-1.0, min(1.0, rate_a)))
+            self._ramps[1].jump(max(-1.0, min(1.0, rate_b)))
+            self._apply_both(rate_a, rate_b)
+
+    def load_linearization(self, linearization):
+        """
+        Sets the duty-to-speed tables used by write_speed() and
+        write_both_speed(), measured with linearization.characterize().
+
+        Parameters
+        ----------
+        linearization : Linearization/str
+            the tables or the path of the JSON file they were saved to
+        """
+
+        if isinstance(linearization, str):
+            linearization = Linearization.load(linearization)
+
+        self.linearization = linearization
+
+    def _rate_for(self, channel, speed):
+        """
+        Converts a linear speed into the rate of a channel in the
+        current decay mode.
+        """
+
+        if self.linearization is None:
+            raise RuntimeError('No linearization loaded, call load_linearization() first')
+
+        # same test as _duty_cycles(): anything but Decay.SLOW is fast decay
+        decay = 'SLOW' if self.decay == Decay.SLOW else 'FAST'
+        return self.linearization.rate_for(channel, decay, speed)
+
+    def write_speed(self, _channel, speed: float):
+        """
+        Drives a motor channel at a linear speed. The rate is found by
+        inverting the duty-to-speed table of the channel, which accounts
+        for the deadband and for the non linear response of the motor,
+        so that a feedback controller only has to correct small errors.
+
+        Parameters
+        ----------
+        _channel : int/str
+            0/'a'/'A' for motor A, 1/'b'/'B' for motor B
+        speed : float
+            linear speed of the wheel in m/s, negative to move backward
+
+        Raises
+        ------
+        RuntimeError
+            if no linearization has been loaded.
+        KeyError
+            if the channel was not characterized in the current decay mode.
+        """
+        channel = self._channel_index(_channel)
+        self.write(channel, self._rate_for(channel, speed))
+
+    def write_both_speed(self, speed_a: float, speed_b: float):
+        """
+        Drives both motor channels at a linear speed, see write_speed()
+        and write_both().
+        """
+        self.write_both(self._rate_for(0, speed_a), self._rate_for(1, speed_b))
+
+    def _apply(self, channel, _rate):
+        """
+        Writes the duty cycles of a channel. Must be called holding the lock.
+        """
+
+        duty_1, duty_2 = self._duty_cycles(channel, _rate)
+        self._change_duty_cycle(channel, 0, duty_1)
+        self._change_duty_cycle(channel, 1, duty_2)
+
+        self._store_rate(channel, _rate)
+
+    def _apply_both(self, rate_a, rate_b):
+        """
+        Writes the duty cycles of both channels back to back. Must be
+        called holding the lock.
+        """
+
+        duty_1_A, duty_2_A = self._duty_cycles(0, rate_a)
+        duty_1_B, duty_2_B = self._duty_cycles(1, rate_b)
+
+        self._change_duty_cycle(0, 0, duty_1_A)
+        self._change_duty_cycle(0, 1, duty_2_A)
+        self._change_duty_cycle(1, 0, duty_1_B)
+        self._change_duty_cycle(1, 1, duty_2_B)
+
+        self._store_rate(0, rate_a)
+        self._store_rate(1, rate_b)
+
+    def set_target(self, _channel, _rate: Union[int, float]):
+        """
+        Set the rate a channel has to reach without blocking. The rate
+        moves towards the target at most by the slew rate of the channel
+        per second, so that large steps do not draw current spikes.
+        Calling write() on the channel cancels the ramp.
+
+        Parameters
+        ----------
+        _channel : int/str
+            0/'a'/'A' for motor A, 1/'b'/'B' for motor B
+        _rate : float
+            target modulation value between -1.0 and 1.0
+
+        Raises
+        ------
+        ValueError
+            either if the channel identifier is invalid or the channel
+            is not enabled.
+        """
+
+        channel = self._channel_index(_channel)
+
+        with self._lock:
+            self._ramps[channel].target = max(-1.0, min(1.0, _rate))
+
+            # started under the lock, so that two callers cannot start two
+            if self._ramp_thread is None:
+                self._ramp_running = True
+                self._ramp_thread = threading.Thread(target=self._ramp_loop, daemon=True)
+                self._ramp_thread.start()
+
+            self._ramp_condition.notify()
+
+    def set_slew_rate(self, _channel, slew_rate):
+        """
+        Set the maximum change of the rate per second of a channel,
+        None to remove the limit.
+
+        Raises
+        ------
+        ValueError
+            either if the channel is invalid or not enabled, or if the
+            slew rate is not positive nor None.
+        """
+        channel = self._channel_index(_channel)
+        with self._lock:
+            self._ramps[channel].slew_rate = slew_rate
+
+    def get_ramp_state(self, _channel):
+        """
+        Returns the state of the ramp of a channel.
+
+        Returns
+        -------
+            tuple containing:
+                rate currently applied
+                target rate
+                seconds needed to reach the target
+        """
+        channel = self._channel_index(_channel)
+        with self._lock:
+            ramp = self._ramps[channel]
+            return ramp.output, ramp.target, ramp.time_to_target()
+
+    def _ramp_loop(self):
+        """
+        Advances the ramps every ramp_period seconds and writes the
+        channels whose output changed; sleeps on the condition while
+        every enabled output is at its target.
+        """
+
+        enabled = [self.channel_A_enabled, self.channel_B_enabled]
+
+        def idle():
+            return all(ramp.at_target() or not enabled[channel]
+                       for channel, ramp in enumerate(self._ramps))
+
+        last_time = time.monotonic()
+        next_time = last_time
+        while self._ramp_running:
+
+            with self._ramp_condition:
+                if idle():
+                    while self._ramp_running and idle():
+                        self._ramp_condition.wait()
+                    # the ramp starts over from now
+                    last_time = next_time = time.monotonic()
+            if not self._ramp_running:
+                break
+
+            next_time += self.ramp_period
+            time.sleep(max(0.0, next_time - time.monotonic()))
+
+            now = time.monotonic()
+            dt = now - last_time
+            last_time = now
+
+            with self._lock:
+
+                changed = [False, False]
+                for channel in range(2):
+                    ramp = self._ramps[channel]
+                    if enabled[channel] and ramp.output != ramp.target:
+                        ramp.advance(dt)
+                        changed[channel] = True
+
+                if changed[0] and changed[1]:
+                    self._apply_both(self._ramps[0].output, self._ramps[1].output)
+                elif changed[0]:
+                    self._apply(0, self._ramps[0].output)
+                elif changed[1]:
+                    self._apply(1, self._ramps[1].output)
+
+    def _channel_index(self, _channel):
+        """
+        Converts a channel identifier into the channel index (0 for A,
+        1 for B) and checks that the channel is enabled.
+
+        Raises
+        ------
+        ValueError
+            either if the channel identifier is invalid or the channel
+            is not enabled.
+        """
+
+        if _channel in (0, 'a', 'A'):
+            channel = 0
+        elif _channel in (1, 'b', 'B'):
+            channel = 1
+        else:
+            error_msg = 'Invalid channel identifier: {}'.format(_channel)
+            raise ValueError(error_msg)
+
         # check if the channel is enabled
         if (
-                _channel == 0 and not self.channel_A_enabled or
-                _channel == 1 and not self.channel_B_enabled
+                channel == 0 and not self.channel_A_enabled or
+                channel == 1 and not self.channel_B_enabled
         ):
-            error_msg = 'Channel {0:s} is not enabled'.format(chr(_channel + 65))
+            error_msg = 'Channel {0:s} is not enabled'.format(chr(channel + 65))
             raise ValueError(error_msg)
 
+        return channel
+
+    def _duty_cycles(self, channel, _rate):
+        """
+        Computes the duty cycles of the two inputs of a channel for the
+        given rate, according to the tables in write(). The two channels
+        are wired with opposite polarity, so the inputs of channel B are
+        swapped with respect to channel A.
+
+        Returns
+        -------
+            tuple containing:
+                duty cycle of xIN1 (0.0 <= dc <= 100.0)
+                duty cycle of xIN2 (0.0 <= dc <= 100.0)
+        """
+
         # clip the rate value between -1.0 and 1.0
         _rate = max(-1.0, min(1.0, _rate))  # clip value
 
-        # convert the rate (range [-1.0, 0.0]) into percentage and direction 
+        # convert the rate (range [-1.0, 0.0]) into percentage and direction
         # (rate >/< 0)
         # outMin + (((value - inMin) / (inMax - inMin)) * (outMax - outMin))
         pwm = (abs(_rate) * 100)
 
         if self.decay == Decay.SLOW:
+            if _rate >= 0:  # forward
+                duty = (0, pwm)
+            else:  # backward
+                duty = (pwm, 0)
+        else:
+            if _rate >= 0:  # forward
+                duty = (100 - pwm, 100)
+            else:  # backward
+                duty = (100, 100 - pwm)
+
+        if channel == 1:
+            duty = (duty[1], duty[0])
 
-            if _channel == 0:
-                if _rate >= 0:  # forward
-                    # dc is the duty cycle (0.0 <= dc <= 100.0)
-                    self.pwm_1_A.ChangeDutyCycle(0)
-                    self.pwm_2_A.ChangeDutyCycle(pwm)
-                else:  # backward
-                    self.pwm_1_A.ChangeDutyCycle(pwm)
-                    self.pwm_2_A.ChangeDutyCycle(0)
-                self.channel_A_rate = _rate
-
-            else:
-                if _rate >= 0:  # forward
-                    self.pwm_1_B.ChangeDutyCycle(pwm)
-                    self.pwm_2_B.ChangeDutyCycle(0)
-                else:  # backward
-                    self.pwm_1_B.ChangeDutyCycle(0)
-                    self.pwm_2_B.ChangeDutyCycle(pwm)
-                self.channel_B_rate = _rate
+        return duty
+
+    def _change_duty_cycle(self, channel, _input, duty):
+        """
+        Writes the duty cycle of an input pin unless it is within epsilon
+        of the one already set.
+        """
 
+        if abs(duty - self._duty[channel][_input]) <= self.epsilon:
+            self.writes_suppressed += 1
+            return
+
+        self._pwm[channel][_input].ChangeDutyCycle(duty)
+        self._duty[channel][_input] = duty
+        self.writes_issued += 1
+
+    def _store_rate(self, channel, _rate):
+        _rate = max(-1.0, min(1.0, _rate))
+        if channel == 0:
+            self.channel_A_rate = _rate
         else:
+            self.channel_B_rate = _rate
 
-            if _channel == 0:
-                if _rate >= 0:  # forward
-                    self.pwm_1_A.ChangeDutyCycle(100 - pwm)
-                    self.pwm_2_A.ChangeDutyCycle(100)
-                else:  # backward
-                    self.pwm_1_A.ChangeDutyCycle(100)
-                    self.pwm_2_A.ChangeDutyCycle(100 - pwm)
-                self.channel_A_rate = _rate
-
-            else:
-                if _rate >= 0:  # forward
-                    self.pwm_1_B.ChangeDutyCycle(100)
-                    self.pwm_2_B.ChangeDutyCycle(100 - pwm)
-                else:  # backward
-                    self.pwm_1_B.ChangeDutyCycle(100 - pwm)
-                    self.pwm_2_B.ChangeDutyCycle(100)
-                self.channel_B_rate = _rate
+    def get_write_counters(self):
+        """
+        Returns the number of duty cycle updates sent to the pins and the
+        number of the ones skipped because the duty cycle did not change.
+
+        Returns
+        -------
+            tuple containing:
+                number of updates issued
+                number of updates suppressed
+        """
+        return self.writes_issued, self.writes_suppressed
 
     def stop(self, _channel):
         """
@@ -402,15 +752,7 @@ class DRV8833:
 
         """
 
-        # check if the channel is enabled
-        if (
-                _channel == 0 and not self.channel_A_enabled or
-                _channel == 1 and not self.channel_B_enabled
-        ):
-            error_msg = 'Channel {0:s} is not enabled'.format(chr(_channel + 65))
-            raise ValueError(error_msg)
-
-        if _channel == 0:
+        if self._channel_index(_channel) == 0:
             return self.channel_A_rate
 
         return self.channel_B_rate
@@ -436,22 +778,33 @@ class DRV8833:
         even after the program exits.
         """
 
+        # stop the ramps before the channels they write
+        with self._ramp_condition:
+            self._ramp_running = False
+            self._ramp_condition.notify()
+        if self._ramp_thread is not None:
+            self._ramp_thread.join()
+            self._ramp_thread = None
+
         # calling GPIO.cleanup() will affect all the pins,
         # even the ones used in other modules
         # GPIO.cleanup()
+        # stopping a channel also frees its pin
         if self.channel_A_enabled:
             self.pwm_1_A.stop()
             self.pwm_2_A.stop()
-            GPIO.setup(self.IN_1_A, GPIO.IN)
-            GPIO.setup(self.IN_2_A, GPIO.IN)
 
         if self.channel_B_enabled:
             self.pwm_1_B.stop()
             self.pwm_2_B.stop()
-            GPIO.setup(self.IN_1_B, GPIO.IN)
-            GPIO.setup(self.IN_2_B, GPIO.IN)
 
-        GPIO.setup(self.ENABLE, GPIO.IN)
+        # a backend passed in may be shared with other drivers, e.g. the
+        # connection with the pigpio daemon: its owner closes it
+        if self._own_backend:
+            self.pwm_backend.close()
+
+        # the last board using the enable pin frees it
+        registry.release(self.ENABLE, self)
 
     # When an object is no longer being used by a program, Python's garbage
     # collector automatically deletes the object and frees up the memory it 
@@ -478,7 +831,21 @@ class DRV8833:
 
 if __name__ == '__main__':
 
-    from time import sleep
+    # Characterizes both channels: sweeps the rate in both decay modes,
+    # measures the steady-state speed of each wheel with its encoder and
+    # saves the duty-to-speed tables to LINEARIZATION_PATH, to be loaded
+    # with load_linearization(). Lift the robot before running it, from
+    # the root of the repository, with python -m hardlibs.DRV8833.DRV8833
+
+    import configparser
+    import os
+
+    from config.definitions import CONFIG_PATH
+    from config.definitions import LINEARIZATION_PATH
+    from libs.encoder.encoder import Encoder
+    from libs.pins.pins import check_config
+
+    from .linearization import characterize
 
     # --------------------------- float range generator -------------------------- #
 
@@ -509,79 +876,67 @@ if __name__ == '__main__':
             yield temp
             count += 1
 
+    # -------------------------------- parameters -------------------------------- #
 
-    # -------------------------------- actual test ------------------------------- #
+    config = configparser.ConfigParser()
+    config.read(CONFIG_PATH)
+    check_config(config)
 
-    import config
+    IN_1_LEFT = int(config['PINS']['IN_1_LEFT'])
+    IN_2_LEFT = int(config['PINS']['IN_2_LEFT'])
+    IN_1_RIGHT = int(config['PINS']['IN_1_RIGHT'])
+    IN_2_RIGHT = int(config['PINS']['IN_2_RIGHT'])
+    ENABLE = int(config['PINS']['ENABLE'])
 
-    IN_1_LEFT = 21
-    IN_2_LEFT = 20
-    IN_1_RIGHT = 16
-    IN_2_RIGHT = 12
-    ENABLE = 7
+    ENCODER_PINS = (
+        (int(config['PINS']['LEFT_ENC_CLK']), int(config['PINS']['LEFT_ENC_DT'])),
+        (int(config['PINS']['RIGHT_ENC_CLK']), int(config['PINS']['RIGHT_ENC_DT'])),
+    )
+    MIN_PULSE_WIDTH = float(config['ENCODER']['MIN_PULSE_WIDTH']) * 1e-6  # s
 
+    TICKS_PER_REVOLUTION = 7 * int(config['MOTOR']['REDUCTION_RATIO'])  # 1x decoding
+    WHEEL_RADIUS = float(config['WHEELS']['DIAMETER']) / 2 / 1000  # m
+
+    # fine steps at low rates, where the deadband ends
+    RATES = [round(rate, 2) for rate in frange(0.0, 0.3, 0.02)] + \
+            [round(rate, 2) for rate in frange(0.3, 1.05, 0.1)]
+
+    # -------------------------------- actual test ------------------------------- #
+
+    def log(decay, rate, speed):
+        print('{}\t{:>6.2f}\t{:>8.4f} m/s'.format(decay, rate, speed))
+
+    tables = {}
     with DRV8833(
             IN_1_A=IN_1_LEFT, IN_2_A=IN_2_LEFT,
             IN_1_B=IN_1_RIGHT, IN_2_B=IN_2_RIGHT,
             ENABLE=ENABLE
     ) as motor_driver:
 
-        motor_driver.setSlowDecay()
-        print('Decay: {}'.format(
-            'SLOW' if motor_driver.getDecayMode() == Decay.SLOW else 'FAST'
-        ))
-
-        # --------------------- test both channels independently --------------------- #
-
-        for channel in range(2):
-
-            for rate in frange(-1.0, 1.1, 0.1):
-                print('Channel {}\tDirection {}\t Duty cycle {}'.format(
-                    chr(channel + 65), 'forward' if rate > 0 else 'backward', round(rate, 2)))
-                motor_driver.write(channel, rate)
-                sleep(1)
+        for channel, (clk, dt) in enumerate(ENCODER_PINS):
 
-            # stop the motor, otherwise the last suitable rate is kept
-            print('Stopping channel {}'.format(chr(channel + 65)))
-            motor_driver.stop(channel)
-
-        # -------------------- test both channels at the same time ------------------- #
-
-        # test both motors at the same time
-        for rate in frange(-1.0, 1.0, 0.1):
-            print('Both channels \tDirection {}\t Duty cycle {}'.format(
-                'forward' if rate > 0 else 'backward', round(rate, 2)))
-            motor_driver.write('a', rate)
-            motor_driver.write('b', rate)
-            sleep(1)
-
-        # stop the motor, otherwise the last suitable rate is kept
-        print('Stopping both channels')
-        motor_driver.stop('b')
-        motor_driver.stop('a')
+            print('Channel {}'.format(chr(channel + 65)))
+            with Encoder(PIN_CLK=clk, PIN_DT=dt, min_pulse_width=MIN_PULSE_WIDTH) as encoder:
+                tables.update(characterize(
+                    motor_driver, channel, encoder,
+                    TICKS_PER_REVOLUTION, WHEEL_RADIUS, RATES, log=log))
 
     # the close() function is automatically called by __exit__()
     # once the with block ends
 
-    # ------------------------ test two DRV8833 instances ------------------------ #
-
-    with DRV8833(
-            IN_1_A=IN_1_LEFT, IN_2_A=IN_2_LEFT,
-            IN_1_B=None, IN_2_B=None,
-            ENABLE=ENABLE
-    ) as left_motor, DRV8833(
-            IN_1_A=None, IN_2_A=None,
-            IN_1_B=IN_1_RIGHT, IN_2_B=IN_2_RIGHT,
-            ENABLE=ENABLE
-    ) as right_motor:
-        
-        # test both motors at the same time
-        for rate in frange(-1.0, 1.0, 0.1):
-            print('Both channels \tDirection {}\t Duty cycle {}'.format(
-                'forward' if rate > 0 else 'backward', round(rate, 2)))
-
-            # later on these methods will be enclosed into another class
-            # that will stream the channel for each write
-            left_motor.write('a', rate)
-            right_motor.write('b', rate)
-            sleep(1)
+    # keep the measures even if they can not be inverted, the sweep
+    # takes minutes
+    try:
+        linearization = Linearization(tables)
+    except ValueError:
+        raw_path = '{}_raw{}'.format(*os.path.splitext(LINEARIZATION_PATH))
+        Linearization.save_tables(tables, raw_path)
+        print('Measures saved to {}'.format(raw_path))
+        raise
+    linearization.save(LINEARIZATION_PATH)
+
+    for decay, channel in sorted(tables):
+        low, high = linearization.deadband(channel, decay)
+        print('Channel {} {} decay: deadband [{:.2f}, {:.2f}]'.format(channel, decay, low, high))
+
+    print('Saved to {}'.format(LINEARIZATION_PATH))
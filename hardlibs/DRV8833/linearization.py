@@ -0,0 +1,363 @@
+import bisect
+import json
+import math
+import time
+
+
+# A DC motor does not turn until the duty cycle overcomes the static
+# friction (deadband) and above it the speed is not proportional to the
+# duty cycle. The characterization below measures the speed reached at
+# each rate, in both decay modes, and the resulting table is inverted to
+# find the rate that gives a requested speed.
+
+
+class Linearization:
+    """
+    Duty-to-speed lookup tables of the two channels of a DRV8833, one per
+    decay mode, and their inverse.
+
+    ...
+
+    Attributes
+    ----------
+    tables : dict
+        (decay, channel) -> list of (rate, speed) points sorted by rate,
+        where decay is 'SLOW' or 'FAST', channel is 'A' or 'B' and speed
+        is the steady-state linear speed of the wheel in m/s
+
+    Methods
+    -------
+    rate_for(channel, decay, speed)
+        returns the rate that drives the channel at the given speed.
+
+    deadband(channel, decay)
+        returns the range of rates that do not move the wheel.
+
+    save(path)
+        writes the tables to a JSON file.
+
+    load(path)
+        reads the tables from a JSON file.
+    """
+
+    def __init__(self, tables, threshold=1e-3, tolerance=0.02):
+        """
+        Parameters
+        ----------
+        tables : dict
+            (decay, channel) -> iterable of (rate, speed) points
+        threshold : float
+            speeds (m/s) up to this value are considered zero
+        tolerance : float
+            drops of the speed up to this fraction of the fastest speed
+            so far are noise of the measures (see the tolerance of
+            measure_speed()), not a table that is not monotonic
+
+        Raises
+        ------
+        ValueError
+            if a table is not monotonic, see _invert_direction().
+        """
+
+        self.tables = {
+            key: sorted((float(rate), float(speed)) for rate, speed in points)
+            for key, points in tables.items()
+        }
+        self.threshold = threshold
+        self.tolerance = tolerance
+
+        # inverse tables, (decay, channel) -> (forward, reverse) where each
+        # direction is a (speeds, rates) pair with increasing speeds
+        self._inverse = {key: self._invert(points) for key, points in self.tables.items()}
+
+    def _invert(self, points):
+
+        forward = [(rate, speed) for rate, speed in points if rate >= 0]
+        reverse = [(-rate, -speed) for rate, speed in reversed(points) if rate <= 0]
+
+        return self._invert_direction(forward, 1), self._invert_direction(reverse, -1)
+
+    def _invert_direction(self, points, sign):
+        """
+        Builds the inverse of one direction of a table, whose points are
+        mirrored to positive rates (sign is -1 for reverse): the rates that do
+        not move the wheel collapse into the edge of the deadband, and
+        drops of the speed within threshold or within tolerance of the
+        fastest speed so far (noise of the measures) are ignored.
+
+        Raises
+        ------
+        ValueError
+            if a speed has the wrong sign or the speed decreases by more
+            than the noise as the rate grows.
+        """
+
+        speeds, rates = [0.0], [0.0]
+        top = 0.0
+        for rate, speed in points:
+            if speed < -self.threshold:
+                error_msg = 'Speed {} at rate {} has the sign opposite to the rate'.format(
+                    sign * speed, sign * rate)
+                raise ValueError(error_msg)
+            if speed < top - max(self.threshold, self.tolerance * top):
+                error_msg = 'Table not monotonic: speed {} at rate {} after {}'.format(
+                    sign * speed, sign * rate, sign * top)
+                raise ValueError(error_msg)
+            if speed <= self.threshold:
+                rates[0] = rate  # still in the deadband
+            elif speed > top:
+                top = speed
+                speeds.append(speed)
+                rates.append(rate)
+
+        return speeds, rates
+
+    @staticmethod
+    def _key(channel, decay):
+
+        if channel in (0, 'a', 'A'):
+            channel = 'A'
+        elif channel in (1, 'b', 'B'):
+            channel = 'B'
+        else:
+            error_msg = 'Invalid channel identifier: {}'.format(channel)
+            raise ValueError(error_msg)
+
+        return str(decay).upper(), channel
+
+    def _lookup(self, channel, decay):
+
+        key = self._key(channel, decay)
+        if key not in self._inverse:
+            error_msg = 'No table for channel {} in {} decay'.format(key[1], key[0])
+            raise KeyError(error_msg)
+
+        return self._inverse[key]
+
+    def rate_for(self, channel, decay, speed):
+        """
+        Returns the rate that drives the channel at the given speed,
+        interpolating linearly between the measured points. Speeds above
+        the highest measured one get the highest measured rate.
+
+        Parameters
+        ----------
+        channel : int/str
+            0/'a'/'A' for motor A, 1/'b'/'B' for motor B
+        decay : str
+            'SLOW' or 'FAST'
+        speed : float
+            linear speed in m/s, negative to move backward
+
+        Returns
+        -------
+        rate : float
+            modulation value between -1.0 and 1.0
+
+        Raises
+        ------
+        KeyError
+            if the channel was not characterized in that decay mode.
+        """
+
+        forward, reverse = self._lookup(channel, decay)
+
+        if speed == 0:
+            return 0.0
+
+        speeds, rates = forward if speed > 0 else reverse
+        target = abs(speed)
+
+        i = bisect.bisect_left(speeds, target)
+        if i >= len(speeds):
+            rate = rates[-1]
+        else:
+            # speeds[0] is 0 and target > 0, so i >= 1
+            s0, s1 = speeds[i - 1], speeds[i]
+            r0, r1 = rates[i - 1], rates[i]
+            rate = r0 + (r1 - r0) * (target - s0) / (s1 - s0)
+
+        return math.copysign(rate, speed)
+
+    def deadband(self, channel, decay):
+        """
+        Returns the range of rates that do not move the wheel.
+
+        Returns
+        -------
+            tuple containing:
+                lowest reverse rate that does not move the wheel
+                highest forward rate that does not move the wheel
+        """
+        forward, reverse = self._lookup(channel, decay)
+        return -reverse[1][0], forward[1][0]
+
+    def save(self, path):
+        """
+        Writes the tables to a JSON file.
+        """
+        self.save_tables(self.tables, path, self.threshold, self.tolerance)
+
+    @staticmethod
+    def save_tables(tables, path, threshold=1e-3, tolerance=0.02):
+        """
+        Writes tables to a JSON file without inverting them, e.g. to keep
+        the measures of a sweep that Linearization rejects; load() reads
+        them back.
+        """
+
+        data = {}
+        for (decay, channel), points in tables.items():
+            data.setdefault(decay, {})[channel] = [list(point) for point in points]
+
+        data = {'threshold': threshold, 'tolerance': tolerance, 'tables': data}
+
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=4)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads the tables from a JSON file written by save().
+        """
+
+        with open(path) as f:
+            data = json.load(f)
+
+        tables = {
+            (decay, channel): points
+            for decay, channels in data['tables'].items()
+            for channel, points in channels.items()
+        }
+
+        return cls(tables, threshold=data['threshold'], tolerance=data.get('tolerance', 0.02))
+
+
+# ----------------------------- characterization ----------------------------- #
+
+def measure_speed(encoder, ticks_per_revolution, wheel_radius,
+                  window=0.5, tolerance=0.02, timeout=5.0):
+    """
+    Waits for the wheel to reach a steady state and returns its speed.
+    The speed is the count over consecutive windows, steady once two of
+    them differ by less than tolerance (relative to the speed).
+
+    Parameters
+    ----------
+    encoder : Encoder
+        encoder mounted on the motor
+    ticks_per_revolution : int
+        ticks registered by the encoder in a revolution of the wheel
+    wheel_radius : float
+        radius of the wheel in meters
+    window : float
+        length of a measure in seconds
+    tolerance : float
+        maximum relative difference between two consecutive measures
+    timeout : float
+        seconds after which the last measure is returned even if the
+        speed is not steady
+
+    Returns
+    -------
+    speed : float
+        linear speed in m/s
+    """
+
+    meters_per_tick = 2 * math.pi * wheel_radius / ticks_per_revolution
+
+    t_end = time.monotonic() + timeout
+    count, timestamp, _ = encoder.edge_snapshot()
+    previous = None
+    while True:
+
+        time.sleep(window)
+        new_count, new_timestamp, _ = encoder.edge_snapshot()
+        speed = (new_count - count) * meters_per_tick / (new_timestamp - timestamp)
+        count, timestamp = new_count, new_timestamp
+
+        if previous is not None:
+            scale = max(abs(speed), abs(previous), meters_per_tick / window)
+            if abs(speed - previous) <= tolerance * scale:
+                return (speed + previous) / 2
+
+        if time.monotonic() > t_end:
+            return speed
+
+        previous = speed
+
+
+def characterize(driver, channel, encoder, ticks_per_revolution, wheel_radius,
+                 rates, decays=None, log=None, **kwargs):
+    """
+    Sweeps the rate of a channel and measures the steady-state speed of
+    the wheel at each step. Each direction is swept from 0 outwards, so
+    that the motor never reverses between two consecutive steps.
+
+    Parameters
+    ----------
+    driver : DRV8833
+        driver the motor is connected to
+    channel : int/str
+        0/'a'/'A' for motor A, 1/'b'/'B' for motor B
+    encoder : Encoder
+        encoder mounted on the motor
+    ticks_per_revolution : int
+        ticks registered by the encoder in a revolution of the wheel
+    wheel_radius : float
+        radius of the wheel in meters
+    rates : iterable
+        rates between 0.0 and 1.0 to measure, in both directions
+    decays : iterable
+        names of the decay modes to characterize, 'SLOW' and/or 'FAST',
+        both if None
+    log : callable
+        called with (decay name, rate, speed) after every measure
+    kwargs
+        passed to measure_speed()
+
+    Returns
+    -------
+    tables : dict
+        (decay, channel) -> list of (rate, speed) points, to be merged
+        with the tables of the other channel into a Linearization
+    """
+
+    # the modes are set through the driver, by name: importing Decay
+    # here would give a second class when the driver runs as __main__,
+    # whose members the driver does not recognize
+    set_decay = {'SLOW': driver.set_slow_decay, 'FAST': driver.set_dast_decay}
+
+    if decays is None:
+        decays = ('SLOW', 'FAST')
+
+    rates = sorted(set(abs(rate) for rate in rates))
+    key_channel = Linearization._key(channel, 'SLOW')[1]
+
+    tables = {}
+    initial_decay = driver.get_decay_mode()
+    try:
+        for decay in decays:
+
+            set_decay[decay.upper()]()
+            points = []
+            for direction in (1, -1):
+                for rate in rates:
+                    driver.write(channel, direction * rate)
+                    speed = measure_speed(encoder, ticks_per_revolution, wheel_radius, **kwargs)
+                    # in Mode.SINGLE the encoder counts up in both
+                    # directions, the sign comes from the rate
+                    speed = direction * abs(speed)
+                    points.append((direction * rate, speed))
+                    if log is not None:
+                        log(decay, direction * rate, speed)
+
+                driver.stop(channel)
+                time.sleep(kwargs.get('window', 0.5))
+
+            tables[(decay.upper(), key_channel)] = sorted(points)
+    finally:
+        driver.stop(channel)
+        driver.decay = initial_decay
+
+    return tables
@@ -0,0 +1,340 @@
+import os
+import socket
+import struct
+import threading
+import time
+
+from libs.pins.pins import registry
+from libs.pins.pins import EXTERNAL
+from libs.pins.pins import OUT
+
+# the backends are optional: RPi.GPIO is only needed by the software PWM
+
+try:
+    import RPi.GPIO as GPIO
+except ImportError:  # not running on a Raspberry Pi
+    GPIO = None
+
+
+# A PWM backend creates the PWM channels the DRV8833 drives its inputs
+# with. It has two methods:
+#
+#   open(pin, frequency)  configures the pin and returns a channel
+#   close()               frees what the backend holds, once its channels
+#                         are stopped
+#
+# Channels follow the RPi.GPIO.PWM interface used by the DRV8833:
+#
+#   start(duty)             starts the PWM with the given duty cycle
+#   ChangeDutyCycle(duty)   sets the duty cycle (0.0 <= duty <= 100.0)
+#   stop()                  stops the PWM and frees the pin
+
+
+# ------------------------------- software PWM ------------------------------- #
+
+class SoftwarePWMChannel:
+    """
+    RPi.GPIO software PWM on a single pin. Each channel is a background
+    thread toggling the pin, so its timing jitters when the CPU is busy.
+    """
+
+    def __init__(self, pin, frequency):
+
+        self.pin = pin
+
+        registry.claim(self.pin, OUT, self)
+        self._pwm = GPIO.PWM(self.pin, frequency)
+
+    def start(self, duty):
+        self._pwm.start(duty)
+
+    def ChangeDutyCycle(self, duty):
+        self._pwm.ChangeDutyCycle(duty)
+
+    def stop(self):
+        self._pwm.stop()
+        registry.release(self.pin, self)
+
+
+class SoftwarePWM:
+    """
+    Backend creating RPi.GPIO software PWM channels. It works on any pin
+    and is the fallback of the other backends.
+    """
+
+    def __init__(self):
+
+        if GPIO is None:
+            raise ImportError('RPi.GPIO is not available, use another PWM backend')
+
+    def open(self, pin, frequency):
+        return SoftwarePWMChannel(pin, frequency)
+
+    def close(self):
+        pass
+
+
+# ------------------------------ sysfs hardware ------------------------------ #
+
+# pwmchip and channel of the hardware PWM on the Raspberry Pi (BCM 2835 -
+# 2711) once the pwm-2chan overlay routes it to the pins
+RASPBERRY_PI_PWM_CHANNELS = {
+    12: (0, 0), 18: (0, 0),
+    13: (0, 1), 19: (0, 1),
+}
+
+
+class SysfsPWMChannel:
+    """
+    Hardware PWM channel driven through /sys/class/pwm/pwmchipN/pwmM.
+    The PWM is generated by the SoC, so it takes no CPU time and does not
+    jitter; changing the duty cycle is a single write on a file that is
+    kept open.
+    """
+
+    def __init__(self, backend, pin, chip, channel, frequency, export_timeout=1.0):
+
+        self.backend = backend
+
+        # the pin is routed to the PWM by the overlay, not by RPi.GPIO
+        self.pin = pin
+        registry.claim(self.pin, EXTERNAL, self)
+
+        self.chip = chip
+        self.chip_path = os.path.join(backend.root, 'pwmchip{}'.format(chip))
+        self.path = os.path.join(self.chip_path, 'pwm{}'.format(channel))
+        self.channel = channel
+
+        # export the channel unless it is already; the kernel creates the
+        # directory asynchronously, udev may take a while to fix its
+        # permissions
+        if not os.path.isdir(self.path):
+            self._write(os.path.join(self.chip_path, 'export'), self.channel)
+
+            t_end = time.monotonic() + export_timeout
+            while not os.path.isdir(self.path):
+                if time.monotonic() > t_end:
+                    error_msg = 'Unable to export PWM channel {}'.format(self.path)
+                    raise RuntimeError(error_msg)
+                time.sleep(0.01)
+
+        self.period = int(round(1e9 / frequency))  # ns
+
+        # the duty cycle can not exceed the period: clear it before
+        # setting the period in case the channel was left configured
+        self._write(os.path.join(self.path, 'duty_cycle'), 0)
+        self._write(os.path.join(self.path, 'period'), self.period)
+
+        self._duty_fd = os.open(os.path.join(self.path, 'duty_cycle'), os.O_WRONLY)
+
+    @staticmethod
+    def _write(path, value):
+        with open(path, 'w') as f:
+            f.write(str(value))
+
+    def start(self, duty):
+        self.ChangeDutyCycle(duty)
+        self._write(os.path.join(self.path, 'enable'), 1)
+
+    def ChangeDutyCycle(self, duty):
+        value = str(int(self.period * duty / 100)).encode()
+        os.pwrite(self._duty_fd, value, 0)
+        if self.backend.regular_files:
+            os.ftruncate(self._duty_fd, len(value))
+
+    def stop(self):
+        self.ChangeDutyCycle(0)
+        self._write(os.path.join(self.path, 'enable'), 0)
+        os.close(self._duty_fd)
+        self._write(os.path.join(self.chip_path, 'unexport'), self.channel)
+        registry.release(self.pin, self)
+        self.backend._release(self.chip, self.channel)
+
+
+class SysfsPWM:
+    """
+    Backend creating hardware PWM channels through the sysfs interface.
+    Pins without a hardware channel get one from the fallback backend.
+
+    The Raspberry Pi has two hardware PWM channels only: for the DRV8833
+    this means that two of the four inputs are driven in hardware, the
+    other two fall back to software PWM.
+    """
+
+    def __init__(self, channels=None, root='/sys/class/pwm', fallback=None, regular_files=False):
+        """
+        Parameters
+        ----------
+        channels : dict
+            pin -> (pwmchip, channel), RASPBERRY_PI_PWM_CHANNELS if None
+        root : str
+            directory containing the pwmchipN directories
+        fallback : object
+            backend used for the pins not in channels, if None those
+            pins raise a ValueError
+        regular_files : bool
+            True if root is a fake tree made of regular files (for
+            testing): sysfs takes each write as a whole value, a regular
+            file has to be truncated after it
+        """
+
+        self.channels = channels if channels is not None else RASPBERRY_PI_PWM_CHANNELS
+        self.root = root
+        self.fallback = fallback
+        self.regular_files = regular_files
+
+        self._used = set()
+
+    def open(self, pin, frequency):
+
+        if pin not in self.channels:
+            if self.fallback is None:
+                error_msg = 'No hardware PWM channel for pin {}'.format(pin)
+                raise ValueError(error_msg)
+            return self.fallback.open(pin, frequency)
+
+        chip, channel = self.channels[pin]
+        if (chip, channel) in self._used:
+            error_msg = 'Hardware PWM channel {} of pwmchip{} is already in use'.format(channel, chip)
+            raise ValueError(error_msg)
+        self._used.add((chip, channel))
+
+        try:
+            return SysfsPWMChannel(self, pin, chip, channel, frequency)
+        except Exception:
+            self._release(chip, channel)
+            raise
+
+    def _release(self, chip, channel):
+        # called by the channels when they are stopped
+        self._used.discard((chip, channel))
+
+    def close(self):
+        if self.fallback is not None:
+            self.fallback.close()
+
+
+# ------------------------------ pigpio daemon ------------------------------- #
+
+# pigpio socket commands
+_PI_CMD_MODES = 0  # set pin mode
+_PI_CMD_PWM = 5  # set duty cycle
+_PI_CMD_PRS = 6  # set duty cycle range
+_PI_CMD_PFS = 7  # set frequency
+
+_PI_INPUT = 0
+_PI_OUTPUT = 1
+
+
+class PigpioPWMChannel:
+    """
+    PWM channel generated by the pigpio daemon, that times the pulses
+    with the DMA engine instead of a thread.
+    """
+
+    RANGE = 10000  # duty cycle resolution, 0.01%
+
+    def __init__(self, backend, pin, frequency):
+
+        self.backend = backend
+        self.pin = pin
+
+        # the daemon configures the pin
+        registry.claim(self.pin, EXTERNAL, self)
+
+        self.backend.command(_PI_CMD_MODES, self.pin, _PI_OUTPUT)
+        self.backend.command(_PI_CMD_PFS, self.pin, frequency)
+        self.backend.command(_PI_CMD_PRS, self.pin, self.RANGE)
+
+    def start(self, duty):
+        self.ChangeDutyCycle(duty)
+
+    def ChangeDutyCycle(self, duty):
+        self.backend.command(_PI_CMD_PWM, self.pin, int(self.RANGE * duty / 100))
+
+    def stop(self):
+        self.ChangeDutyCycle(0)
+        self.backend.command(_PI_CMD_MODES, self.pin, _PI_INPUT)
+        registry.release(self.pin, self)
+
+
+class PigpioPWM:
+    """
+    Backend creating PWM channels on a pigpio compatible daemon, speaking
+    its socket protocol: every command is four little endian unsigned
+    integers (command, p1, p2, p3) and the daemon answers with the same
+    layout, the last integer being the (signed) result.
+    """
+
+    def __init__(self, host='localhost', port=8888, timeout=1.0):
+
+        self.host = host
+        self.port = port
+
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._lock = threading.Lock()
+
+    def command(self, cmd, p1, p2):
+        """
+        Sends a command to the daemon and returns its result.
+
+        Raises
+        ------
+        RuntimeError
+            if the daemon reports an error.
+        """
+
+        with self._lock:
+            self._socket.sendall(struct.pack('<IIII', cmd, p1, p2, 0))
+
+            response = b''
+            while len(response) < 16:
+                chunk = self._socket.recv(16 - len(response))
+                if not chunk:
+                    raise RuntimeError('Connection to the pigpio daemon closed')
+                response += chunk
+
+        result = struct.unpack('<IIIi', response)[3]
+        if result < 0:
+            error_msg = 'pigpio command {} on pin {} failed with error {}'.format(cmd, p1, result)
+            raise RuntimeError(error_msg)
+
+        return result
+
+    def open(self, pin, frequency):
+        return PigpioPWMChannel(self, pin, frequency)
+
+    def close(self):
+        """
+        Closes the connection with the daemon.
+        """
+        self._socket.close()
+
+
+# ----------------------------------- main ----------------------------------- #
+
+if __name__ == '__main__':
+
+    # drive a hardware channel on a fake sysfs tree and show what is
+    # written in the files
+
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as root:
+
+        # the kernel would create pwm0 on export, do it in advance
+        os.makedirs(os.path.join(root, 'pwmchip0', 'pwm0'))
+
+        backend = SysfsPWM(root=root, regular_files=True)
+        channel = backend.open(18, 1000)
+        channel.start(0)
+
+        for duty in (25, 100, 50):
+            channel.ChangeDutyCycle(duty)
+            with open(os.path.join(channel.path, 'duty_cycle')) as f:
+                print('duty {:>3}% -> duty_cycle {} ns over period {} ns'.format(
+                    duty, f.read(), channel.period))
+
+        channel.stop()
+        backend.close()
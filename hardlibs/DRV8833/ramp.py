@@ -0,0 +1,89 @@
+class Ramp:
+    """
+    Slew rate limiter for a single motor channel. The output moves
+    towards the target by at most slew_rate (rate units per second)
+    every time the ramp is advanced.
+
+    ...
+
+    Attributes
+    ----------
+    slew_rate : float
+        maximum change of the output per second, None for no limit
+    output : float
+        rate currently applied to the channel
+    target : float
+        rate the output is moving towards
+    """
+
+    def __init__(self, slew_rate=None):
+
+        self.slew_rate = slew_rate
+        self.output = 0.0
+        self.target = 0.0
+
+    @property
+    def slew_rate(self):
+        return self._slew_rate
+
+    @slew_rate.setter
+    def slew_rate(self, value):
+        """
+        Raises
+        ------
+        ValueError
+            if the slew rate is not positive nor None.
+        """
+        if value is not None and not value > 0:
+            error_msg = 'Invalid slew rate: {}, must be positive or None'.format(value)
+            raise ValueError(error_msg)
+        self._slew_rate = value
+
+    def at_target(self):
+        """
+        Returns True if the output has reached the target.
+        """
+        return self.output == self.target
+
+    def jump(self, rate):
+        """
+        Sets both the output and the target, bypassing the limit.
+        """
+        self.output = rate
+        self.target = rate
+
+    def advance(self, dt):
+        """
+        Moves the output towards the target.
+
+        Parameters
+        ----------
+        dt : float
+            seconds elapsed since the last call
+
+        Returns
+        -------
+        output : float
+            the new output
+        """
+
+        if self.slew_rate is None:
+            self.output = self.target
+            return self.output
+
+        max_step = self.slew_rate * dt
+        error = self.target - self.output
+        if abs(error) <= max_step:
+            self.output = self.target
+        else:
+            self.output += max_step if error > 0 else -max_step
+
+        return self.output
+
+    def time_to_target(self):
+        """
+        Returns the seconds needed for the output to reach the target.
+        """
+        if self.slew_rate is None or self.output == self.target:
+            return 0.0
+        return abs(self.target - self.output) / self.slew_rate
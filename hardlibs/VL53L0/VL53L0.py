@@ -3,6 +3,9 @@ import VL53L0X
 import logging
 import time
 
+from libs.pins.pins import registry
+from libs.pins.pins import OUT
+
 # ---------------------------------- logging --------------------------------- #
 
 logger = logging.getLogger('VL53L0')
@@ -73,11 +76,8 @@ class VL53L0:
 
         logger.info('Starting hardware setup')
 
-        GPIO.setwarnings(False)
-        GPIO.setmode(GPIO.BCM) # init the library
-
         # setup the GPIO to shut down the board
-        GPIO.setup(self.XSHUT, GPIO.OUT)
+        registry.claim(self.XSHUT, OUT, self)
 
         # turn off the board
         GPIO.output(self.XSHUT, GPIO.LOW)
@@ -159,10 +159,8 @@ class VL53L0:
         # stop I2C communication
         self.tof.close()
 
-        # calling GPIO.cleanup() will affect all the pins,
-        # even the ones used in other modules
-        # GPIO.cleanup()
-        GPIO.setup(self.XSHUT, GPIO.IN)
+        # the registry sets the pin back to input
+        registry.release(self.XSHUT, self)
 
 
     # The __exit__ method is called when the block of code is exited, 
@@ -1,5 +1,9 @@
 import RPi.GPIO as GPIO
 
+from ..pins.pins import registry
+from ..pins.pins import OUT
+
+
 class LED:
     """
     Simple class to control the behaviour of a LED.
@@ -22,9 +26,7 @@ class LED:
         Sets up the LED.
         """
 
-        # GPIO.setwarnings(True)
-        GPIO.setmode(GPIO.BCM)  # init the library
-        GPIO.setup(self.pin, GPIO.OUT)  # set the pin as output
+        registry.claim(self.pin, OUT, self)  # set the pin as output
 
     def state(self):
         """
@@ -78,7 +80,7 @@ class LED:
         an error or Keyboard Interrupt will stay set exactly as they were,
         even after the program exits.
         """
-        GPIO.setup(self.pin, GPIO.IN)
+        registry.release(self.pin, self)
 
     def __del__(self):
         self.close()
@@ -0,0 +1,342 @@
+import math
+import re
+import time
+
+
+# Relay feedback autotuning (Astrom - Hagglund): the controller is replaced
+# by a relay that pushes the rate up when the speed is below the setpoint
+# and down when it is above. The loop settles into a limit cycle whose
+# period is the ultimate period Pu of the plant and whose amplitude a
+# gives the ultimate gain Ku = 4 d / (pi a), d being the relay amplitude;
+# the PID gains follow from Ku and Pu.
+
+
+# ------------------------------- tuning rules ------------------------------- #
+
+# rule -> (KP / Ku, Ti / Pu, Td / Pu)
+RULES = {
+    'ziegler-nichols': (0.6, 0.5, 0.125),
+    'tyreus-luyben': (1 / 2.2, 2.2, 1 / 6.3),  # less overshoot, more robust
+    'no-overshoot': (0.2, 0.5, 1 / 3),
+}
+
+
+def gains(ultimate_gain, ultimate_period, rule='tyreus-luyben'):
+    """
+    Converts the ultimate gain and period into PID gains.
+
+    Returns
+    -------
+        tuple containing:
+            KP
+            KI
+            KD
+    """
+
+    if rule not in RULES:
+        error_msg = 'Unknown tuning rule {}, use one of {}'.format(rule, ', '.join(RULES))
+        raise ValueError(error_msg)
+
+    kp_ratio, ti_ratio, td_ratio = RULES[rule]
+
+    KP = kp_ratio * ultimate_gain
+    KI = KP / (ti_ratio * ultimate_period)
+    KD = KP * td_ratio * ultimate_period
+
+    return KP, KI, KD
+
+
+# ----------------------------- relay experiment ----------------------------- #
+
+def relay_experiment(write, measure, bias, amplitude,
+                     period=0.01, hysteresis=0.0, settle=1.0,
+                     cycles=8, timeout=20.0,
+                     sleep=time.sleep, clock=time.monotonic):
+    """
+    Runs the relay experiment around an operating point.
+
+    The rate is held at bias for settle seconds and the speed reached
+    becomes the setpoint; then the rate switches between bias + amplitude
+    and bias - amplitude every time the speed crosses the setpoint (with
+    the given hysteresis), until cycles periods of the limit cycle have
+    been recorded.
+
+    Parameters
+    ----------
+    write : callable
+        sets the rate of the motor, rate -> None
+    measure : callable
+        returns the speed of the motor, called once per period
+    bias : float
+        rate at the operating point, above the deadband of the motor
+    amplitude : float
+        relay amplitude d, in rate units
+    period : float
+        control period in seconds
+    hysteresis : float
+        speed band around the setpoint in which the relay does not switch
+    settle : float
+        seconds spent at the operating point before starting the relay
+    cycles : int
+        limit cycle periods to record, at least 2, the first two are
+        discarded as transient
+    timeout : float
+        seconds after which the experiment is aborted
+    sleep, clock : callable
+        time.sleep() and time.monotonic() or their simulated equivalents
+
+    Returns
+    -------
+        tuple containing:
+            ultimate gain Ku
+            ultimate period Pu in seconds
+            setpoint (speed at the operating point)
+
+    Raises
+    ------
+    ValueError
+        if cycles is less than 2.
+    RuntimeError
+        if the loop does not oscillate within timeout.
+    """
+
+    if cycles < 2:
+        error_msg = 'At least 2 cycles are needed to measure the period, got {}'.format(cycles)
+        raise ValueError(error_msg)
+
+    # ------------------------------ operating point ----------------------------- #
+
+    write(bias)
+    t_end = clock() + settle
+    speeds = []
+    while clock() < t_end:
+        sleep(period)
+        speeds.append(measure())
+
+    # average the last quarter, the speed has settled
+    tail = speeds[-max(1, len(speeds) // 4):]
+    setpoint = sum(tail) / len(tail)
+
+    # ----------------------------------- relay ---------------------------------- #
+
+    high = bias + amplitude
+    low = bias - amplitude
+
+    output = high
+    write(output)
+
+    switches = []  # times of the switches from low to high
+    peaks = []  # (max, min) of the speed over each cycle
+    cycle_max, cycle_min = -math.inf, math.inf
+
+    t_end = clock() + timeout
+    try:
+        while len(switches) < cycles + 2:
+
+            if clock() > t_end:
+                error_msg = 'The loop did not oscillate: {} cycles in {} s'.format(
+                    max(0, len(switches) - 1), timeout)
+                raise RuntimeError(error_msg)
+
+            sleep(period)
+            speed = measure()
+            cycle_max = max(cycle_max, speed)
+            cycle_min = min(cycle_min, speed)
+
+            if output == high and speed > setpoint + hysteresis:
+                output = low
+                write(output)
+            elif output == low and speed < setpoint - hysteresis:
+                output = high
+                write(output)
+                switches.append(clock())
+                peaks.append((cycle_max, cycle_min))
+                cycle_max, cycle_min = -math.inf, math.inf
+    finally:
+        write(bias)
+
+    # drop the first cycles, still transient
+    switches = switches[2:]
+    peaks = peaks[3:]
+
+    ultimate_period = (switches[-1] - switches[0]) / (len(switches) - 1)
+
+    oscillation = sum(high - low for high, low in peaks) / len(peaks) / 2
+    oscillation = math.sqrt(max(oscillation ** 2 - hysteresis ** 2, 1e-12))
+    ultimate_gain = 4 * amplitude / (math.pi * oscillation)
+
+    return ultimate_gain, ultimate_period, setpoint
+
+
+def autotune(driver, channel, encoder, estimator, bias=0.5, amplitude=0.2,
+             rule='tyreus-luyben', **kwargs):
+    """
+    Runs the relay experiment on a wheel through a DRV8833 and an Encoder.
+
+    Parameters
+    ----------
+    driver : DRV8833
+        driver the motor is connected to
+    channel : int/str
+        0/'a'/'A' for motor A, 1/'b'/'B' for motor B
+    encoder : Encoder
+        encoder mounted on the motor
+    estimator : SpeedEstimator
+        estimator turning the encoder readings into a linear speed
+    kwargs
+        passed to relay_experiment()
+
+    Returns
+    -------
+        tuple containing:
+            KP
+            KI
+            KD
+            ultimate gain Ku
+            ultimate period Pu in seconds
+    """
+
+    def measure():
+        estimator.update_from(encoder)
+        return estimator.linear_speed
+
+    try:
+        ultimate_gain, ultimate_period, _ = relay_experiment(
+            lambda rate: driver.write(channel, rate), measure, bias, amplitude, **kwargs)
+    finally:
+        driver.stop(channel)
+
+    return gains(ultimate_gain, ultimate_period, rule) + (ultimate_gain, ultimate_period)
+
+
+# ------------------------------- configuration ------------------------------ #
+
+def write_gains(path, KP, KI, KD, section='PID'):
+    """
+    Writes the gains in the given section of an ini file. The file is
+    edited line by line, so that the comments and the layout are kept
+    (configparser.write() would drop them).
+    """
+
+    with open(path) as f:
+        lines = f.readlines()
+
+    values = {'KP': KP, 'KI': KI, 'KD': KD}
+    key_line = re.compile(r'^(\s*)(KP|KI|KD)(\s*[=:]\s*)([^;#\n]*?)(\s*([;#].*)?)$', re.IGNORECASE)
+
+    current = None
+    written = set()
+    for i, line in enumerate(lines):
+
+        header = re.match(r'^\s*\[([^\]]+)\]', line)
+        if header:
+            current = header.group(1).strip()
+            continue
+
+        if current != section:
+            continue
+
+        match = key_line.match(line.rstrip('\n'))
+        if match:
+            key = match.group(2).upper()
+            lines[i] = '{}{}{}{:.6g}{}\n'.format(
+                match.group(1), match.group(2), match.group(3), values[key], match.group(5))
+            written.add(key)
+
+    missing = [key for key in values if key not in written]
+    if missing:
+        error_msg = 'Keys {} not found in section [{}] of {}'.format(', '.join(missing), section, path)
+        raise KeyError(error_msg)
+
+    with open(path, 'w') as f:
+        f.writelines(lines)
+
+
+# ----------------------------------- main ----------------------------------- #
+
+if __name__ == '__main__':
+
+    # Tunes the wheel speed loop. Run from the root of the repository:
+    #
+    #   python -m libs.PID.autotune simulated
+    #       against a simulated motor, prints the gains and the step
+    #       response they give
+    #
+    #   python -m libs.PID.autotune
+    #       on the robot (lift it first), tunes the left wheel and writes
+    #       the gains to the [PID] section of config.ini
+
+    import sys
+
+    from config.definitions import CONFIG_PATH
+
+    from .pid import PID, Mode
+    from .test.step_response import overshoot, settling_time
+
+    PERIOD = 0.01  # control period, s
+
+    if 'simulated' in sys.argv:
+
+        from ..motor.simulation import SimulatedMotor
+
+        motor = SimulatedMotor(noise=0.0005, seed=0)
+
+        ultimate_gain, ultimate_period, setpoint = relay_experiment(
+            lambda rate: motor.write(0, rate), motor.measure, bias=0.5, amplitude=0.2,
+            period=PERIOD, hysteresis=0.001, sleep=motor.sleep, clock=motor.monotonic)
+
+        print('Ku {:.2f}, Pu {:.3f} s around {:.3f} m/s\n'.format(
+            ultimate_gain, ultimate_period, setpoint))
+
+        # step response of the tuned loop, from standstill to 0.08 m/s
+        target = 0.08
+        print('{:<18}{:>8}{:>8}{:>8}{:>16}{:>16}'.format(
+            'rule', 'KP', 'KI', 'KD', 'settling [s]', 'overshoot [%]'))
+        for rule in RULES:
+            KP, KI, KD = gains(ultimate_gain, ultimate_period, rule)
+            pid = PID(KP, KI, KD, mode=Mode.DISCRETE, output_limits=(-1.0, 1.0),
+                      derivative_filter=PERIOD)
+
+            motor = SimulatedMotor(noise=0.0005, seed=0)
+            speeds = []
+            for _ in range(int(3.0 / PERIOD)):
+                motor.write(0, pid.update(motor.measure(), target, dt=PERIOD))
+                motor.sleep(PERIOD)
+                speeds.append(motor.speed)
+
+            print('{:<18}{:>8.2f}{:>8.2f}{:>8.3f}{:>16.2f}{:>16.1f}'.format(
+                rule, KP, KI, KD, settling_time(speeds, target, PERIOD), overshoot(speeds, target)))
+
+    else:
+
+        import configparser
+
+        from hardlibs.DRV8833.DRV8833 import DRV8833
+        from libs.encoder.encoder import Encoder
+        from libs.encoder.estimator import AdaptiveEstimator
+
+        config = configparser.ConfigParser()
+        config.read(CONFIG_PATH)
+
+        TICKS_PER_REVOLUTION = 7 * int(config['MOTOR']['REDUCTION_RATIO'])  # 1x decoding
+        WHEEL_RADIUS = float(config['WHEELS']['DIAMETER']) / 2 / 1000  # m
+
+        with DRV8833(
+            IN_1_A=int(config['PINS']['IN_1_LEFT']), IN_2_A=int(config['PINS']['IN_2_LEFT']),
+            IN_1_B=None, IN_2_B=None,
+            ENABLE=int(config['PINS']['ENABLE'])
+        ) as motor_driver, Encoder(
+            PIN_CLK=int(config['PINS']['LEFT_ENC_CLK']),
+            PIN_DT=int(config['PINS']['LEFT_ENC_DT']),
+            min_pulse_width=float(config['ENCODER']['MIN_PULSE_WIDTH']) * 1e-6
+        ) as encoder:
+
+            estimator = AdaptiveEstimator(TICKS_PER_REVOLUTION, WHEEL_RADIUS)
+            KP, KI, KD, ultimate_gain, ultimate_period = autotune(
+                motor_driver, 'A', encoder, estimator, period=PERIOD, hysteresis=0.002)
+
+        print('Ku {:.2f}, Pu {:.3f} s -> KP {:.4g}, KI {:.4g}, KD {:.4g}'.format(
+            ultimate_gain, ultimate_period, KP, KI, KD))
+
+        write_gains(CONFIG_PATH, KP, KI, KD)
+        print('Gains written to {}'.format(CONFIG_PATH))
@@ -1,6 +1,43 @@
+import enum
+import time
+
+
+# --------------------------- controller modes ------------------------------- #
+
+class Mode(enum.Enum):
+    LEGACY = 0  # original update law, kept for compatibility
+    DISCRETE = 1  # time-aware controller, see PID.update()
+
+
+class AntiWindup(enum.Enum):
+    NONE = 0  # the integral grows without bounds
+    CLAMP = 1  # stop integrating while the output saturates
+    BACK_CALCULATION = 2  # bleed the integral by the saturation excess
+
+
+# ------------------------------- controller --------------------------------- #
+
 class PID:
+    """
+    PID controller.
+
+    In LEGACY mode update() follows the original law, which ignores the
+    time step. In DISCRETE mode update() returns the control output
+
+        u = KP * e + KI * integral(e dt) - KD * d(measurement)/dt
+
+    where the derivative is taken on the measurement (a step of the
+    target does not kick the output) and low-pass filtered with time
+    constant derivative_filter; the output is saturated to output_limits
+    and the integral is kept from winding up while it saturates.
+    """
 
-    def __init__(self, KP, KI, KD):
+    def __init__(self, KP, KI, KD,
+                 mode=Mode.LEGACY,
+                 output_limits=(None, None),  # (min, max), None for no bound
+                 derivative_filter=0.0,  # time constant in seconds, 0 for no filter
+                 anti_windup=AntiWindup.CLAMP,
+                 tracking_gain=None):  # back-calculation gain, KI / KP if None
 
         #self.KP = 0.08
         #self.KI = 0.01
@@ -10,9 +47,37 @@ class PID:
         self.KI = KI
         self.KD = KD
 
+        self.mode = mode
+        self.output_limits = output_limits
+        self.derivative_filter = derivative_filter
+        self.anti_windup = anti_windup
+        self.tracking_gain = tracking_gain
+
         self.prev_error = 0
         self.sum_error = 0
 
+        # DISCRETE mode state
+        self.integral = 0.0  # integral term, already multiplied by KI
+        self.derivative = 0.0  # filtered derivative of the measurement
+        self.output = 0.0
+        self._prev_measurement = None
+        self._last_time = None
+
+    @classmethod
+    def from_config(cls, config, section='PID', **kwargs):
+        """
+        Builds the controller with the gains in the [PID] section of a
+        configparser.ConfigParser loaded from config.ini, where
+        python -m libs.PID.autotune writes them. kwargs are passed to the
+        constructor (mode, output_limits, ...).
+        """
+        return cls(
+            KP=float(config[section]['KP']),
+            KI=float(config[section]['KI']),
+            KD=float(config[section]['KD']),
+            **kwargs
+        )
+
     def set_proportional(self, value):
         self.KP = value
 
@@ -35,7 +100,35 @@ class PID:
         self.prev_error = 0
         self.sum_error = 0
 
-    def update(self, current_speed, target_speed):
+        self.integral = 0.0
+        self.derivative = 0.0
+        self.output = 0.0
+        self._prev_measurement = None
+        self._last_time = None
+
+    def update(self, current_speed, target_speed, dt=None):
+        """
+        Updates the controller with a new measurement.
+
+        Parameters
+        ----------
+        current_speed : float
+            measured value
+        target_speed : float
+            target value
+        dt : float
+            seconds since the previous update (DISCRETE mode only), taken
+            from time.monotonic() if None
+
+        Returns
+        -------
+        value : float
+            current_speed in LEGACY mode, the control output in DISCRETE
+            mode
+        """
+
+        if self.mode == Mode.DISCRETE:
+            return self._update_discrete(current_speed, target_speed, dt)
 
         error = target_speed - current_speed
 
@@ -46,3 +139,53 @@ class PID:
         self.sum_error += error
 
         return current_speed
+
+    def _saturate(self, value):
+        low, high = self.output_limits
+        if high is not None and value > high:
+            return high
+        if low is not None and value < low:
+            return low
+        return value
+
+    def _update_discrete(self, measurement, target, dt):
+
+        if dt is None:
+            now = time.monotonic()
+            dt = now - self._last_time if self._last_time is not None else 0.0
+            self._last_time = now
+
+        error = target - measurement
+
+        # derivative on measurement, skipped on the first update and
+        # when no time has elapsed
+        if self._prev_measurement is not None and dt > 0:
+            raw = -(measurement - self._prev_measurement) / dt
+            alpha = dt / (self.derivative_filter + dt)
+            self.derivative += alpha * (raw - self.derivative)
+        self._prev_measurement = measurement
+
+        proportional = self.KP * error
+        derivative = self.KD * self.derivative
+
+        integral = self.integral + self.KI * error * dt
+        unsaturated = proportional + integral + derivative
+        output = self._saturate(unsaturated)
+
+        if self.anti_windup == AntiWindup.CLAMP:
+            # integrate only if the output is not saturated or if the
+            # error drives it back from saturation
+            if output == unsaturated or (unsaturated - output) * error < 0:
+                self.integral = integral
+            else:
+                output = self._saturate(proportional + self.integral + derivative)
+        elif self.anti_windup == AntiWindup.BACK_CALCULATION:
+            gain = self.tracking_gain
+            if gain is None:
+                gain = self.KI / self.KP if self.KP else 1.0
+            self.integral = integral + gain * (output - unsaturated) * dt
+        else:
+            self.integral = integral
+
+        self.output = output
+        return output
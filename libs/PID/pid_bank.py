@@ -0,0 +1,243 @@
+import numpy as np
+
+from .pid import AntiWindup
+
+
+class PIDBank:
+    """
+    N independent PID controllers updated together. Gains and state are
+    stored in NumPy arrays, one element per channel, so that a single
+    update() call runs every controller without a Python loop: use it for
+    the wheels of a robot or for many simulated robots at once.
+
+    Each channel follows the DISCRETE mode law of PID.update():
+
+        u = KP * e + KI * integral(e dt) - KD * d(measurement)/dt
+
+    with the derivative taken on the measurement and low-pass filtered
+    with time constant derivative_filter, the output saturated to
+    output_limits and the same anti-windup schemes.
+
+    ...
+
+    Attributes
+    ----------
+    channels : int
+        number of controllers
+    KP, KI, KD : numpy.ndarray
+        gains of each channel
+    integral, derivative, output : numpy.ndarray
+        state of each channel, as the attributes of PID
+
+    Methods
+    -------
+    update(current, target, dt)
+        updates every channel and returns their outputs.
+
+    set_gains(channel, KP=None, KI=None, KD=None)
+        changes the gains of some channels.
+
+    get_gains(channel)
+        returns the gains of some channels.
+
+    reset(channel=None)
+        clears the state of some channels, all of them if None.
+    """
+
+    def __init__(self, KP, KI, KD, channels=None,
+                 output_limits=(None, None),  # (min, max), None for no bound
+                 derivative_filter=0.0,  # time constant in seconds, 0 for no filter
+                 anti_windup=AntiWindup.CLAMP,
+                 tracking_gain=None):  # back-calculation gain, KI / KP if None
+        """
+        Parameters
+        ----------
+        KP, KI, KD : float/array_like
+            gains, either the same for every channel or one per channel
+        channels : int
+            number of controllers, taken from the gains if None
+        output_limits, derivative_filter, anti_windup, tracking_gain
+            same as PID, shared by every channel
+        """
+
+        if channels is None:
+            channels = max(np.size(KP), np.size(KI), np.size(KD))
+
+        self.channels = channels
+
+        # np.array(np.broadcast_to(...)) copies, so that the gains of a
+        # channel can be changed without touching the caller's arrays
+        self.KP = np.array(np.broadcast_to(KP, channels), dtype=float)
+        self.KI = np.array(np.broadcast_to(KI, channels), dtype=float)
+        self.KD = np.array(np.broadcast_to(KD, channels), dtype=float)
+
+        low, high = output_limits
+        self.output_limits = output_limits
+        self._low = -np.inf if low is None else low
+        self._high = np.inf if high is None else high
+        self.derivative_filter = derivative_filter
+        self.anti_windup = anti_windup
+        self.tracking_gain = tracking_gain
+
+        self.integral = np.zeros(channels)  # integral term, already multiplied by KI
+        self.derivative = np.zeros(channels)  # filtered derivative of the measurement
+        self.output = np.zeros(channels)
+        self._prev_measurement = np.zeros(channels)
+        self._started = np.zeros(channels, dtype=bool)  # a measurement was seen
+
+    def set_gains(self, channel, KP=None, KI=None, KD=None):
+        """
+        Changes the gains of some channels, the gains left to None are
+        not changed.
+
+        Parameters
+        ----------
+        channel : int/slice/array_like
+            channels to change, anything that indexes a NumPy array
+        """
+
+        if KP is not None:
+            self.KP[channel] = KP
+        if KI is not None:
+            self.KI[channel] = KI
+        if KD is not None:
+            self.KD[channel] = KD
+
+    def get_gains(self, channel):
+        """
+        Returns the gains of some channels.
+
+        Returns
+        -------
+            tuple containing:
+                KP of the channels
+                KI of the channels
+                KD of the channels
+        """
+        return self.KP[channel], self.KI[channel], self.KD[channel]
+
+    def reset(self, channel=None):
+        """
+        Clears the state of some channels, all of them if None.
+        """
+
+        if channel is None:
+            channel = slice(None)
+
+        self.integral[channel] = 0.0
+        self.derivative[channel] = 0.0
+        self.output[channel] = 0.0
+        self._prev_measurement[channel] = 0.0
+        self._started[channel] = False
+
+    def update(self, current, target, dt, out=None):
+        """
+        Updates every channel.
+
+        Parameters
+        ----------
+        current : array_like
+            measured value of each channel
+        target : float/array_like
+            target of each channel, or a single target for all of them
+        dt : float/array_like
+            seconds since the previous update, for all the channels or
+            for each of them
+        out : numpy.ndarray
+            array the outputs are written to, a new one if None
+
+        Returns
+        -------
+        output : numpy.ndarray
+            control output of each channel
+        """
+
+        current = np.asarray(current, dtype=float)
+        dt = np.asarray(dt, dtype=float)
+        error = np.subtract(target, current)
+
+        # derivative on measurement, skipped on the first update of a
+        # channel and when no time has elapsed
+        elapsed = self._started & (dt > 0)
+        safe_dt = np.where(dt > 0, dt, 1.0)
+        raw = -(current - self._prev_measurement) / safe_dt
+        alpha = safe_dt / (self.derivative_filter + safe_dt)
+        self.derivative += np.where(elapsed, alpha * (raw - self.derivative), 0.0)
+        self._prev_measurement[:] = current
+        self._started[:] = True
+
+        proportional = self.KP * error
+        derivative = self.KD * self.derivative
+
+        integral = self.integral + self.KI * error * dt
+        unsaturated = proportional + integral + derivative
+        output = np.clip(unsaturated, self._low, self._high)
+
+        if self.anti_windup == AntiWindup.CLAMP:
+            # integrate only where the output is not saturated or where
+            # the error drives it back from saturation
+            accept = (output == unsaturated) | ((unsaturated - output) * error < 0)
+            held = np.clip(proportional + self.integral + derivative, self._low, self._high)
+            self.integral = np.where(accept, integral, self.integral)
+            output = np.where(accept, output, held)
+        elif self.anti_windup == AntiWindup.BACK_CALCULATION:
+            gain = self.tracking_gain
+            if gain is None:
+                safe_KP = np.where(self.KP != 0, self.KP, 1.0)
+                gain = np.where(self.KP != 0, self.KI / safe_KP, 1.0)
+            self.integral = integral + gain * (output - unsaturated) * dt
+        else:
+            self.integral = integral
+
+        self.output = output
+
+        if out is None:
+            return output.copy()
+        out[:] = output
+        return out
+
+
+# ----------------------------------- main ----------------------------------- #
+
+if __name__ == '__main__':
+
+    # Compares the cost of updating N scalar PIDs (DISCRETE mode) one
+    # after the other with a single PIDBank update, and checks that they
+    # compute the same outputs. Run from the root of the repository with
+    # python -m libs.PID.pid_bank
+
+    import time
+
+    from .pid import PID, Mode
+
+    ITERATIONS = 2000
+    DT = 0.01  # s
+    SETTINGS = {'output_limits': (-1.0, 1.0), 'derivative_filter': DT}
+
+    print('{:>8}{:>16}{:>16}{:>10}{:>18}'.format(
+        'channels', 'PID [us]', 'PIDBank [us]', 'speedup', 'max difference'))
+
+    for channels in (2, 16, 128, 1024):
+
+        rng = np.random.default_rng(0)
+        current = rng.uniform(0.0, 1.0, (ITERATIONS, channels))
+        target = rng.uniform(0.0, 1.0, channels)
+
+        controllers = [PID(15.0, 150.0, 0.1, mode=Mode.DISCRETE, **SETTINGS) for _ in range(channels)]
+        rows = current.tolist()
+        targets = target.tolist()
+        start = time.perf_counter()
+        for row in rows:
+            outputs = [pid.update(c, t, dt=DT) for pid, c, t in zip(controllers, row, targets)]
+        scalar = (time.perf_counter() - start) / ITERATIONS
+
+        bank = PIDBank(15.0, 150.0, 0.1, channels=channels, **SETTINGS)
+        out = np.zeros(channels)
+        start = time.perf_counter()
+        for row in current:
+            bank.update(row, target, DT, out=out)
+        vectorized = (time.perf_counter() - start) / ITERATIONS
+
+        difference = np.max(np.abs(out - np.array(outputs)))
+        print('{:>8}{:>16.2f}{:>16.2f}{:>9.1f}x{:>18.2e}'.format(
+            channels, scalar * 1e6, vectorized * 1e6, scalar / vectorized, difference))
@@ -0,0 +1,127 @@
+import random
+
+from ..pid import PID, Mode, AntiWindup
+
+
+# Step response of the DISCRETE mode PID against a simulated first order
+# plant (a DC motor: speed = GAIN * duty once settled, time constant TAU)
+# whose input saturates at +-1. Run from the root of the repository with
+# python -m libs.PID.test.step_response
+
+
+# -------------------------------- parameters -------------------------------- #
+
+GAIN = 0.15  # m/s at full duty
+TAU = 0.12  # s
+DT = 0.01  # control period, s
+DURATION = 3.0  # s
+TARGET = 0.12  # m/s, 80% of the top speed: the output saturates at first
+NOISE = 0.002  # standard deviation of the speed measurement, m/s
+
+KP, KI, KD = 15.0, 150.0, 0.1
+
+
+# ----------------------------------- plant ---------------------------------- #
+
+class FirstOrderPlant:
+    """
+    First order plant tau * dy/dt = gain * u - y, with u clipped to +-1.
+    """
+
+    def __init__(self, gain, tau):
+        self.gain = gain
+        self.tau = tau
+        self.y = 0.0
+
+    def step(self, u, dt):
+        u = max(-1.0, min(1.0, u))
+        self.y += (self.gain * u - self.y) * dt / self.tau
+        return self.y
+
+
+# --------------------------------- metrics ---------------------------------- #
+
+def simulate(pid, noise=0.0, seed=0):
+    """
+    Runs a step of the target from 0 to TARGET and returns the plant
+    output at each control period.
+    """
+
+    rng = random.Random(seed)
+    plant = FirstOrderPlant(GAIN, TAU)
+
+    output = []
+    for _ in range(int(DURATION / DT)):
+        measurement = plant.y + rng.gauss(0.0, noise) if noise > 0 else plant.y
+        u = pid.update(measurement, TARGET, dt=DT)
+        output.append(plant.step(u, DT))
+
+    return output
+
+
+def settling_time(output, target=TARGET, dt=DT, band=0.02):
+    """
+    Time after which the output, sampled every dt, stays within band
+    (relative) of the target.
+    """
+    for i in range(len(output) - 1, -1, -1):
+        if abs(output[i] - target) > band * target:
+            return (i + 1) * dt
+    return 0.0
+
+
+def overshoot(output, target=TARGET):
+    """
+    Peak above the target, in percent of the target.
+    """
+    return max(0.0, (max(output) - target) / target * 100)
+
+
+def roughness(pid, noise):
+    """
+    RMS change of the control output between two periods once settled,
+    i.e. how much measurement noise reaches the actuator.
+    """
+
+    rng = random.Random(1)
+    plant = FirstOrderPlant(GAIN, TAU)
+
+    outputs = []
+    for i in range(int(DURATION / DT)):
+        u = pid.update(plant.y + rng.gauss(0.0, noise), TARGET, dt=DT)
+        plant.step(u, DT)
+        if i * DT > DURATION / 2:
+            outputs.append(u)
+
+    changes = [b - a for a, b in zip(outputs, outputs[1:])]
+    return (sum(c * c for c in changes) / len(changes)) ** 0.5
+
+
+# ----------------------------------- test ----------------------------------- #
+
+if __name__ == '__main__':
+
+    controllers = {
+        'no anti-windup': lambda: PID(
+            KP, KI, KD, mode=Mode.DISCRETE, output_limits=(-1.0, 1.0),
+            anti_windup=AntiWindup.NONE),
+        'clamping': lambda: PID(
+            KP, KI, KD, mode=Mode.DISCRETE, output_limits=(-1.0, 1.0),
+            anti_windup=AntiWindup.CLAMP),
+        'back-calculation': lambda: PID(
+            KP, KI, KD, mode=Mode.DISCRETE, output_limits=(-1.0, 1.0),
+            anti_windup=AntiWindup.BACK_CALCULATION),
+        'clamping, D filter 20ms': lambda: PID(
+            KP, KI, KD, mode=Mode.DISCRETE, output_limits=(-1.0, 1.0),
+            anti_windup=AntiWindup.CLAMP, derivative_filter=0.02),
+    }
+
+    print('step 0 -> {} m/s, plant gain {} m/s, tau {} s, control period {} ms\n'.format(
+        TARGET, GAIN, TAU, DT * 1000))
+    print('{:<26}{:>14}{:>14}{:>22}'.format(
+        'controller', 'settling [s]', 'overshoot [%]', 'output noise (rms)'))
+
+    for name, factory in controllers.items():
+        output = simulate(factory())
+        print('{:<26}{:>14.2f}{:>14.1f}{:>22.4f}'.format(
+            name, settling_time(output), overshoot(output), roughness(factory(), NOISE)))
@@ -0,0 +1,380 @@
+import threading
+import time
+
+from ..pins.pins import registry
+from ..pins.pins import EXTERNAL
+from ..pins.pins import IN
+
+from .encoder import Mode
+
+# the backends are optional: each one checks that its library is
+# available only when it is instantiated
+
+try:
+    import RPi.GPIO as GPIO
+except ImportError:  # not running on a Raspberry Pi
+    GPIO = None
+
+try:
+    import gpiod
+    from gpiod.line import Direction as LineDirection
+    from gpiod.line import Edge
+    from gpiod.line import Value
+except ImportError:  # libgpiod python bindings (v2) not installed
+    gpiod = None
+
+
+# A backend reads the pins of an Encoder and feeds it the edges. The
+# interface is made of two methods:
+#
+#   setup(encoder)  configures the pins, tells the encoder their initial
+#                   level with encoder._set_levels(clk, dt) and starts
+#                   calling encoder._on_edge(clk, dt, timestamp) or
+#                   encoder._on_edges(edges) for every edge
+#   close()         stops delivering edges and frees the resources
+#
+# The timestamps are in seconds on the time.monotonic() clock.
+
+
+# --------------------------------- RPi.GPIO --------------------------------- #
+
+class RPiGPIOBackend:
+    """
+    Delivers the edges through RPi.GPIO callbacks: one Python call per
+    edge, timestamped in user space when the callback runs.
+    """
+
+    def __init__(self):
+
+        if GPIO is None:
+            raise ImportError('RPi.GPIO is not available, use another encoder backend')
+
+        self.PIN_CLK = None
+        self.PIN_DT = None
+        self._encoder = None
+
+    def setup(self, encoder):
+        """
+        Sets up the hardware by setting the pins as INPUT and registering
+        the callbacks.
+        """
+
+        self.PIN_CLK = encoder.PIN_CLK
+        self.PIN_DT = encoder.PIN_DT
+        self._encoder = encoder
+
+        registry.claim(self.PIN_CLK, IN, self)
+        try:
+            registry.claim(self.PIN_DT, IN, self)
+        except Exception:
+            registry.release(self.PIN_CLK, self)
+            raise
+
+        encoder._set_levels(GPIO.input(self.PIN_CLK), GPIO.input(self.PIN_DT))
+
+        if encoder.mode == Mode.QUADRATURE:
+            GPIO.add_event_detect(self.PIN_CLK, GPIO.BOTH, callback=self._callback_quadrature)
+            GPIO.add_event_detect(self.PIN_DT, GPIO.BOTH, callback=self._callback_quadrature)
+        else:
+            GPIO.add_event_detect(self.PIN_CLK, GPIO.FALLING, callback=self._callback_single)
+
+    def _callback_single(self, channel):
+        # the 1x decoding only looks at CLK, skip reading DT
+        timestamp = time.monotonic()
+        self._encoder._on_edge(GPIO.input(self.PIN_CLK), 0, timestamp)
+
+    def _callback_quadrature(self, channel):
+        timestamp = time.monotonic()
+        self._encoder._on_edge(GPIO.input(self.PIN_CLK), GPIO.input(self.PIN_DT), timestamp)
+
+    def close(self):
+        """
+        Frees the GPIO resources.
+        """
+
+        GPIO.remove_event_detect(self.PIN_CLK)
+        if self._encoder.mode == Mode.QUADRATURE:
+            GPIO.remove_event_detect(self.PIN_DT)
+        registry.release(self.PIN_CLK, self)
+        registry.release(self.PIN_DT, self)
+
+
+# ------------------------- GPIO character device ---------------------------- #
+
+class GpiodEventSource:
+    """
+    Reads line events from the Linux GPIO character device through the
+    libgpiod (v2) bindings. The kernel queues the events and timestamps
+    them in the interrupt handler on the monotonic clock, so they can be
+    read in bulk without losing timing accuracy.
+
+    Event sources return events as (offset, rising, timestamp_ns) tuples,
+    where rising is 1 for a rising edge and 0 for a falling one.
+    """
+
+    def __init__(self, chip, lines, consumer='cobalt-encoder'):
+        """
+        Parameters
+        ----------
+        chip : str
+            path of the GPIO character device, e.g. /dev/gpiochip0
+        lines : dict
+            line offset -> True to detect both edges, False to detect
+            the falling edges only
+        """
+
+        if gpiod is None:
+            raise ImportError('gpiod is not available, install the libgpiod python bindings')
+
+        self.offsets = tuple(lines)
+        config = {
+            offset: gpiod.LineSettings(
+                direction=LineDirection.INPUT,
+                edge_detection=Edge.BOTH if both else Edge.FALLING
+            )
+            for offset, both in lines.items()
+        }
+
+        self._request = gpiod.request_lines(chip, consumer=consumer, config=config)
+
+    def levels(self):
+        """
+        Returns the current level of the lines, offset -> 0/1.
+        """
+        values = self._request.get_values(self.offsets)
+        return {offset: int(value == Value.ACTIVE) for offset, value in zip(self.offsets, values)}
+
+    def wait(self, timeout):
+        """
+        Waits up to timeout seconds for events, returns True if there
+        are events to read.
+        """
+        return self._request.wait_edge_events(timeout)
+
+    def read(self, max_events):
+        """
+        Reads up to max_events queued events.
+        """
+        return [
+            (event.line_offset, int(event.event_type == event.Type.RISING_EDGE), event.timestamp_ns)
+            for event in self._request.read_edge_events(max_events)
+        ]
+
+    def close(self):
+        self._request.release()
+
+
+class FakeEventSource:
+    """
+    Event source that replays recorded batches of events, one batch per
+    call to read(), to run a GpiodBackend without the hardware.
+
+    ...
+
+    Attributes
+    ----------
+    drained : threading.Event
+        set once the last batch has been read
+    """
+
+    def __init__(self, batches, levels=None):
+        """
+        Parameters
+        ----------
+        batches : list
+            lists of (offset, rising, timestamp_ns) events
+        levels : dict
+            initial level of the lines, offset -> 0/1, lines not
+            listed start low
+        """
+
+        self._batches = list(batches)
+        self._levels = dict(levels) if levels is not None else {}
+        self._lock = threading.Lock()
+        self.drained = threading.Event()
+
+        if not self._batches:
+            self.drained.set()
+
+    def levels(self):
+        return self._levels
+
+    def push(self, batch):
+        """
+        Queues another batch of events.
+        """
+        with self._lock:
+            self._batches.append(batch)
+            self.drained.clear()
+
+    def wait(self, timeout):
+        with self._lock:
+            if self._batches:
+                return True
+        time.sleep(timeout)
+        return False
+
+    def read(self, max_events):
+        with self._lock:
+            batch = self._batches[0]
+            events, rest = batch[:max_events], batch[max_events:]
+            if rest:
+                self._batches[0] = rest
+            else:
+                self._batches.pop(0)
+                if not self._batches:
+                    self.drained.set()
+            return events
+
+    def close(self):
+        pass
+
+
+class GpiodBackend:
+    """
+    Reads the edges from the GPIO character device in bulk. A thread
+    sleeps in the kernel until events are queued and then hands up to
+    batch_size of them to the encoder in a single call, so the Python
+    overhead (and the time spent holding the GIL) is paid once per wakeup
+    instead of once per edge. The timestamps are the kernel ones.
+
+    ...
+
+    Attributes
+    ----------
+    wakeups : int
+        number of batches processed so far
+    events : int
+        number of events processed so far
+    """
+
+    def __init__(self, chip='/dev/gpiochip0', source=None,
+                 batch_size=64, timeout=0.1, threaded=True):
+        """
+        Parameters
+        ----------
+        chip : str
+            path of the GPIO character device; on the Raspberry Pi the
+            line offsets on gpiochip0 are the BCM pin numbers
+        source : object
+            event source, if None a GpiodEventSource is opened on chip
+        batch_size : int
+            maximum number of events processed per wakeup
+        timeout : float
+            seconds to wait for events before checking if the backend
+            has been closed
+        threaded : bool
+            if False no thread is started and events are processed only
+            when poll() is called
+        """
+
+        self.chip = chip
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.threaded = threaded
+
+        self.wakeups = 0
+        self.events = 0
+
+        self._source = source
+        self._lines = ()  # pins claimed for the source opened by setup()
+        self._encoder = None
+        self._clk = 0
+        self._dt = 0
+        self._running = False
+        self._thread = None
+
+    def setup(self, encoder):
+        """
+        Requests the lines, reads their initial level and starts the
+        reading thread.
+        """
+
+        self.PIN_CLK = encoder.PIN_CLK
+        self.PIN_DT = encoder.PIN_DT
+        self._encoder = encoder
+
+        if self._source is None:
+
+            quadrature = encoder.mode == Mode.QUADRATURE
+            lines = {self.PIN_CLK: quadrature}
+            if quadrature:
+                lines[self.PIN_DT] = True
+
+            # the lines are requested from the kernel, not through RPi.GPIO;
+            # if a request fails the pins claimed so far are given back
+            claimed = []
+            try:
+                for pin in lines:
+                    registry.claim(pin, EXTERNAL, self)
+                    claimed.append(pin)
+                self._source = GpiodEventSource(self.chip, lines)
+            except Exception:
+                for pin in claimed:
+                    registry.release(pin, self)
+                raise
+            self._lines = tuple(lines)
+
+        levels = self._source.levels()
+        self._clk = levels.get(self.PIN_CLK, 0)
+        self._dt = levels.get(self.PIN_DT, 0)
+        encoder._set_levels(self._clk, self._dt)
+
+        if self.threaded:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while self._running:
+            self.poll(self.timeout)
+
+    def poll(self, timeout=0.0):
+        """
+        Waits up to timeout seconds for events and processes one batch.
+
+        Returns
+        -------
+        events : int
+            number of events processed
+        """
+
+        if not self._source.wait(timeout):
+            return 0
+
+        events = self._source.read(self.batch_size)
+
+        clk_pin = self.PIN_CLK
+        clk, dt = self._clk, self._dt
+        edges = []
+        for offset, rising, timestamp_ns in events:
+            if offset == clk_pin:
+                clk = rising
+            else:
+                dt = rising
+            edges.append((clk, dt, timestamp_ns * 1e-9))
+        self._clk, self._dt = clk, dt
+
+        self._encoder._on_edges(edges)
+
+        self.wakeups += 1
+        self.events += len(events)
+
+        return len(events)
+
+    def close(self):
+        """
+        Stops the reading thread and releases the lines.
+        """
+
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self._source is not None:
+            self._source.close()
+
+        for pin in self._lines:
+            registry.release(pin, self)
+        self._lines = ()
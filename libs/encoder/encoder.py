@@ -1,5 +1,8 @@
-import RPi.GPIO as GPIO
+from array import array
+import threading
 import enum
+import math
+import time
 
 
 class Direction(enum.Enum):
@@ -8,64 +11,378 @@ class Direction(enum.Enum):
     COUNTERCLOCKWISE = 2
 
 
+class Mode(enum.Enum):
+    SINGLE = 0  # 1x, falling edges on CLK only
+    QUADRATURE = 1  # 4x, both edges on both CLK and DT
+
+
+# quadrature state transition table: the state of the encoder is
+# (CLK << 1) | DT and the table is indexed by (previous << 2) | current.
+# Each entry is the step (+1 clockwise, -1 counterclockwise) taken by
+# that transition; transitions that leave the state unchanged or that
+# change both pins at once (a missed edge) do not move the count
+_QUADRATURE_TABLE = (
+    0, -1, 1, 0,
+    1, 0, 0, -1,
+    -1, 0, 0, 1,
+    0, 1, -1, 0
+)
+
+# direction associated with each step, indexed by step + 1
+_STEP_DIRECTION = (Direction.COUNTERCLOCKWISE, Direction.STEADY, Direction.CLOCKWISE)
+
+
 class Encoder:
+    """
+    Counts the ticks of an incremental rotary encoder.
 
-    def __init__(self, PIN_CLK, PIN_DT):
+    The pins are read by a backend (see backends.py) that calls _on_edge()
+    or _on_edges() with the level of both pins after every edge; the
+    Encoder only decodes the edges and keeps the count. The default
+    backend uses RPi.GPIO callbacks.
+    """
+
+    def __init__(self, PIN_CLK, PIN_DT, mode=Mode.SINGLE, buffer_size=1024,
+                 backend=None, min_pulse_width=0.0):
 
         self.PIN_CLK = PIN_CLK  # clock
         self.PIN_DT = PIN_DT  # data
 
+        # SINGLE counts one tick per CLK period, QUADRATURE counts
+        # four (one for each edge on either pin)
+        self.mode = mode
+
         self._count = 0
         self._direction = Direction.STEADY
+        self._taken = 0  # count at the last call to take_delta()
+
+        # the backends deliver the edges on their own thread: the lock makes
+        # the count, the direction and the edge buffer change together
+        # so that readers never see a half-applied edge
+        self._lock = threading.Lock()
 
         self._current_clk = 0  # current clock value
         self._last_clk = 0  # last clock value
+        self._state = 0  # last (CLK << 1) | DT value, quadrature mode only
+
+        # ring buffer holding the monotonic timestamp of the last
+        # buffer_size edges; it is allocated once here so that the
+        # callback never allocates anything
+        self._buffer_size = buffer_size
+        self._edge_times = array('d', [0.0]) * buffer_size
+        self._edges = 0  # total number of edges written so far
+
+        # glitch filter: an edge that comes less than min_pulse_width
+        # seconds after the previous edge on the same pin is rejected.
+        # Per pin (0 = CLK, 1 = DT) we keep the time of the last two
+        # accepted edges, the step the last one produced and its slot
+        # in the ring buffer, so that a glitch can be taken back
+        self.min_pulse_width = min_pulse_width
+        self._rejected = 0
+        self._pin_edge_time = [-math.inf, -math.inf]
+        self._pin_previous_edge_time = [-math.inf, -math.inf]
+        self._pin_step = [0, 0]
+        self._pin_edge_index = [-1, -1]
+
+        if self.mode == Mode.QUADRATURE:
+            self._decode_edge = self._decode_quadrature
+        else:
+            self._decode_edge = self._decode_single
+
+        if min_pulse_width > 0:
+            self._decode = self._decode_filtered
+        else:
+            self._decode = self._decode_edge
+
+        self._closed = True  # nothing to free until the backend exists
+        if backend is None:
+            from .backends import RPiGPIOBackend
+            backend = RPiGPIOBackend()
+        self.backend = backend
+        self._closed = False
 
         self._setup()
 
-    
     def _setup(self):
         """
-        Sets up the hardware by setting the pins as INPUT.
+        Sets up the hardware through the backend, that starts delivering
+        the edges to the encoder.
         """
+        self.backend.setup(self)
 
-        GPIO.setwarnings(False)
-        GPIO.setmode(GPIO.BCM)  # init the library
+    def _set_levels(self, clk, dt):
+        """
+        Sets the initial level of the pins, called by the backend before
+        delivering the first edge.
+        """
+        with self._lock:
+            self._last_clk = clk
+            self._state = (clk << 1) | dt
 
-        GPIO.setup(self.PIN_CLK, GPIO.IN)
-        GPIO.setup(self.PIN_DT, GPIO.IN)
+    def _on_edge(self, clk, dt, timestamp):
+        """
+        Registers an edge given the level of the CLK and DT pins right
+        after it and the time.monotonic() value at which it happened.
+        """
+        with self._lock:
+            self._decode(clk, dt, timestamp)
 
-        GPIO.add_event_detect(self.PIN_CLK, GPIO.FALLING, callback=self._update)
-        #GPIO.add_event_detect(self.PIN_DT, GPIO.FALLING, callback=self._update)
+    def _on_edges(self, edges):
+        """
+        Registers a batch of (clk, dt, timestamp) edges at once, taking
+        the lock a single time.
+        """
+        decode = self._decode
+        with self._lock:
+            for clk, dt, timestamp in edges:
+                decode(clk, dt, timestamp)
 
-    def _update(self):
+    def _decode_single(self, clk, dt, timestamp):
         """
         Updates the encoder tick count every time an event is registered
-        on the CLK pin.
+        on the CLK pin. Must be called holding the lock.
+
+        Returns
+        -------
+        step : int
+            +1 for a clockwise tick, -1 for a counterclockwise one
         """
 
-        self._current_clk = GPIO.input(self.PIN_CLK)
+        self._record_edge(timestamp)
+        self._current_clk = clk
 
         if (
                 self._current_clk != self._last_clk and
-                self._current_clk == GPIO.HIGH
+                self._current_clk == 1
         ):
 
-            self._count -= 1
+            step = -1
             self._direction = Direction.COUNTERCLOCKWISE
 
         else:
 
-            self._count += 1
+            step = 1
             self._direction = Direction.CLOCKWISE
-        
+
+        self._count += step
         self._last_clk = self._current_clk
 
+        return step
+
+    def _decode_quadrature(self, clk, dt, timestamp):
+        """
+        Updates the encoder tick count every time an event is registered
+        on either the CLK or the DT pin, decoding the new state of the
+        pins with the quadrature transition table. Must be called holding
+        the lock.
+
+        Returns
+        -------
+        step : int
+            +1 for a clockwise tick, -1 for a counterclockwise one, 0 if
+            the transition is not valid
+        """
+
+        state = (clk << 1) | dt
+        step = _QUADRATURE_TABLE[(self._state << 2) | state]
+        self._state = state
+
+        if step:
+            self._record_edge(timestamp)
+            self._count += step
+            self._direction = _STEP_DIRECTION[step + 1]
+
+        return step
+
+    def _decode_filtered(self, clk, dt, timestamp):
+        """
+        Runs the glitch filter before decoding an edge. Must be called
+        holding the lock.
+
+        In quadrature mode a pulse shorter than min_pulse_width is made of
+        two edges on the same pin: the first one has already been counted
+        when the second arrives, so its step is taken back and both are
+        reported as rejected. In single mode only falling edges on CLK are
+        seen, so a short interval means contact bounce and only the later
+        edge is dropped.
+        """
+
+        if self.mode == Mode.QUADRATURE:
+
+            changed = self._state ^ ((clk << 1) | dt)
+            if changed == 2:
+                pin = 0
+            elif changed == 1:
+                pin = 1
+            else:  # no change or both pins changed, nothing to filter
+                return self._decode_edge(clk, dt, timestamp)
+
+            if timestamp - self._pin_edge_time[pin] < self.min_pulse_width:
+
+                step = self._pin_step[pin]
+                if step:
+                    self._count -= step
+                    self._rejected += 1
+                    if self._pin_edge_index[pin] == self._edges - 1:
+                        self._edges -= 1  # drop its timestamp as well
+
+                self._rejected += 1
+                self._state = (clk << 1) | dt  # back to the level before the pulse
+                self._pin_edge_time[pin] = self._pin_previous_edge_time[pin]
+                self._pin_step[pin] = 0
+                return 0
+
+        else:
+
+            pin = 0
+            if timestamp - self._pin_edge_time[pin] < self.min_pulse_width:
+                self._rejected += 1
+                return 0
+
+        step = self._decode_edge(clk, dt, timestamp)
+
+        self._pin_previous_edge_time[pin] = self._pin_edge_time[pin]
+        self._pin_edge_time[pin] = timestamp
+        self._pin_step[pin] = step
+        self._pin_edge_index[pin] = self._edges - 1
+
+        return step
+
+    def _record_edge(self, timestamp):
+        """
+        Stores the timestamp of an edge in the ring buffer, overwriting
+        the oldest one once the buffer is full. Must be called holding
+        the lock.
+        """
+        self._edge_times[self._edges % self._buffer_size] = timestamp
+        self._edges += 1
+
     def reset(self):
         """
         Resets the number of encoder ticks.
+
+        Edges registered between a read_count() and a reset() are lost,
+        use take_delta() when the ticks are read periodically.
         """
-        self._count = 0
+        with self._lock:
+            self._count = 0
+            self._taken = 0
+
+    def snapshot(self):
+        """
+        Reads the state of the encoder in a single step.
+
+        Returns
+        -------
+            tuple containing:
+                number of ticks measured so far
+                motion direction
+                time.monotonic() value at which the state was read
+        """
+        with self._lock:
+            return self._count, self._direction, time.monotonic()
+
+    def edge_snapshot(self):
+        """
+        Reads the count together with the timestamp of the edge that
+        produced it, as needed to estimate the speed from edge periods.
+
+        Returns
+        -------
+            tuple containing:
+                number of ticks measured so far
+                time.monotonic() value at which the state was read
+                timestamp of the last edge, None if there was none
+        """
+        with self._lock:
+            last_edge = None
+            if self._edges > 0:
+                last_edge = self._edge_times[(self._edges - 1) % self._buffer_size]
+            return self._count, time.monotonic(), last_edge
+
+    def take_delta(self):
+        """
+        Returns the ticks measured since the previous call to take_delta().
+
+        The count is never reset: each call takes the difference with the
+        count seen by the previous one, so no tick registered by the
+        callback thread in between is lost.
+
+        Returns
+        -------
+            tuple containing:
+                number of ticks since the previous call
+                motion direction
+                time.monotonic() value at which the state was read
+        """
+        with self._lock:
+            count = self._count
+            delta = count - self._taken
+            self._taken = count
+            return delta, self._direction, time.monotonic()
+
+    def edges_since(self, t):
+        """
+        Returns the timestamps of the edges registered after time t.
+
+        Only the last buffer_size edges are kept, so older edges are
+        silently dropped.
+
+        Parameters
+        ----------
+        t : float
+            time.monotonic() value from which to look for edges
+
+        Returns
+        -------
+        timestamps : list
+            timestamps of the edges after t, oldest first
+        """
+
+        # the callback overwrites the oldest slot and may drop the last
+        # edge as a glitch: read the buffer under its lock
+        timestamps = []
+        with self._lock:
+            edges = self._edges
+            oldest = max(0, edges - self._buffer_size)
+
+            i = edges - 1
+            while i >= oldest:
+                timestamp = self._edge_times[i % self._buffer_size]
+                if timestamp <= t:
+                    break
+                timestamps.append(timestamp)
+                i -= 1
+
+        timestamps.reverse()
+        return timestamps
+
+    def last_edge(self):
+        """
+        Returns the timestamp of the last edge, None if no edge
+        has been registered yet.
+        """
+        if self._edges == 0:
+            return None
+        return self._edge_times[(self._edges - 1) % self._buffer_size]
+
+    def last_period(self):
+        """
+        Returns the time elapsed between the last two edges, None if
+        less than two edges have been registered. The inverse of the
+        period gives the edge frequency, that is much less quantized
+        than counting ticks over a window at low speed.
+        """
+
+        with self._lock:
+
+            edges = self._edges
+            if edges < 2:
+                return None
+
+            last = self._edge_times[(edges - 1) % self._buffer_size]
+            previous = self._edge_times[(edges - 2) % self._buffer_size]
+            return last - previous
 
     def read_count(self):
         """
@@ -73,6 +390,12 @@ class Encoder:
         """
         return self._count
 
+    def read_rejected(self):
+        """
+        Returns the number of edges rejected by the glitch filter so far.
+        """
+        return self._rejected
+
     def read_direction(self):
         """
         Returns the motion direction
@@ -84,11 +407,11 @@ class Encoder:
         Frees the GPIO resources.
         """
 
-        # calling GPIO.cleanup() will affect all the pins,
-        # even the ones used in other modules
-        # GPIO.cleanup()
-        GPIO.setup(self.PIN_CLK, GPIO.IN)
-        GPIO.setup(self.PIN_DT, GPIO.IN)
+        if self._closed:
+            return
+
+        self._closed = True
+        self.backend.close()
 
     def __enter__(self):
         return self
@@ -122,9 +445,21 @@ if __name__ == '__main__':
     sampling_rate = 0.1  # read the encoder value once every 0.1 seconds
     sampling_time = 20  # read the encoder value for 10 seconds
 
+    # run with the 'quadrature' argument to decode both edges of
+    # both pins instead of the falling edges of CLK only, and with
+    # the 'gpiod' argument to read the GPIO character device instead
+    # of using RPi.GPIO callbacks
+    import sys
+    mode = Mode.QUADRATURE if 'quadrature' in sys.argv[1:] else Mode.SINGLE
+
+    from .backends import GpiodBackend
+    backend = GpiodBackend() if 'gpiod' in sys.argv[1:] else None
+
     with Encoder(
         PIN_CLK=LEFT_ENC_CLK,
-        PIN_DT=LEFT_ENC_DT
+        PIN_DT=LEFT_ENC_DT,
+        mode=mode,
+        backend=backend
     ) as encoder:
 
         t_end = time.time() + sampling_time
@@ -0,0 +1,322 @@
+import collections
+import math
+
+
+# ------------------------------ base estimator ------------------------------ #
+
+class SpeedEstimator:
+    """
+    Base class for the speed estimators. An estimator is fed with the
+    state of an Encoder at every iteration of the control loop and
+    returns the angular speed of the shaft the encoder is mounted on.
+
+    Subclasses only need to implement _estimate(); the conversion to
+    linear speed is done here.
+
+    ...
+
+    Attributes
+    ----------
+    ticks_per_revolution : int
+        ticks registered by the encoder in a revolution of the wheel
+    wheel_radius : float
+        radius of the wheel in meters
+    angular_speed : float
+        last estimated speed in rad/s
+    linear_speed : float
+        last estimated speed in m/s
+
+    Methods
+    -------
+    update(count, timestamp, last_edge)
+        estimates the speed from a new encoder reading.
+
+    update_from(encoder)
+        estimates the speed reading the state of an Encoder.
+
+    reset()
+        forgets the previous readings.
+    """
+
+    def __init__(self, ticks_per_revolution, wheel_radius):
+
+        self.ticks_per_revolution = ticks_per_revolution
+        self.wheel_radius = wheel_radius
+
+        self._radians_per_tick = 2 * math.pi / ticks_per_revolution
+
+        self.angular_speed = 0.0  # rad/s
+        self.linear_speed = 0.0  # m/s
+
+    def _estimate(self, count, timestamp, last_edge):
+        raise NotImplementedError
+
+    def update(self, count, timestamp, last_edge=None):
+        """
+        Estimates the speed from a new encoder reading.
+
+        Parameters
+        ----------
+        count : int
+            number of ticks measured so far
+        timestamp : float
+            time.monotonic() value at which the count was read
+        last_edge : float
+            timestamp of the edge that produced the count, None if
+            no edge has been registered yet
+
+        Returns
+        -------
+        speed : float
+            angular speed in rad/s
+        """
+        self.angular_speed = self._estimate(count, timestamp, last_edge)
+        self.linear_speed = self.angular_speed * self.wheel_radius
+        return self.angular_speed
+
+    def update_from(self, encoder):
+        """
+        Estimates the speed reading the state of an Encoder.
+
+        Returns
+        -------
+        speed : float
+            angular speed in rad/s
+        """
+        count, timestamp, last_edge = encoder.edge_snapshot()
+        return self.update(count, timestamp, last_edge)
+
+    def reset(self):
+        """
+        Forgets the previous readings.
+        """
+        self.angular_speed = 0.0
+        self.linear_speed = 0.0
+
+
+# ---------------------------- fixed window count ---------------------------- #
+
+class FixedWindowEstimator(SpeedEstimator):
+    """
+    Counts the ticks registered over a fixed time window. The speed is
+    quantized to one tick per window, so at low speed the window must
+    be long (and the estimate laggy) to get any resolution.
+
+    The latency is bounded by the window length.
+    """
+
+    def __init__(self, ticks_per_revolution, wheel_radius, window=0.1):
+
+        super().__init__(ticks_per_revolution, wheel_radius)
+
+        self.window = window  # seconds
+        self._readings = collections.deque()  # (timestamp, count)
+
+    def _estimate(self, count, timestamp, last_edge):
+
+        readings = self._readings
+        readings.append((timestamp, count))
+
+        # keep the newest reading that is at least a window old
+        while len(readings) > 2 and readings[1][0] <= timestamp - self.window:
+            readings.popleft()
+
+        oldest_timestamp, oldest_count = readings[0]
+        elapsed = timestamp - oldest_timestamp
+        if elapsed <= 0:
+            return 0.0
+
+        return (count - oldest_count) * self._radians_per_tick / elapsed
+
+    def reset(self):
+        super().reset()
+        self._readings.clear()
+
+
+# ------------------------------- adaptive M/T ------------------------------- #
+
+class AdaptiveEstimator(SpeedEstimator):
+    """
+    Divides the ticks registered since the last estimate by the time
+    elapsed between the edges that produced them (M/T method).
+
+    At high speed many ticks fall in the minimum window and this works
+    like a count over the window; at low speed the window stretches
+    until the next edge and this measures the edge period. In both cases
+    the time base is the edge timestamps, so the estimate is not
+    quantized by the sampling instants.
+
+    While no edge arrives the speed can not be higher than one tick over
+    the time elapsed since the last edge, so the estimate decays towards
+    zero and drops to zero after timeout seconds: this bounds the latency
+    when the wheel stops.
+    """
+
+    def __init__(self, ticks_per_revolution, wheel_radius,
+                 min_window=0.01, timeout=0.25):
+
+        super().__init__(ticks_per_revolution, wheel_radius)
+
+        self.min_window = min_window  # seconds
+        self.timeout = timeout  # seconds
+
+        self._reference_count = None
+        self._reference_edge = None
+        self._speed = 0.0
+
+    def _estimate(self, count, timestamp, last_edge):
+
+        if last_edge is None:
+            return 0.0
+
+        if self._reference_edge is None:
+            self._reference_count = count
+            self._reference_edge = last_edge
+            return 0.0
+
+        ticks = count - self._reference_count
+        elapsed = last_edge - self._reference_edge
+
+        if ticks != 0 and elapsed >= self.min_window and elapsed > 0:
+            self._speed = ticks * self._radians_per_tick / elapsed
+            self._reference_count = count
+            self._reference_edge = last_edge
+
+        silence = timestamp - last_edge
+        if silence > self.timeout:
+            self._speed = 0.0
+        elif silence > 0:
+            bound = self._radians_per_tick / silence
+            self._speed = max(-bound, min(bound, self._speed))
+
+        return self._speed
+
+    def reset(self):
+        super().reset()
+        self._reference_count = None
+        self._reference_edge = None
+        self._speed = 0.0
+
+
+# ----------------------------- phase-locked loop ---------------------------- #
+
+class PLLEstimator(SpeedEstimator):
+    """
+    Tracks the encoder position with a second order loop (phase-locked
+    loop): the position error drives a proportional correction of the
+    position and an integral correction of the speed. The speed is the
+    loop integrator, so it comes out smooth even when a single tick is
+    registered between two updates.
+
+    The bandwidth (rad/s) sets the trade-off between noise and lag: the
+    settling time after a speed step is around 4 / (damping * bandwidth).
+    """
+
+    def __init__(self, ticks_per_revolution, wheel_radius,
+                 bandwidth=30.0, damping=1.0):
+
+        super().__init__(ticks_per_revolution, wheel_radius)
+
+        self.KP = 2 * damping * bandwidth
+        self.KI = bandwidth ** 2
+
+        self._position = None  # ticks
+        self._speed = 0.0  # ticks/s
+        self._last_timestamp = None
+
+    def _estimate(self, count, timestamp, last_edge):
+
+        if self._position is None:
+            self._position = float(count)
+            self._last_timestamp = timestamp
+            return 0.0
+
+        dt = timestamp - self._last_timestamp
+        self._last_timestamp = timestamp
+        if dt <= 0:
+            return self._speed * self._radians_per_tick
+
+        error = count - self._position
+        self._position += (self._speed + self.KP * error) * dt
+        self._speed += self.KI * error * dt
+
+        return self._speed * self._radians_per_tick
+
+    def reset(self):
+        super().reset()
+        self._position = None
+        self._speed = 0.0
+        self._last_timestamp = None
+
+
+# ----------------------------------- main ----------------------------------- #
+
+if __name__ == '__main__':
+
+    # Scores each estimator against synthetic edge streams. Run from the
+    # root of the repository with python -m libs.encoder.estimator
+    #
+    # noise: RMS error at constant speed, once the estimate has settled
+    # lag: delay that best aligns the estimate with the true speed
+    #      during an acceleration ramp
+    # cost: time spent in a single update
+
+    import time
+
+    from .simulator import constant, ramp, edge_train, sample
+
+    # -------------------------------- parameters -------------------------------- #
+
+    TICKS_PER_REVOLUTION = 7 * 260  # 1x decoding, REDUCTION_RATIO = 260
+    WHEEL_RADIUS = 0.021  # m
+    RATE = 200  # control loop frequency, Hz
+    JITTER = 20e-6  # edge timestamp jitter, s
+
+    estimators = {
+        'fixed window 20ms': lambda: FixedWindowEstimator(TICKS_PER_REVOLUTION, WHEEL_RADIUS, window=0.02),
+        'fixed window 100ms': lambda: FixedWindowEstimator(TICKS_PER_REVOLUTION, WHEEL_RADIUS, window=0.1),
+        'adaptive M/T': lambda: AdaptiveEstimator(TICKS_PER_REVOLUTION, WHEEL_RADIUS),
+        'PLL 30 rad/s': lambda: PLLEstimator(TICKS_PER_REVOLUTION, WHEEL_RADIUS, bandwidth=30.0),
+    }
+
+    # ---------------------------------- scoring --------------------------------- #
+
+    def run(estimator, profile, duration):
+        edges = edge_train(profile, duration, TICKS_PER_REVOLUTION, jitter=JITTER, seed=0)
+        times = [i / RATE for i in range(1, int(duration * RATE))]
+        samples = sample(edges, times)
+
+        start = time.perf_counter()
+        estimates = [estimator.update(*s) for s in samples]
+        cost = (time.perf_counter() - start) / len(samples)
+
+        return times, estimates, cost
+
+    def noise(factory, speed):
+        times, estimates, _ = run(factory(), constant(speed), 3.0)
+        errors = [e - speed for t, e in zip(times, estimates) if t > 1.0]
+        return math.sqrt(sum(e * e for e in errors) / len(errors))
+
+    def lag(factory):
+        profile = ramp(0.0, 6.0, 2.0, delay=0.5)
+        times, estimates, cost = run(factory(), profile, 3.0)
+
+        best_lag, best_error = 0.0, math.inf
+        for shift in range(0, 201):  # up to 200 ms, 1 ms steps
+            delay = shift / 1000.0
+            errors = [e - profile(t - delay) for t, e in zip(times, estimates) if 0.7 < t < 2.5]
+            error = sum(e * e for e in errors)
+            if error < best_error:
+                best_lag, best_error = delay, error
+
+        return best_lag, cost
+
+    # ----------------------------------- test ----------------------------------- #
+
+    print('{:<20}{:>18}{:>18}{:>12}{:>12}'.format(
+        'estimator', 'noise@0.5 [rad/s]', 'noise@5.0 [rad/s]', 'lag [ms]', 'cost [us]'))
+
+    for name, factory in estimators.items():
+        delay, cost = lag(factory)
+        print('{:<20}{:>18.4f}{:>18.4f}{:>12.0f}{:>12.2f}'.format(
+            name, noise(factory, 0.5), noise(factory, 5.0), delay * 1000, cost * 1e6))
@@ -0,0 +1,354 @@
+import bisect
+import math
+import random
+import threading
+import time
+
+from .encoder import Mode
+
+
+# ------------------------------ speed profiles ------------------------------ #
+
+# A speed profile is a function of time returning the angular speed
+# of the shaft (rad/s). The edge trains below are generated by
+# integrating a profile and emitting an edge every time the shaft
+# crosses a tick boundary.
+
+def constant(speed):
+    """
+    Constant speed profile.
+    """
+    return lambda t: speed
+
+
+def ramp(start_speed, end_speed, duration, delay=0.0):
+    """
+    Profile that holds start_speed for delay seconds and then
+    accelerates linearly up to end_speed in duration seconds.
+    """
+
+    def profile(t):
+        if t < delay:
+            return start_speed
+        if t > delay + duration:
+            return end_speed
+        return start_speed + (end_speed - start_speed) * (t - delay) / duration
+
+    return profile
+
+
+def reversal(speed, period):
+    """
+    Profile that reverses the direction of motion every half period.
+    """
+    return lambda t: speed if (t % period) < period / 2 else -speed
+
+
+def steps(levels, interval):
+    """
+    Profile that goes through the given speeds, holding each one
+    for interval seconds and then repeating the sequence.
+    """
+    return lambda t: levels[int(t / interval) % len(levels)]
+
+
+# -------------------------------- edge trains ------------------------------- #
+
+def edge_train(profile, duration, ticks_per_revolution,
+               resolution=1e-5, jitter=0.0, seed=None):
+    """
+    Generates the edges produced by an encoder whose shaft follows
+    the given speed profile.
+
+    Parameters
+    ----------
+    profile : callable
+        speed profile, t -> rad/s
+    duration : float
+        length of the edge train in seconds
+    ticks_per_revolution : int
+        ticks registered by the encoder in a revolution of the shaft
+    resolution : float
+        integration step in seconds
+    jitter : float
+        standard deviation (in seconds) of the gaussian noise added
+        to each edge timestamp
+    seed : int
+        seed of the jitter generator
+
+    Returns
+    -------
+    edges : list
+        (timestamp, step) tuples sorted by timestamp, step is +1 for a
+        clockwise tick and -1 for a counterclockwise one
+    """
+
+    rng = random.Random(seed)
+    ticks_per_radian = ticks_per_revolution / (2 * math.pi)
+
+    edges = []
+    position = 0.0  # shaft position in ticks
+    tick = 0  # last tick boundary crossed
+    t = 0.0
+    while t < duration:
+
+        position += profile(t) * ticks_per_radian * resolution
+        t += resolution
+
+        current = math.floor(position)
+        while current != tick:
+            step = 1 if current > tick else -1
+            tick += step
+            timestamp = t + rng.gauss(0.0, jitter) if jitter > 0 else t
+            edges.append((max(0.0, timestamp), step))
+
+    if jitter > 0:
+        edges.sort(key=lambda edge: edge[0])
+
+    return edges
+
+
+def sample(edges, times):
+    """
+    Reads an edge train the way the control loop reads an Encoder.
+
+    Parameters
+    ----------
+    edges : list
+        (timestamp, step) tuples as returned by edge_train()
+    times : iterable
+        sampling instants, in increasing order
+
+    Returns
+    -------
+    samples : list
+        (count, timestamp, last_edge) tuples, one per sampling instant,
+        where last_edge is None until the first edge is registered
+    """
+
+    timestamps = [edge[0] for edge in edges]
+
+    samples = []
+    count = 0
+    i = 0
+    for t in times:
+        j = bisect.bisect_right(timestamps, t, lo=i)
+        for edge in edges[i:j]:
+            count += edge[1]
+        i = j
+        last_edge = timestamps[i - 1] if i > 0 else None
+        samples.append((count, t, last_edge))
+
+    return samples
+
+
+# ----------------------------- simulated backend ---------------------------- #
+
+# level of (CLK, DT) at each quadrature position, in clockwise order
+_QUADRATURE_SEQUENCE = ((0, 0), (1, 0), (1, 1), (0, 1))
+
+
+class SimulatedBackend:
+    """
+    Encoder backend that plays an edge train instead of reading the GPIO,
+    so that an Encoder can run on any machine.
+
+    The edge train is made of quadrature transitions (four per CLK period,
+    generate it with 4 times the pulses per revolution): the backend turns
+    it into the levels of the CLK and DT pins and delivers to the encoder
+    the edges its mode listens to.
+
+    With batch_size 1 every edge is delivered with its own call stamped
+    with time.monotonic() when it is delivered, like RPiGPIOBackend does;
+    with a larger batch_size the edges are delivered in bulk with their
+    scheduled timestamps, like GpiodBackend does.
+
+    ...
+
+    Attributes
+    ----------
+    delivered : int
+        number of edges delivered so far
+    max_lag : float
+        largest delay between the scheduled time of an edge and its
+        delivery, in seconds
+    elapsed : float
+        seconds spent delivering the edge train
+    done : threading.Event
+        set once the whole edge train has been delivered
+    """
+
+    def __init__(self, edges, realtime=True, batch_size=1, idle=50e-6):
+        """
+        Parameters
+        ----------
+        edges : list
+            (timestamp, step) quadrature transitions, see edge_train()
+        realtime : bool
+            if True each edge is delivered at its scheduled time, counted
+            from setup(); if False the edges are delivered as fast as
+            possible
+        batch_size : int
+            maximum number of edges delivered per call
+        idle : float
+            seconds the delivery thread sleeps when no edge is due
+        """
+
+        self.edges = edges
+        self.realtime = realtime
+        self.batch_size = batch_size
+        self.idle = idle
+
+        self.delivered = 0
+        self.max_lag = 0.0
+        self.elapsed = 0.0
+        self.done = threading.Event()
+
+        self._encoder = None
+        self._levels = []
+        self._timestamps = []
+        self._running = False
+        self._thread = None
+
+    def setup(self, encoder):
+        """
+        Converts the edge train into pin levels and starts delivering it.
+        """
+
+        self._encoder = encoder
+        quadrature = encoder.mode == Mode.QUADRATURE
+
+        # precompute (clk, dt, timestamp) for every edge the encoder sees,
+        # so that nothing is allocated while delivering
+        position = 0
+        clk, dt = _QUADRATURE_SEQUENCE[0]
+        for timestamp, step in self.edges:
+            position += step
+            new_clk, new_dt = _QUADRATURE_SEQUENCE[position % 4]
+            if quadrature or (clk == 1 and new_clk == 0):
+                self._levels.append((new_clk, new_dt, timestamp))
+                self._timestamps.append(timestamp)
+            clk, dt = new_clk, new_dt
+
+        encoder._set_levels(*_QUADRATURE_SEQUENCE[0])
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+
+        levels = self._levels
+        timestamps = self._timestamps
+        encoder = self._encoder
+        total = len(levels)
+        start = time.monotonic()
+
+        i = 0
+        while self._running and i < total:
+
+            if self.realtime:
+                now = time.monotonic() - start
+                due = bisect.bisect_right(timestamps, now, lo=i)
+                if due == i:
+                    time.sleep(self.idle)
+                    continue
+                self.max_lag = max(self.max_lag, now - timestamps[i])
+            else:
+                due = total
+
+            j = min(due, i + self.batch_size)
+            if self.batch_size == 1:
+                clk, dt, _ = levels[i]
+                encoder._on_edge(clk, dt, time.monotonic())
+            else:
+                encoder._on_edges([(clk, dt, start + t) for clk, dt, t in levels[i:j]])
+
+            self.delivered += j - i
+            i = j
+
+        self.elapsed = time.monotonic() - start
+        self.done.set()
+
+    def close(self):
+        """
+        Stops delivering the edges.
+        """
+
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+# ----------------------------------- main ----------------------------------- #
+
+if __name__ == '__main__':
+
+    # Measures how many edges per second the Encoder decoding sustains and
+    # how much delivering them delays a control loop running on the main
+    # thread. No hardware (nor RPi.GPIO) is needed, run from the root of
+    # the repository with python -m libs.encoder.simulator
+
+    from .encoder import Encoder
+
+    PULSES_PER_REVOLUTION = 7
+    RATE = 200  # main loop frequency, Hz
+    DURATION = 2.0  # seconds per test
+
+    def train(edge_rate, duration, jitter=0.0):
+        # constant speed producing edge_rate quadrature transitions per second
+        speed = edge_rate / (4 * PULSES_PER_REVOLUTION) * 2 * math.pi
+        return edge_train(constant(speed), duration, 4 * PULSES_PER_REVOLUTION,
+                          resolution=min(1e-5, 0.25 / edge_rate), jitter=jitter, seed=0)
+
+    def loop_latency(duration):
+        # run a control loop reading the encoder and return the sleep
+        # overshoot of each iteration
+        interval = 1 / RATE
+        overshoots = []
+        t_end = time.monotonic() + duration
+        while time.monotonic() < t_end:
+            start = time.monotonic()
+            time.sleep(interval)
+            overshoots.append(time.monotonic() - start - interval)
+        return overshoots
+
+    def percentile(values, p):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(p * len(values)))]
+
+    # -------------------------- decoding cost per edge -------------------------- #
+
+    print('per-edge cost (edges delivered as fast as possible)')
+    for mode in (Mode.SINGLE, Mode.QUADRATURE):
+        for batch_size in (1, 64):
+            edges = train(100000, 1.0)
+            backend = SimulatedBackend(edges, realtime=False, batch_size=batch_size)
+            encoder = Encoder(0, 1, mode=mode, backend=backend)
+            backend.done.wait()
+            encoder.close()
+            print('  {:<12} batch {:>3}: {:6.2f} us/edge, {:>9.0f} edges/s max'.format(
+                mode.name, batch_size, backend.elapsed / backend.delivered * 1e6,
+                backend.delivered / backend.elapsed))
+
+    # ---------------------- sustained rate and loop latency --------------------- #
+
+    baseline = loop_latency(1.0)
+    print('\nmain loop at {} Hz, no edges: p99 overshoot {:.3f} ms, max {:.3f} ms'.format(
+        RATE, percentile(baseline, 0.99) * 1e3, max(baseline) * 1e3))
+
+    print('\nsustained rate (quadrature, one call per edge, 5 us jitter)')
+    for edge_rate in (1000, 5000, 10000, 20000, 50000):
+        backend = SimulatedBackend(train(edge_rate, DURATION, jitter=5e-6))
+        encoder = Encoder(0, 1, mode=Mode.QUADRATURE, backend=backend)
+        overshoots = loop_latency(DURATION)
+        backend.done.wait()
+        encoder.close()
+
+        # the delivery is sustained if it never falls behind by more than
+        # a control period
+        sustained = backend.max_lag < 1 / RATE
+        print('  {:>6} edges/s: max lag {:7.2f} ms [{}], loop p99 overshoot {:.3f} ms, max {:.3f} ms'.format(
+            edge_rate, backend.max_lag * 1e3, 'ok' if sustained else 'behind',
+            percentile(overshoots, 0.99) * 1e3, max(overshoots) * 1e3))
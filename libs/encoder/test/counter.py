@@ -1,5 +1,8 @@
 import RPi.GPIO as GPIO
 
+from ...pins.pins import registry
+from ...pins.pins import IN
+
 
 class Counter:
     """
@@ -15,8 +18,7 @@ class Counter:
         self._setup()
 
     def _setup(self):
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        registry.claim(self.pin, IN, self, pull=GPIO.PUD_UP)
         GPIO.add_event_detect(self.pin, 
                               GPIO.FALLING, 
                               callback=self._increment_count, 
@@ -29,7 +31,8 @@ class Counter:
         return self._count
 
     def close(self):
-        GPIO.setup(self.pin, GPIO.IN)
+        GPIO.remove_event_detect(self.pin)
+        registry.release(self.pin, self)
 
     def __del__(self):
         self.close()
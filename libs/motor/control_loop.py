@@ -0,0 +1,283 @@
+import sys
+import threading
+import time
+
+from ..scheduler.scheduler import RateScheduler
+
+
+class ControlLoop:
+    """
+    Runs the speed loop of one or more Motors (encoder read -> PID ->
+    driver write) on a dedicated thread at a fixed rate, so that the
+    quality of the wheel control does not depend on how busy the
+    application loop is.
+
+    The application only sets the targets: every motor has a latest-value
+    slot that set_target() overwrites and the loop reads at its next
+    iteration. A slot is a single list element, storing and loading it
+    is atomic, so neither side takes a lock.
+
+    The iterations are paced by a RateScheduler on absolute deadlines,
+    so the rate does not drift with the time spent in each iteration;
+    when an iteration overruns the following deadlines are skipped
+    instead of running a burst of late iterations.
+
+    The loop thread competes for the GIL with the application: a thread
+    running Python code keeps it for up to the switch interval (5 ms by
+    default), which delays the wakeups of the loop by as much. Passing a
+    switch_interval shortens it for the whole process while the loop
+    runs.
+
+    ...
+
+    Methods
+    -------
+    start()
+        starts the loop thread.
+
+    set_target(index, speed)
+        sets the target speed of a motor.
+
+    set_targets(speeds)
+        sets the target speed of every motor.
+
+    get_stats()
+        returns the achieved rate and the jitter of the loop.
+
+    stop()
+        stops the loop and the motors.
+    """
+
+    def __init__(self, motors, rate=200.0, history=1000, switch_interval=None):
+        """
+        Parameters
+        ----------
+        motors : list
+            Motor objects, updated in this order at every iteration
+        rate : float
+            iterations per second
+        history : int
+            number of iterations kept to compute the jitter percentiles
+        switch_interval : float
+            GIL switch interval (see sys.setswitchinterval()) in seconds
+            while the loop runs, None to leave it unchanged
+        """
+
+        self.motors = list(motors)
+        self.rate = rate
+        self.period = 1.0 / rate
+
+        self._targets = [0.0] * len(self.motors)  # latest-value slots
+
+        # paces the loop thread and keeps its statistics
+        self._scheduler = RateScheduler(rate, history=history)
+
+        self.switch_interval = switch_interval
+        self._previous_switch_interval = None
+
+        self.error = None  # exception that stopped the loop
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the loop thread.
+        """
+
+        if self._thread is not None:
+            return
+
+        if self.switch_interval is not None:
+            self._previous_switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(self.switch_interval)
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def set_target(self, index, speed):
+        """
+        Sets the target speed (m/s) of the motor at index.
+        """
+        self._targets[index] = speed
+
+    def set_targets(self, speeds):
+        """
+        Sets the target speed (m/s) of every motor, in the order of motors.
+        """
+        for index, speed in enumerate(speeds):
+            self._targets[index] = speed
+
+    def _run(self):
+
+        motors = self.motors
+        targets = self._targets
+        scheduler = self._scheduler
+
+        scheduler.reset()
+        scheduler.start()
+        last_time = None
+
+        try:
+            while self._running:
+
+                now = time.monotonic()
+                dt = now - last_time if last_time is not None else self.period
+                last_time = now
+
+                for index, motor in enumerate(motors):
+                    motor.update(targets[index], dt)
+
+                scheduler.wait()
+
+        except Exception as e:
+            self.error = e
+            self._running = False
+            self._halt()
+
+    def _halt(self):
+        for motor in self.motors:
+            if motor.motor_driver is not None:
+                motor.motor_driver.write(motor.channel, 0)
+
+    def get_stats(self):
+        """
+        Returns the statistics of the loop, see RateScheduler.get_stats():
+        the iterations run so far, the achieved rate, the overruns, the
+        delay of the wakeups with respect to their deadlines (jitter) and
+        the fraction of the time spent updating the motors (load).
+
+        Returns
+        -------
+        stats : dict
+        """
+        return self._scheduler.get_stats()
+
+    def _shutdown(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self._halt()
+
+        if self._previous_switch_interval is not None:
+            sys.setswitchinterval(self._previous_switch_interval)
+            self._previous_switch_interval = None
+
+    def stop(self):
+        """
+        Stops the loop thread and the motors.
+
+        Raises
+        ------
+        Exception
+            the exception that stopped the loop, if any.
+        """
+
+        self._shutdown()
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+
+        if exc_type is not None:
+            self._shutdown()
+            return False
+
+        self.stop()
+
+        return True
+
+
+# ----------------------------------- main ----------------------------------- #
+
+if __name__ == '__main__':
+
+    # Runs the speed loop of two simulated wheels at 200 Hz on the loop
+    # thread while the main thread plans at 10 Hz and burns CPU in
+    # between, then prints the rate and jitter achieved by the loop. Run
+    # from the root of the repository with python -m libs.motor.control_loop
+
+    import configparser
+
+    from config.definitions import CONFIG_PATH
+    from libs.PID.pid import PID, Mode
+
+    from .feedforward import Feedforward
+    from .motor import Motor
+    from .simulation import SimulatedMotor
+
+    RATE = 200  # Hz
+    PLANNING_RATE = 10  # Hz
+    DURATION = 5.0  # s
+
+    config = configparser.ConfigParser()
+    config.read(CONFIG_PATH)
+
+    class PlantEstimator:
+        """
+        Stands in for the Encoder and the SpeedEstimator: advances the
+        simulated motor to the current time and reads its speed.
+        """
+
+        def __init__(self):
+            self.linear_speed = 0.0
+            self._last_time = time.monotonic()
+
+        def update_from(self, plant):
+            now = time.monotonic()
+            plant.sleep(now - self._last_time)
+            self._last_time = now
+            self.linear_speed = plant.measure()
+
+    def run(switch_interval):
+
+        motors = []
+        for seed in range(2):
+            plant = SimulatedMotor(noise=0.0005, seed=seed)
+            motors.append(Motor(
+                motor_driver=plant, encoder=plant, estimator=PlantEstimator(),
+                feedforward=Feedforward.from_config(config),
+                pid=PID(15.0, 60.0, 0.3, mode=Mode.DISCRETE, derivative_filter=1 / RATE)))
+
+        with ControlLoop(motors, rate=RATE, switch_interval=switch_interval) as loop:
+
+            t_end = time.monotonic() + DURATION
+            i = 0
+            while time.monotonic() < t_end:
+
+                # planning: a new pair of targets every tenth of a second
+                loop.set_targets((0.08, 0.08) if (i // 10) % 2 == 0 else (0.05, 0.11))
+                i += 1
+
+                # busy application work
+                busy_end = time.monotonic() + 0.5 / PLANNING_RATE
+                while time.monotonic() < busy_end:
+                    sum(x * x for x in range(1000))
+
+                time.sleep(0.5 / PLANNING_RATE)
+
+            stats = loop.get_stats()
+
+        return motors, stats
+
+    for switch_interval in (None, 0.0005):
+
+        motors, stats = run(switch_interval)
+
+        print('switch interval {}'.format(
+            'default' if switch_interval is None else '{} ms'.format(switch_interval * 1e3)))
+        print('  target rate {} Hz: achieved {:.1f} Hz over {} iterations, {} overruns'.format(
+            RATE, stats['rate'], stats['iterations'], stats['overruns']))
+        print('  wakeup jitter: mean {:.3f} ms, p99 {:.3f} ms, max {:.3f} ms, loop load {:.1%}'.format(
+            stats['jitter_mean'] * 1e3, stats['jitter_p99'] * 1e3, stats['jitter_max'] * 1e3, stats['load']))
+        for index, motor in enumerate(motors):
+            speed, feedforward, feedback, output = motor.get_telemetry()
+            print('  motor {}: speed {:.3f} m/s, feedforward {:.3f}, feedback {:+.3f}, rate {:.3f}'.format(
+                index, speed, feedforward, feedback, output))
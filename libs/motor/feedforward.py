@@ -0,0 +1,85 @@
+import math
+
+
+class Feedforward:
+    """
+    Steady-state model of a DC motor, used to compute the rate that
+    drives a wheel at a target speed before any feedback.
+
+    Once the speed has settled the voltage applied to the motor (rate
+    times supply voltage) balances the back-EMF of the motor shaft and
+    the losses due to static friction:
+
+        rate = sign(v) * (static_friction + KE * w_motor / supply_voltage)
+
+    where w_motor = v / wheel_radius * reduction_ratio is the speed of
+    the motor shaft, before the gearbox. The PID then only corrects the
+    error left by the model.
+
+    ...
+
+    Attributes
+    ----------
+    KE : float
+        back-EMF constant of the motor in V / (rad/s) of the motor shaft
+    static_friction : float
+        smallest rate that moves the wheel
+    reduction_ratio : float
+        gearbox reduction, motor shaft turns per wheel turn
+    wheel_radius : float
+        radius of the wheel in meters
+    supply_voltage : float
+        voltage applied at full rate
+    """
+
+    def __init__(self, KE, static_friction, reduction_ratio, wheel_radius, supply_voltage):
+
+        self.KE = KE
+        self.static_friction = static_friction
+        self.reduction_ratio = reduction_ratio
+        self.wheel_radius = wheel_radius
+        self.supply_voltage = supply_voltage
+
+        # rate per m/s above the static friction
+        self._slope = KE * reduction_ratio / (wheel_radius * supply_voltage)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Builds the model from the [MOTOR] and [WHEELS] sections of a
+        configparser.ConfigParser loaded from config.ini.
+        """
+        return cls(
+            KE=float(config['MOTOR']['KE']),
+            static_friction=float(config['MOTOR']['STATIC_FRICTION']),
+            reduction_ratio=float(config['MOTOR']['REDUCTION_RATIO']),
+            wheel_radius=float(config['WHEELS']['DIAMETER']) / 2 / 1000,  # m
+            supply_voltage=float(config['MOTOR']['SUPPLY_VOLTAGE'])
+        )
+
+    def rate(self, speed):
+        """
+        Returns the rate that drives the wheel at the given speed.
+
+        Parameters
+        ----------
+        speed : float
+            target linear speed in m/s, negative to move backward
+
+        Returns
+        -------
+        rate : float
+            modulation value between -1.0 and 1.0, 0 for speed 0
+        """
+
+        if speed == 0:
+            return 0.0
+
+        rate = self.static_friction + self._slope * abs(speed)
+        return math.copysign(min(1.0, rate), speed)
+
+    def top_speed(self):
+        """
+        Returns the speed reached at full rate, in m/s.
+        """
+        return (1.0 - self.static_friction) / self._slope
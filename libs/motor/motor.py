@@ -1,23 +1,65 @@
-from ..PID.pid import PID
+from ..PID.pid import PID, Mode
+
+from .control_loop import ControlLoop
+from .feedforward import Feedforward
 
 
 class Motor:
 
-    def __init__(self):
+    def __init__(self, motor_driver=None, encoder=None, estimator=None,
+                 feedforward=None, pid=None, channel=0):
 
         # hardware components
-        self.motor_driver = None
-        self.encoder = None
-        self.PID = PID(
+        self.motor_driver = motor_driver
+        self.encoder = encoder
+        self.channel = channel  # channel of the motor driver
+
+        # speed estimator fed with the encoder readings, any
+        # libs.encoder.estimator.SpeedEstimator
+        self.estimator = estimator
+
+        # model of the motor (libs.motor.feedforward.Feedforward) giving
+        # the rate for the target speed, None to rely on the PID alone
+        self.feedforward = feedforward
+
+        # the PID only corrects what the feedforward misses; from_config()
+        # uses the gains tuned by python -m libs.PID.autotune
+        self.PID = pid if pid is not None else PID(
             KP=0.08,
             KI=0.01,
-            KD=0.01
+            KD=0.01,
+            mode=Mode.DISCRETE
         )
 
         self.last_update = 0
         self.current_speed = 0
 
-    def update(self, target_speed):
+        # telemetry of the last update
+        self.feedforward_term = 0.0  # rate from the model
+        self.feedback_term = 0.0  # rate from the PID
+        self.output = 0.0  # rate written to the driver
+
+        # dedicated loop thread, see start(), and the target it starts
+        # with, kept by set_target() until then
+        self._loop = None
+        self._target = 0.0
+
+    @classmethod
+    def from_config(cls, config, motor_driver=None, encoder=None, estimator=None, channel=0):
+        """
+        Builds the motor with the feedforward model and the PID gains of
+        a configparser.ConfigParser loaded from config.ini.
+        """
+        return cls(
+            motor_driver=motor_driver,
+            encoder=encoder,
+            estimator=estimator,
+            feedforward=Feedforward.from_config(config),
+            pid=PID.from_config(config, mode=Mode.DISCRETE),
+            channel=channel
+        )
+
+    def update(self, target_speed, dt=None):
         """
         Updates the state of the motor.
         The motor block needs to be used inside an update loop.
@@ -29,29 +71,121 @@ class Motor:
 
             get encoder ticks
 
-            compute speed from encoder ticks in the time frame
-                (current_update - last_update)
+            estimate the speed from the encoder ticks and the
+                timestamps of the edges that produced them
 
             now we have the current_speed and the target_speed
 
+            compute the rate for the target_speed with the motor
+                model (feedforward)
+
             use the PID controller to compute the correction
-                for the current_speed
+                of the rate for the residual error
+
+        Parameters
+        ----------
+        target_speed : float
+            linear speed in m/s
+        dt : float
+            seconds since the last update, from the PID clock if None
+
+        Returns
+        -------
+        rate : float
+            rate written to the motor driver
         """
 
-        ticks = self.encoder.read_count()
-        speed = ticks / (now() - self.last_update)  # m/s
-        self.current_speed = self.PID.update(speed, target_speed)
+        self.estimator.update_from(self.encoder)
+        speed = self.estimator.linear_speed  # m/s
+
+        return self.control(speed, target_speed, dt)
+
+    def control(self, speed, target_speed, dt=None):
+        """
+        Computes the rate from a speed measured elsewhere and applies it,
+        see update().
+        """
+
+        self.current_speed = speed
+
+        feedforward = self.feedforward.rate(target_speed) if self.feedforward is not None else 0.0
+
+        # the PID output is limited to the headroom left by the
+        # feedforward, so that its integral does not wind up
+        self.PID.output_limits = (-1.0 - feedforward, 1.0 - feedforward)
+        feedback = self.PID.update(speed, target_speed, dt)
+
+        self.feedforward_term = feedforward
+        self.feedback_term = feedback
+        self.output = max(-1.0, min(1.0, feedforward + feedback))
 
         # apply the correction
-        # self.motor_driver.write()
-        print(f'new speed: {self.current_speed}')
+        if self.motor_driver is not None:
+            self.motor_driver.write(self.channel, self.output)
+
+        return self.output
+
+    def get_telemetry(self):
+        """
+        Returns the components of the last rate written.
+
+        Returns
+        -------
+            tuple containing:
+                measured speed in m/s
+                rate from the feedforward model
+                rate from the PID
+                rate written to the driver
+        """
+        return self.current_speed, self.feedforward_term, self.feedback_term, self.output
+
+    def start(self, rate=200.0):
+        """
+        Runs update() on a dedicated thread at rate Hz instead of the
+        application loop, which then only calls set_target(). To run
+        both wheels on the same thread use a ControlLoop directly.
+
+        Returns
+        -------
+        loop : ControlLoop
+            the loop, to read its statistics
+        """
+
+        if self._loop is None:
+            self._loop = ControlLoop([self], rate=rate)
+            self._loop.set_target(0, self._target)
+            self._loop.start()
+
+        return self._loop
+
+    def set_target(self, target_speed):
+        """
+        Sets the target speed (m/s) of the loop started with start().
+        Before start() the target is kept, and the loop starts with it.
+        """
+        self._target = target_speed
+        if self._loop is not None:
+            self._loop.set_target(0, target_speed)
+
+    def stop(self):
+        """
+        Stops the loop started with start() and the motor; the next
+        start() begins from a null target.
+        """
+        self._target = 0.0
+        if self._loop is not None:
+            loop, self._loop = self._loop, None
+            loop.stop()
 
     def close(self):
         """
         Frees the GPIO resources.
         """
-        self.motor_driver.close()
-        self.encoder.close()
+        self.stop()
+        if self.motor_driver is not None:
+            self.motor_driver.close()
+        if self.encoder is not None:
+            self.encoder.close()
 
     def __del__(self):
         self.close()
@@ -71,4 +205,47 @@ class Motor:
 
 if __name__ == '__main__':
 
-    print('hello')
\ No newline at end of file
+    # Compares the speed loop with and without the feedforward on a
+    # simulated motor, going through a few target speeds. Run from the
+    # root of the repository with python -m libs.motor.motor
+
+    import configparser
+
+    from config.definitions import CONFIG_PATH
+
+    from .simulation import SimulatedMotor
+
+    config = configparser.ConfigParser()
+    config.read(CONFIG_PATH)
+
+    PERIOD = 0.01  # control period, s
+    TARGETS = (0.08, 0.12, 0.04, -0.06)  # m/s, held for 1 s each
+
+    def run(feedforward):
+
+        plant = SimulatedMotor(noise=0.0005, seed=0)
+        pid = PID(15.0, 60.0, 0.3, mode=Mode.DISCRETE, derivative_filter=PERIOD)
+        motor = Motor(motor_driver=plant, feedforward=feedforward, pid=pid)
+
+        rise_times, errors, max_integral = [], [], 0.0
+        for target in TARGETS:
+            start = plant.speed
+            rise_time = None
+            for i in range(int(1.0 / PERIOD)):
+                motor.control(plant.measure(), target, dt=PERIOD)
+                plant.sleep(PERIOD)
+                # time to cover 90% of the step
+                if rise_time is None and abs(plant.speed - start) >= 0.9 * abs(target - start):
+                    rise_time = (i + 1) * PERIOD
+                errors.append(plant.speed - target)
+                max_integral = max(max_integral, abs(pid.integral))
+            rise_times.append(rise_time if rise_time is not None else float('nan'))
+
+        rms = (sum(e * e for e in errors) / len(errors)) ** 0.5
+        return rise_times, rms, max_integral
+
+    print('{:<16}{:>34}{:>12}{:>16}'.format('', 'rise time per step [ms]', 'rms [m/s]', 'max |integral|'))
+    for name, feedforward in (('PID only', None), ('feedforward+PID', Feedforward.from_config(config))):
+        rise_times, rms, max_integral = run(feedforward)
+        print('{:<16}{:>34}{:>12.4f}{:>16.3f}'.format(
+            name, ' '.join('{:>7.0f}'.format(t * 1000) for t in rise_times), rms, max_integral))
\ No newline at end of file
@@ -0,0 +1,106 @@
+import collections
+import random
+
+
+class SimulatedMotor:
+    """
+    Simulated wheel driven by a DC motor, to run the speed loop (and the
+    tools tuning it) on any machine.
+
+    The rate written to the motor goes through the deadband of the motor
+    and a first order electrical lag, then drives a first order mechanical
+    lag; the measured speed is delayed by a few control periods and noisy,
+    like the output of a SpeedEstimator.
+
+    The simulation has its own clock: sleep(dt) advances it, so the code
+    under test can take it in place of time.sleep() and run faster than
+    real time.
+
+    ...
+
+    Attributes
+    ----------
+    speed : float
+        true linear speed of the wheel in m/s
+    time : float
+        simulated seconds elapsed so far
+    """
+
+    def __init__(self,
+                 top_speed=0.15,  # m/s at full rate
+                 tau=0.12,  # mechanical time constant, s
+                 tau_electric=0.01,  # electrical time constant, s
+                 deadband=0.2,  # rates below this do not move the wheel
+                 delay=0.02,  # measure delay, s
+                 noise=0.0,  # standard deviation of the measure, m/s
+                 step=1e-3,  # integration step, s
+                 seed=None):
+
+        self.top_speed = top_speed
+        self.tau = tau
+        self.tau_electric = tau_electric
+        self.deadband = deadband
+        self.delay = delay
+        self.noise = noise
+        self.step = step
+
+        self._rng = random.Random(seed)
+
+        self.rate = 0.0  # rate written by the controller
+        self.drive = 0.0  # rate after the electrical lag
+        self.speed = 0.0  # m/s
+        self.time = 0.0  # s
+
+        # past speeds, the oldest one is the measured speed
+        self._history = collections.deque([0.0] * max(1, int(round(delay / step))))
+
+    def write(self, _channel, _rate):
+        """
+        Sets the rate, same signature as DRV8833.write().
+        """
+        self.rate = max(-1.0, min(1.0, _rate))
+
+    def _torque(self, drive):
+        # static friction: the motor only turns above the deadband
+        magnitude = abs(drive)
+        if magnitude <= self.deadband:
+            return 0.0
+        effective = (magnitude - self.deadband) / (1 - self.deadband)
+        return effective if drive > 0 else -effective
+
+    def sleep(self, dt):
+        """
+        Advances the simulation by dt seconds.
+        """
+
+        t_end = self.time + dt
+        while self.time < t_end - 1e-12:
+            h = min(self.step, t_end - self.time)
+            self.drive += (self.rate - self.drive) * h / self.tau_electric
+            target = self.top_speed * self._torque(self.drive)
+            self.speed += (target - self.speed) * h / self.tau
+            self.time += h
+
+            self._history.append(self.speed)
+            self._history.popleft()
+
+    def measure(self):
+        """
+        Returns the delayed, noisy speed seen by the controller.
+        """
+        measured = self._history[0]
+        if self.noise > 0:
+            measured += self._rng.gauss(0.0, self.noise)
+        return measured
+
+    def monotonic(self):
+        """
+        Simulated clock, to use in place of time.monotonic().
+        """
+        return self.time
+
+    def close(self):
+        """
+        Nothing to free, same signature as DRV8833.close().
+        """
+        pass
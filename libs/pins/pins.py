@@ -0,0 +1,215 @@
+import threading
+
+# RPi.GPIO is only needed to configure the pins, the bookkeeping works
+# without it (e.g. for pins driven through sysfs or the character device)
+
+try:
+    import RPi.GPIO as GPIO
+except ImportError:  # not running on a Raspberry Pi
+    GPIO = None
+
+
+# pin modes
+IN = 'in'  # input, configured through RPi.GPIO
+OUT = 'out'  # output, configured through RPi.GPIO
+EXTERNAL = 'external'  # configured by someone else (sysfs, gpiod, pigpio)
+
+
+class PinConflictError(ValueError):
+    """
+    Raised when a pin is claimed by two drivers that can not share it.
+    """
+
+
+class PinRegistry:
+    """
+    Keeps track of which driver owns each GPIO pin, so that the drivers
+    in hardlibs/ and libs/ do not configure the same pin twice nor reset
+    a pin another driver is still using.
+
+    A pin is configured by the first claim and freed (set back to input)
+    by the last release. Shared pins, like the ENABLE pin of the motor
+    drivers, can be claimed by several owners with the same mode; any
+    other second claim raises a PinConflictError.
+
+    ...
+
+    Methods
+    -------
+    claim(pin, mode, owner, shared=False, pull=None)
+        takes a pin, configuring it if nobody else did.
+
+    release(pin, owner)
+        gives a pin back, freeing it if nobody else uses it.
+
+    owners(pin)
+        returns the owners of a pin.
+    """
+
+    def __init__(self):
+
+        self._pins = {}  # pin -> (mode, shared, [owners])
+        self._lock = threading.Lock()
+        self._gpio_ready = False
+
+    def _setup_gpio(self):
+        """
+        Initializes RPi.GPIO, once for all the drivers.
+        """
+
+        if GPIO is None:
+            raise ImportError('RPi.GPIO is not available, unable to configure the pins')
+
+        if not self._gpio_ready:
+            GPIO.setwarnings(False)
+            GPIO.setmode(GPIO.BCM)  # init the library
+            self._gpio_ready = True
+
+    def claim(self, pin, mode, owner, shared=False, pull=None):
+        """
+        Takes a pin. The first claim configures it, later claims of a
+        shared pin only count the new owner.
+
+        Parameters
+        ----------
+        pin : int
+            BCM pin number
+        mode : str
+            IN, OUT or EXTERNAL
+        owner : object
+            the driver claiming the pin
+        shared : bool
+            True if other owners may claim the pin too
+        pull : int
+            RPi.GPIO pull up/down setting of an input pin
+
+        Returns
+        -------
+        first : bool
+            True if this claim configured the pin
+
+        Raises
+        ------
+        PinConflictError
+            if the pin is already owned and can not be shared.
+        """
+
+        with self._lock:
+
+            if pin in self._pins:
+                current_mode, current_shared, owners = self._pins[pin]
+                if not (shared and current_shared and mode == current_mode):
+                    error_msg = 'Pin {} is already used by {}'.format(
+                        pin, ', '.join(type(o).__name__ for o in owners))
+                    raise PinConflictError(error_msg)
+                owners.append(owner)
+                return False
+
+            if mode == IN:
+                self._setup_gpio()
+                if pull is None:
+                    GPIO.setup(pin, GPIO.IN)
+                else:
+                    GPIO.setup(pin, GPIO.IN, pull_up_down=pull)
+            elif mode == OUT:
+                self._setup_gpio()
+                GPIO.setup(pin, GPIO.OUT)
+            elif mode != EXTERNAL:
+                error_msg = 'Invalid pin mode: {}'.format(mode)
+                raise ValueError(error_msg)
+
+            self._pins[pin] = (mode, shared, [owner])
+            return True
+
+    def release(self, pin, owner):
+        """
+        Gives a pin back. The last owner sets it back to input, which is
+        safer than leaving it driven (see GPIO.cleanup()).
+
+        Returns
+        -------
+        last : bool
+            True if the pin has been freed
+        """
+
+        with self._lock:
+
+            if pin not in self._pins:
+                return False
+
+            mode, _, owners = self._pins[pin]
+            if owner in owners:
+                owners.remove(owner)
+            if owners:
+                return False
+
+            del self._pins[pin]
+
+            # calling GPIO.cleanup() would affect all the pins,
+            # even the ones used in other modules
+            if mode != EXTERNAL:
+                GPIO.setup(pin, GPIO.IN)
+
+            return True
+
+    def owners(self, pin):
+        """
+        Returns the owners of a pin, an empty list if it is free.
+        """
+        with self._lock:
+            return list(self._pins[pin][2]) if pin in self._pins else []
+
+
+# the registry shared by all the drivers
+registry = PinRegistry()
+
+
+def check_pins(pins):
+    """
+    Checks that no pin is assigned to two functions. A function shared
+    by several drivers (e.g. the ENABLE pin of the DRV8833 boards) has a
+    single entry, so it is not a conflict; the drivers share its pin at
+    run time with registry.claim(..., shared=True).
+
+    Parameters
+    ----------
+    pins : dict
+        function name -> BCM pin number
+
+    Raises
+    ------
+    PinConflictError
+        listing all the pins assigned to more than one function.
+    """
+
+    used = {}
+    for name, pin in pins.items():
+        used.setdefault(pin, []).append(name)
+
+    conflicts = [
+        'pin {} used by {}'.format(pin, ', '.join(names))
+        for pin, names in sorted(used.items())
+        if len(names) > 1
+    ]
+
+    if conflicts:
+        error_msg = 'Invalid pin configuration: {}'.format('; '.join(conflicts))
+        raise PinConflictError(error_msg)
+
+
+def check_config(config, section='PINS'):
+    """
+    Checks the pins of a configparser.ConfigParser loaded from
+    config.ini, so that a conflict is found at start up instead of
+    when the second driver claims the pin.
+
+    Returns
+    -------
+    pins : dict
+        function name -> BCM pin number, with the names in upper case
+    """
+
+    pins = {name.upper(): int(value) for name, value in config[section].items()}
+    check_pins(pins)
+
+    return pins
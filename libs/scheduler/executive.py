@@ -0,0 +1,422 @@
+import enum
+import math
+import threading
+import time
+
+from .stats import Window
+
+
+class Scheduling(enum.Enum):
+    EDF = 0  # earliest absolute deadline first
+    PRIORITY = 1  # highest priority first (rate monotonic if priority follows rate)
+
+
+class Task:
+    """
+    Periodic task run by an Executive: function() is released every
+    period seconds and should complete within deadline seconds of its
+    release.
+
+    ...
+
+    Attributes
+    ----------
+    name : str
+    rate : float
+        releases per second
+    period : float
+    deadline : float
+        relative deadline in seconds
+    priority : int
+        higher runs first with Scheduling.PRIORITY
+    worker : int
+        index of the thread that runs the task
+    """
+
+    def __init__(self, name, function, rate, priority=0, deadline=None, worker=0, history=1000):
+
+        if rate <= 0:
+            error_msg = 'The rate of task {} must be positive, got {}'.format(name, rate)
+            raise ValueError(error_msg)
+
+        self.name = name
+        self.function = function
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.deadline = deadline if deadline is not None else self.period
+        self.priority = priority
+        self.worker = worker
+
+        self._history = history
+        self.release = None  # time of the pending release
+        self.reset_stats()
+
+    def reset_stats(self):
+
+        self._latency = Window(self._history)  # start - release of the jobs
+        self._response = Window(self._history)  # end - release of the jobs
+        self._runs = 0
+        self._overruns = 0
+        self._skipped = 0
+        self._busy = 0.0
+
+    def _record(self, start, end):
+
+        response = end - self.release
+        self._latency.add(start - self.release)
+        self._response.add(response)
+        self._busy += end - start
+        self._runs += 1
+
+        if response > self.deadline:
+            self._overruns += 1
+
+        # next release, dropping those already missed
+        self.release += self.period
+        if end >= self.release + self.period:
+            missed = math.floor((end - self.release) / self.period)
+            self.release += missed * self.period
+            self._skipped += missed
+
+    def get_stats(self, elapsed):
+        """
+        Returns the statistics of the task.
+
+        Parameters
+        ----------
+        elapsed : float
+            seconds the executive has run
+
+        Returns
+        -------
+        stats : dict
+            runs: jobs completed so far
+            rate: achieved jobs per second
+            overruns: jobs completed after their deadline
+            skipped: releases dropped because the previous job was late
+            latency_mean, latency_p99, latency_max: delay from the
+                release to the start of the jobs, in seconds
+            response_mean, response_p99, response_max: delay from the
+                release to the end of the jobs, in seconds
+            utilization: fraction of the time spent running the task
+            (means and p99 over the last jobs)
+        """
+
+        elapsed = max(elapsed, 1e-9)
+        stats = {
+            'runs': self._runs,
+            'rate': self._runs / elapsed,
+            'overruns': self._overruns,
+            'skipped': self._skipped,
+            'utilization': self._busy / elapsed,
+        }
+        stats.update(self._latency.summary('latency'))
+        stats.update(self._response.summary('response'))
+
+        return stats
+
+
+class Executive:
+    """
+    Runs periodic tasks, each at its own rate, on one or more threads.
+
+    Each task is bound to a worker thread; a worker runs the released
+    jobs of its tasks one at a time, picking the job with the earliest
+    absolute deadline (Scheduling.EDF) or the task with the highest
+    priority (Scheduling.PRIORITY), and sleeps until the next release
+    when none is ready. Python threads cannot be preempted, so a job
+    always runs to completion: a task that blocks for long (e.g. a
+    ranging measurement) delays the other tasks of its worker by as much
+    and belongs on a worker of its own. Blocking I2C calls release the
+    GIL, so the workers do overlap while waiting for the bus.
+
+    Releases are absolute, release + k * period, so the rates do not
+    drift; a job that completes after its deadline is an overrun, and
+    the releases it has made the task miss are dropped.
+
+    The clock and the sleep function can be replaced by simulated ones;
+    run() then runs every task on the calling thread, with no real time
+    passing, which makes the schedule reproducible.
+
+    ...
+
+    Methods
+    -------
+    add(name, function, rate, priority=0, deadline=None, worker=0)
+        registers a periodic task.
+
+    run(duration)
+        runs every task on the calling thread for duration seconds.
+
+    start()
+        starts a thread per worker.
+
+    stop()
+        stops the worker threads.
+
+    get_stats()
+        returns the statistics of each task.
+    """
+
+    def __init__(self, scheduling=Scheduling.EDF, clock=time.monotonic, sleep=time.sleep):
+        """
+        Parameters
+        ----------
+        scheduling : Scheduling
+            how a worker picks the next job among the released ones
+        clock, sleep : callable
+            time.monotonic() and time.sleep() or their simulated
+            equivalents
+        """
+
+        self.scheduling = scheduling
+        self.clock = clock
+        self.sleep = sleep
+
+        self.tasks = {}
+
+        self.error = None  # exception that stopped a worker
+        self._running = False
+        self._stopping = threading.Event()  # wakes up the sleeping workers
+        self._threads = []
+        self._start_time = None
+        self._stop_time = None
+
+    def add(self, name, function, rate, priority=0, deadline=None, worker=0):
+        """
+        Registers a periodic task, function() is called rate times per
+        second by the given worker.
+
+        Returns
+        -------
+        task : Task
+
+        Raises
+        ------
+        ValueError
+            if a task with the same name exists.
+        """
+
+        if name in self.tasks:
+            error_msg = 'A task named {} already exists'.format(name)
+            raise ValueError(error_msg)
+
+        task = Task(name, function, rate, priority, deadline, worker)
+        self.tasks[name] = task
+
+        return task
+
+    def _pick(self, ready):
+        if self.scheduling == Scheduling.EDF:
+            return min(ready, key=lambda task: task.release + task.deadline)
+        return min(ready, key=lambda task: (-task.priority, task.release))
+
+    def _wait(self, seconds):
+        # time.sleep() cannot be interrupted, wait on the event instead so
+        # that stop() does not wait for the longest period
+        if self.sleep is time.sleep:
+            self._stopping.wait(seconds)
+        else:
+            self.sleep(seconds)
+
+    def _work(self, tasks, until=None):
+
+        clock = self.clock
+        while self._running:
+
+            now = clock()
+            if until is not None and now >= until:
+                break
+
+            ready = [task for task in tasks if task.release <= now]
+            if not ready:
+                # with no tasks, run() still lasts until the end
+                wakeup = min((task.release for task in tasks), default=until)
+                if wakeup is None:
+                    break
+                if until is not None:
+                    wakeup = min(wakeup, until)
+                self._wait(max(0.0, wakeup - now))
+                continue
+
+            task = self._pick(ready)
+            start = clock()
+            task.function()
+            task._record(start, clock())
+
+    def _release_all(self):
+        self._start_time = self.clock()
+        self._stop_time = None
+        for task in self.tasks.values():
+            task.release = self._start_time
+            task.reset_stats()
+
+    def run(self, duration):
+        """
+        Runs every task on the calling thread, whatever its worker, for
+        duration seconds of the clock.
+        """
+
+        self._release_all()
+        self._running = True
+        try:
+            self._work(list(self.tasks.values()), until=self._start_time + duration)
+        finally:
+            self._running = False
+            self._stop_time = self.clock()
+
+    def _worker(self, tasks):
+        try:
+            self._work(tasks)
+        except Exception as e:
+            self.error = e
+            self._running = False
+
+    def start(self):
+        """
+        Starts a thread per worker, running the tasks bound to it.
+        """
+
+        if self._threads:
+            return
+
+        self._release_all()
+        self._running = True
+        self._stopping.clear()
+
+        workers = {}
+        for task in self.tasks.values():
+            workers.setdefault(task.worker, []).append(task)
+
+        for worker in sorted(workers):
+            thread = threading.Thread(target=self._worker, args=(workers[worker],),
+                                      name='executive-{}'.format(worker), daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _shutdown(self):
+        self._running = False
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join()
+        if self._threads:
+            self._stop_time = self.clock()
+        self._threads = []
+
+    def stop(self):
+        """
+        Stops the worker threads, after the jobs they are running.
+
+        Raises
+        ------
+        Exception
+            the exception raised by a task, if any.
+        """
+
+        self._shutdown()
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def get_stats(self):
+        """
+        Returns the statistics of each task, see Task.get_stats().
+
+        Returns
+        -------
+        stats : dict
+            task name -> dict of statistics
+        """
+
+        if self._start_time is None:
+            return {name: task.get_stats(0.0) for name, task in self.tasks.items()}
+
+        end = self._stop_time if self._stop_time is not None else self.clock()
+        return {name: task.get_stats(end - self._start_time) for name, task in self.tasks.items()}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+
+        if exc_type is not None:
+            self._shutdown()
+            return False
+
+        self.stop()
+
+        return True
+
+
+# ----------------------------------- main ----------------------------------- #
+
+if __name__ == '__main__':
+
+    # Schedules the devices of the robot with simulated durations: the
+    # wheels at 100 Hz, the MPU6050 at 400 Hz, the VL53L0 at 30 Hz and the
+    # PiSugar3 at 1 Hz. Runs them first on a simulated clock on a single
+    # thread, with each scheduling, then on real threads with the ranging
+    # on a worker of its own, and prints the latency and the overruns of
+    # each task. Run from the root of the repository with
+    # python -m libs.scheduler.executive
+
+    import random
+
+    DURATION = 5.0  # s
+
+    class SimulatedClock:
+        """
+        Clock advanced by sleep() only, the simulated devices sleep for
+        the time they take.
+        """
+
+        def __init__(self):
+            self.time = 0.0
+
+        def monotonic(self):
+            return self.time
+
+        def sleep(self, dt):
+            self.time += dt
+
+    # name -> (rate Hz, priority, duration range of a call in s)
+    DEVICES = {
+        'wheels': (100, 3, (0.0010, 0.0020)),
+        'imu': (400, 2, (0.0003, 0.0005)),
+        'tof': (30, 1, (0.0040, 0.0120)),
+        'battery': (1, 0, (0.0040, 0.0060)),
+    }
+
+    def device(sleep, durations, rng):
+        # blocking I2C transfer: sleeping releases the GIL like the bus does
+        return lambda: sleep(rng.uniform(*durations))
+
+    def report(title, executive):
+        print(title)
+        print('  {:<10}{:>8}{:>10}{:>10}{:>16}{:>16}{:>16}'.format(
+            'task', 'runs', 'overruns', 'skipped', 'latency p99', 'latency max', 'response max'))
+        for name, stats in executive.get_stats().items():
+            print('  {:<10}{:>8}{:>10}{:>10}{:>13.3f} ms{:>13.3f} ms{:>13.3f} ms'.format(
+                name, stats['runs'], stats['overruns'], stats['skipped'],
+                stats['latency_p99'] * 1e3, stats['latency_max'] * 1e3, stats['response_max'] * 1e3))
+        print()
+
+    for scheduling in Scheduling:
+        clock = SimulatedClock()
+        rng = random.Random(0)
+        executive = Executive(scheduling, clock=clock.monotonic, sleep=clock.sleep)
+        for name, (rate, priority, durations) in DEVICES.items():
+            executive.add(name, device(clock.sleep, durations, rng), rate, priority)
+        executive.run(DURATION)
+        report('simulated clock, one thread, {}'.format(scheduling.name), executive)
+
+    rng = random.Random(0)
+    executive = Executive(Scheduling.EDF)
+    for name, (rate, priority, durations) in DEVICES.items():
+        executive.add(name, device(time.sleep, durations, rng), rate, priority,
+                      worker=1 if name == 'tof' else 0)
+    with executive:
+        time.sleep(DURATION)
+    report('real clock, ranging on its own thread, EDF', executive)
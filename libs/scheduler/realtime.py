@@ -0,0 +1,334 @@
+import ctypes
+import ctypes.util
+import gc
+import logging
+import os
+import time
+
+# ---------------------------------- logging --------------------------------- #
+
+# create a logger instance
+logger = logging.getLogger('REALTIME')
+logger.setLevel(logging.INFO)
+
+# same as the hardlibs, the records go to the handlers of MAIN
+parent_logger = logging.getLogger('MAIN')
+logger.parent = parent_logger
+
+
+# flags of mlockall(), from <sys/mman.h>
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+
+def isolated_cpus():
+    """
+    Returns the cores removed from the scheduler at boot (isolcpus= on
+    the kernel command line), an empty list if there are none.
+    """
+
+    try:
+        with open('/sys/devices/system/cpu/isolated') as f:
+            text = f.read().strip()
+    except OSError:
+        return []
+
+    cpus = []
+    for part in filter(None, text.split(',')):
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+class RealtimeProfile:
+    """
+    Real-time execution profile for the process running the control loop.
+
+    A Python process scheduled by CFS is preempted by any other process,
+    migrated between cores, page faulted back in after its memory has
+    been swapped or reclaimed, and paused by the garbage collector
+    whenever enough objects have been allocated: each shows up as a late
+    iteration and a stutter of the motors. apply() turns on, as far as
+    the privileges allow:
+
+        affinity   the process runs on a core isolated from the rest of
+                   the system (isolcpus=), or on the given cores
+        fifo       SCHED_FIFO at the given priority, the process is only
+                   preempted by higher real-time priorities
+        mlock      mlockall(MCL_CURRENT | MCL_FUTURE), no page faults
+        gc         gc.freeze() moves the objects allocated so far out of
+                   the collected generations and the automatic
+                   collections are disabled; collect_in_slack() runs them
+                   when the loop has time to spare
+
+    Call it after the initialization, from the thread of the loop (the
+    scheduling applies to the calling thread and to the threads it starts
+    afterwards). A setting that fails (no CAP_SYS_NICE, low
+    RLIMIT_MEMLOCK, no isolated core, not Linux) is logged and skipped,
+    the others are still applied; restore() undoes what was applied.
+
+    ...
+
+    Attributes
+    ----------
+    status : dict
+        setting -> 'applied' or the reason it was not, filled by apply()
+    """
+
+    SETTINGS = ('affinity', 'fifo', 'mlock', 'gc')
+
+    def __init__(self, priority=50, cpus=None,
+                 affinity=True, fifo=True, mlock=True, freeze_gc=True,
+                 slack_fraction=0.5):
+        """
+        Parameters
+        ----------
+        priority : int
+            SCHED_FIFO priority, 1 to 99
+        cpus : list
+            cores to run on, the isolated ones if None
+        affinity, fifo, mlock, freeze_gc : bool
+            settings to apply
+        slack_fraction : float
+            share of the slack that collect_in_slack() may use
+        """
+
+        self.priority = priority
+        self.cpus = cpus
+        self.enabled = {'affinity': affinity, 'fifo': fifo, 'mlock': mlock, 'gc': freeze_gc}
+        self.slack_fraction = slack_fraction
+
+        self.status = {}
+
+        self._previous_affinity = None
+        self._previous_policy = None
+        self._libc = None
+
+        # estimated duration of a collection of each generation, s
+        self._collect_cost = [0.0, 0.0, 0.0]
+        self.collections = [0, 0, 0]
+
+    # --------------------------------- settings --------------------------------- #
+
+    def _apply_affinity(self):
+        cpus = self.cpus if self.cpus is not None else isolated_cpus()
+        if not cpus:
+            return 'no isolated core, boot with isolcpus= or pass cpus'
+        self._previous_affinity = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, cpus)
+        return 'applied'
+
+    def _apply_fifo(self):
+        self._previous_policy = (os.sched_getscheduler(0), os.sched_getparam(0))
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))
+        return 'applied'
+
+    def _mlockall(self, flags):
+        if self._libc is None:
+            self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if flags:
+            result = self._libc.mlockall(flags)
+        else:
+            result = self._libc.munlockall()
+        if result != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def _apply_mlock(self):
+        self._mlockall(MCL_CURRENT | MCL_FUTURE)
+        return 'applied'
+
+    def _apply_gc(self):
+        # a full collection of the whole heap bounds the cost of the
+        # later ones, which only traverse what is allocated after freeze()
+        start = time.perf_counter()
+        gc.collect()
+        self._collect_cost = [0.0, 0.0, time.perf_counter() - start]
+        gc.freeze()
+        gc.disable()
+        return 'applied'
+
+    def apply(self):
+        """
+        Applies the enabled settings, skipping those that fail.
+
+        Returns
+        -------
+        status : dict
+            setting -> 'applied' or the reason it was not
+        """
+
+        for name in self.SETTINGS:
+            if not self.enabled[name]:
+                self.status[name] = 'disabled'
+                continue
+            try:
+                self.status[name] = getattr(self, '_apply_' + name)()
+            except (OSError, AttributeError) as e:
+                # AttributeError: os.sched_* do not exist outside Linux
+                self.status[name] = 'not available: {}'.format(e)
+            if self.status[name] == 'applied':
+                logger.info('Realtime setting {} applied'.format(name))
+            else:
+                logger.warning('Realtime setting {} skipped, {}'.format(name, self.status[name]))
+
+        return self.status
+
+    def restore(self):
+        """
+        Undoes the settings applied by apply().
+        """
+
+        if self.status.get('gc') == 'applied':
+            gc.enable()
+            gc.unfreeze()
+        if self.status.get('mlock') == 'applied':
+            self._mlockall(0)
+        if self.status.get('fifo') == 'applied':
+            policy, param = self._previous_policy
+            os.sched_setscheduler(0, policy, param)
+        if self.status.get('affinity') == 'applied':
+            os.sched_setaffinity(0, self._previous_affinity)
+
+        self.status = {}
+
+    def report(self):
+        """
+        Returns the status of each setting, one per line.
+        """
+        return '\n'.join('{:<10}{}'.format(name, self.status.get(name, 'not applied'))
+                         for name in self.SETTINGS)
+
+    # ----------------------------- garbage collection --------------------------- #
+
+    def collect_in_slack(self, slack):
+        """
+        Runs the collection that is due, if it fits in the slack: pass it
+        as on_slack to RateScheduler. Only the oldest due generation runs,
+        and only if its last duration fits in slack_fraction of the
+        slack; the young generations run once to measure them, the full
+        collection starts from the duration of the one done by apply().
+        The estimate of a generation that does not fit decays at each
+        call, so that it runs eventually and the garbage stays bounded.
+
+        Parameters
+        ----------
+        slack : float
+            seconds left until the next deadline
+        """
+
+        if self.status.get('gc') != 'applied':
+            return
+
+        counts = gc.get_count()
+        thresholds = gc.get_threshold()
+        budget = slack * self.slack_fraction
+
+        for generation in (2, 1, 0):
+            if counts[generation] < thresholds[generation]:
+                continue
+            if self._collect_cost[generation] > budget:
+                self._collect_cost[generation] *= 0.99
+                continue
+
+            start = time.perf_counter()
+            gc.collect(generation)
+            cost = time.perf_counter() - start
+
+            # the worst recent duration, forgotten slowly
+            self._collect_cost[generation] = max(cost, 0.9 * self._collect_cost[generation])
+            self.collections[generation] += 1
+            return
+
+
+# ----------------------------------- main ----------------------------------- #
+
+if __name__ == '__main__':
+
+    # Runs a 500 Hz loop that allocates like the control loop does (plus
+    # some reference cycles) over a large long-lived heap, turning on one
+    # setting of the profile at a time, and prints the worst delay from
+    # each deadline to the end of the iteration. Run from the root of the
+    # repository with python -m libs.scheduler.realtime (as root, or with
+    # CAP_SYS_NICE and CAP_IPC_LOCK, for SCHED_FIFO and mlockall)
+
+    from .scheduler import RateScheduler
+
+    RATE = 500  # Hz
+    DURATION = 4.0  # s
+
+    # long-lived objects, as the drivers and the configuration of the
+    # robot: a full collection has to traverse them
+    heap = [{'sample': [i, float(i)]} for i in range(50_000)]
+
+    log = []  # grows during the run, as the telemetry does
+
+    def iteration():
+        # readings and a reference cycle, as callbacks and closures create
+        readings = [(i, i * 0.5, str(i)) for i in range(50)]
+        node = {'readings': readings}
+        node['self'] = node
+        log.append([{'t': time.monotonic(), 'reading': r} for r in readings[:20]])
+        return sum(r[1] for r in readings)
+
+    pauses = []  # duration of each collection
+
+    def on_gc(phase, info, start=[0.0]):
+        if phase == 'start':
+            start[0] = time.perf_counter()
+        else:
+            pauses.append(time.perf_counter() - start[0])
+
+    def run(**settings):
+
+        profile = RealtimeProfile(**settings)
+        status = dict(profile.apply())
+
+        scheduler = RateScheduler(RATE, on_slack=profile.collect_in_slack)
+        delays = []
+        pauses.clear()
+        gc.callbacks.append(on_gc)
+        try:
+            for i in scheduler:
+                if i >= DURATION * RATE:
+                    break
+                iteration()
+                delays.append(time.monotonic() - scheduler.deadline)
+        finally:
+            gc.callbacks.remove(on_gc)
+            profile.restore()
+            log.clear()
+
+        delays.sort()
+        return delays, list(pauses), status, profile.collections
+
+    configurations = (
+        ('plain', {}),
+        ('gc', {'freeze_gc': True}),
+        ('gc, mlock', {'freeze_gc': True, 'mlock': True}),
+        ('gc, mlock, affinity', {'freeze_gc': True, 'mlock': True, 'affinity': True}),
+        ('all', {'freeze_gc': True, 'mlock': True, 'affinity': True, 'fifo': True}),
+    )
+
+    results = []
+    for name, enabled in configurations:
+        settings = {'affinity': False, 'fifo': False, 'mlock': False, 'freeze_gc': False}
+        settings.update(enabled)
+        results.append((name,) + run(**settings))
+
+    print('{} Hz for {} s, delay from the deadline to the end of the iteration\n'.format(RATE, DURATION))
+    print('{:<24}{:>12}{:>12}{:>12}{:>10}{:>12}{:>16}'.format(
+        'settings', 'p50', 'p99.9', 'max', 'overruns', 'gc runs', 'gc max pause'))
+    for name, delays, gc_pauses, status, collections in results:
+        print('{:<24}{:>9.3f} ms{:>9.3f} ms{:>9.3f} ms{:>10}{:>12}{:>13.3f} ms'.format(
+            name, delays[len(delays) // 2] * 1e3, delays[int(0.999 * len(delays))] * 1e3,
+            delays[-1] * 1e3, sum(delay > 1 / RATE for delay in delays),
+            len(gc_pauses), max(gc_pauses, default=0.0) * 1e3))
+
+    print('\nstatus of the settings:')
+    for setting, state in results[-1][3].items():
+        print('  {:<10}{}'.format(setting, state))
+    print('collections in slack (gen 0, 1, 2): {}'.format(results[-1][4]))
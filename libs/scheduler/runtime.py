@@ -0,0 +1,583 @@
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+import math
+
+from .stats import Window
+
+
+class Channel:
+    """
+    Latest-value channel between a producer and its readers: publish()
+    overwrites the value, latest() returns the last one without waiting.
+    Readers that do want every value await next().
+
+    A channel belongs to the event loop of the Runtime, publish() and
+    next() must be called from its coroutines.
+
+    ...
+
+    Attributes
+    ----------
+    name : str
+    value
+        last published value, default until the first publish()
+    timestamp : float
+        loop time of the last publish(), None before the first one
+    sequence : int
+        values published so far
+    """
+
+    def __init__(self, name, default=None):
+
+        self.name = name
+        self.value = default
+        self.timestamp = None
+        self.sequence = 0
+
+        self._waiters = []
+
+    def publish(self, value, timestamp):
+        """
+        Stores value as the latest one and wakes up the readers waiting
+        in next().
+        """
+
+        self.value = value
+        self.timestamp = timestamp
+        self.sequence += 1
+
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(value)
+
+    def latest(self):
+        """
+        Returns the last published value, never waits.
+        """
+        return self.value
+
+    def age(self, now):
+        """
+        Returns the seconds elapsed since the last publish(), None if
+        nothing has been published.
+        """
+        if self.timestamp is None:
+            return None
+        return now - self.timestamp
+
+    async def next(self):
+        """
+        Waits for the next published value and returns it.
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        return await waiter
+
+
+class AsyncDevice:
+    """
+    Asynchronous wrapper of a blocking driver: its methods run in an
+    executor, by default a thread of its own, so that awaiting them never
+    blocks the event loop. All the calls to a driver go through the same
+    executor, so it is never called by two threads at once.
+
+    The subclasses expose the methods of the drivers of the robot.
+
+    ...
+
+    Attributes
+    ----------
+    driver
+        the wrapped driver
+    executor : concurrent.futures.Executor
+    """
+
+    def __init__(self, driver, executor=None):
+        """
+        Parameters
+        ----------
+        driver
+            blocking driver, e.g. an MPU6050
+        executor : concurrent.futures.Executor
+            where the methods run, a single thread if None
+        """
+
+        self.driver = driver
+
+        self._own_executor = executor is None
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                1, thread_name_prefix=type(driver).__name__)
+        self.executor = executor
+
+    async def call(self, method, *args):
+        """
+        Runs driver.method(*args) in the executor and returns its result.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(getattr(self.driver, method), *args))
+
+    def close(self):
+        """
+        Waits for the running call and frees the executor if the wrapper
+        created it, the driver is left open.
+        """
+        if self._own_executor:
+            self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+class AsyncMPU6050(AsyncDevice):
+    """
+    MPU6050 whose reads do not block the event loop.
+    """
+
+    async def read(self):
+        """
+        See MPU6050.read().
+        """
+        return await self.call('read')
+
+
+class AsyncVL53L0(AsyncDevice):
+    """
+    VL53L0 whose ranging does not block the event loop.
+    """
+
+    async def read(self):
+        """
+        See VL53L0.read().
+        """
+        return await self.call('read')
+
+
+class AsyncPiSugar3(AsyncDevice):
+    """
+    PiSugar3 whose queries do not block the event loop.
+    """
+
+    async def get_percent(self):
+        return await self.call('get_percent')
+
+    async def get_voltage(self):
+        return await self.call('get_voltage')
+
+    async def get_current(self):
+        return await self.call('get_current')
+
+    async def is_charging(self):
+        return await self.call('is_charging')
+
+    async def is_power_plugged(self):
+        return await self.call('is_power_plugged')
+
+
+class _Periodic:
+    # statistics of a periodic coroutine, written by the coroutine only
+
+    def __init__(self, name, rate, history):
+
+        self.name = name
+        self.rate = rate
+        self.period = 1.0 / rate
+
+        self._lateness = Window(history)  # start - deadline of the iterations
+        self._response = Window(history)  # end - deadline of the iterations
+        self._overruns = 0
+
+    def record(self, lateness, response):
+        self._lateness.add(lateness)
+        self._response.add(response)
+
+    def get_stats(self, elapsed):
+
+        iterations = self._lateness.count
+        stats = {
+            'iterations': iterations,
+            'rate': iterations / max(elapsed, 1e-9),
+            'overruns': self._overruns,
+        }
+        stats.update(self._lateness.summary('jitter'))
+        stats.update(self._response.summary('response'))
+
+        return stats
+
+
+class Runtime:
+    """
+    asyncio runtime for the robot: the control coroutine never waits for
+    a device.
+
+    Every driver of the robot blocks on I2C (MPU6050.read(), VL53L0.read(),
+    PiSugar3.get_percent()), so calling them from the control loop delays
+    it by the time of the slowest transfer. Here each sensor has a
+    producer that calls its blocking read in a thread of its own (the
+    transfer releases the GIL), directly or through an AsyncDevice, and
+    publishes the result in a Channel; the control function runs on the
+    event loop at its own rate and reads the latest value of each
+    channel, however old.
+
+    Each producer and periodic function is scheduled on absolute
+    deadlines of the loop clock; missed deadlines are skipped.
+
+    Usage:
+
+        with AsyncMPU6050(MPU6050()) as mpu, AsyncVL53L0(VL53L0()) as tof:
+            runtime = Runtime()
+            imu = runtime.produce('imu', mpu.read, rate=200)
+            distance = runtime.produce('tof', tof.read, rate=30)
+            runtime.periodic('control', lambda: control(imu.latest(), distance.latest()), rate=100)
+            runtime.run()
+
+    ...
+
+    Methods
+    -------
+    channel(name, default=None)
+        returns the channel with the given name, creating it.
+
+    produce(name, read, rate, executor=None, default=None)
+        publishes read() in a channel rate times per second.
+
+    periodic(name, function, rate)
+        calls function() on the event loop rate times per second.
+
+    run(duration=None)
+        runs the event loop.
+
+    get_stats()
+        returns the timing of each producer and periodic function.
+    """
+
+    def __init__(self, history=1000):
+        """
+        Parameters
+        ----------
+        history : int
+            number of iterations kept to compute the percentiles
+        """
+
+        self._history = history
+
+        self.channels = {}
+        self._coroutines = []  # coroutine functions started by run()
+        self._periodics = {}
+        self._own_executors = []  # producers that get a thread of their own
+        self._executors = {}  # producer name -> executor created by run()
+
+        self._start_time = None
+        self._stop_time = None
+        self._loop = None
+
+    def channel(self, name, default=None):
+        """
+        Returns the channel with the given name, creating it.
+        """
+        if name not in self.channels:
+            self.channels[name] = Channel(name, default)
+        return self.channels[name]
+
+    def _register(self, name, rate):
+        if name in self._periodics:
+            error_msg = 'A producer or periodic function named {} already exists'.format(name)
+            raise ValueError(error_msg)
+        if rate <= 0:
+            error_msg = 'The rate of {} must be positive, got {}'.format(name, rate)
+            raise ValueError(error_msg)
+        periodic = _Periodic(name, rate, self._history)
+        self._periodics[name] = periodic
+        return periodic
+
+    async def _every(self, periodic, step):
+        # calls await step() on absolute deadlines
+
+        loop = asyncio.get_running_loop()
+        period = periodic.period
+        deadline = loop.time()
+
+        while True:
+            start = loop.time()
+            await step()
+            now = loop.time()
+            periodic.record(max(0.0, start - deadline), now - deadline)
+
+            deadline += period
+            if now > deadline:
+                # overrun: skip the deadlines already missed
+                periodic._overruns += 1
+                deadline += (math.floor((now - deadline) / period) + 1) * period
+            await asyncio.sleep(deadline - now)
+
+    def produce(self, name, read, rate, executor=None, default=None):
+        """
+        Calls read() rate times per second in an executor, or awaits it
+        if it is a coroutine function (e.g. AsyncMPU6050.read), and
+        publishes the result in the channel called name.
+
+        Parameters
+        ----------
+        name : str
+            name of the channel
+        read : callable
+            blocking read of a device, or a coroutine function
+        rate : float
+            reads per second
+        executor : concurrent.futures.Executor
+            where a blocking read() runs, by default a thread of its own.
+            Pass the same executor to the producers of a device so that
+            its driver is never called by two threads at once
+        default
+            value of the channel before the first read
+
+        Returns
+        -------
+        channel : Channel
+        """
+
+        periodic = self._register(name, rate)
+        channel = self.channel(name, default)
+
+        if inspect.iscoroutinefunction(read):
+            async def step():
+                value = await read()
+                channel.publish(value, asyncio.get_running_loop().time())
+        else:
+            if executor is None:
+                self._own_executors.append(name)
+
+            async def step():
+                loop = asyncio.get_running_loop()
+                value = await loop.run_in_executor(executor or self._executors[name], read)
+                channel.publish(value, loop.time())
+
+        self._coroutines.append(lambda: self._every(periodic, step))
+
+        return channel
+
+    def periodic(self, name, function, rate):
+        """
+        Calls function() on the event loop rate times per second. It may
+        be a coroutine function; a plain function must not block, it
+        delays every producer.
+        """
+
+        periodic = self._register(name, rate)
+
+        if inspect.iscoroutinefunction(function):
+            step = function
+        else:
+            async def step():
+                function()
+
+        self._coroutines.append(lambda: self._every(periodic, step))
+
+    def time(self):
+        """
+        Returns the time of the event loop clock, e.g. to compute the age
+        of a channel.
+        """
+        return self._loop.time()
+
+    async def main(self, duration=None):
+        """
+        Runs the producers and the periodic functions, for duration
+        seconds or until one of them raises. With none registered it
+        only waits for duration, and returns at once if it is None.
+
+        Raises
+        ------
+        Exception
+            the exception raised by a producer or a periodic function.
+        """
+
+        self._loop = asyncio.get_running_loop()
+        self._start_time = self._loop.time()
+        self._stop_time = None
+
+        for name in self._own_executors:
+            if name not in self._executors:
+                self._executors[name] = concurrent.futures.ThreadPoolExecutor(
+                    1, thread_name_prefix=name)
+
+        tasks = [asyncio.ensure_future(coroutine()) for coroutine in self._coroutines]
+        try:
+            if not tasks:
+                # asyncio.wait() rejects an empty set: with nothing to run
+                # only wait for the duration
+                if duration is not None:
+                    await asyncio.sleep(duration)
+                return
+            done, _ = await asyncio.wait(tasks, timeout=duration,
+                                         return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._stop_time = self._loop.time()
+
+    def run(self, duration=None):
+        """
+        Runs the event loop, see main(), then waits for the reads still
+        running in the executors.
+        """
+        try:
+            asyncio.run(self.main(duration))
+        finally:
+            for executor in self._executors.values():
+                executor.shutdown(wait=True)
+            self._executors = {}
+
+    def get_stats(self):
+        """
+        Returns the timing of each producer and periodic function.
+
+        Returns
+        -------
+        stats : dict
+            name -> dict of
+                iterations: iterations run so far
+                rate: achieved iterations per second
+                overruns: iterations that ended after the next deadline
+                jitter_mean, jitter_p99, jitter_max: delay of the
+                    start of the iterations with respect to their
+                    deadlines, in seconds
+                response_mean, response_p99, response_max: delay of
+                    the end of the iterations with respect to their
+                    deadlines, in seconds
+                (means and p99 over the last iterations)
+        """
+
+        if self._start_time is None:
+            elapsed = 0.0
+        else:
+            end = self._stop_time if self._stop_time is not None else self._loop.time()
+            elapsed = end - self._start_time
+
+        return {name: periodic.get_stats(elapsed) for name, periodic in self._periodics.items()}
+
+
+# ----------------------------------- main ----------------------------------- #
+
+if __name__ == '__main__':
+
+    # Runs a 100 Hz control loop with simulated devices (each read sleeps
+    # for the time of its transfer, releasing the GIL as the bus does): the
+    # MPU6050 at 200 Hz, the PiSugar3 at 1 Hz and, optionally, the VL53L0 at
+    # 30 Hz, whose ranging blocks for 5 to 30 ms. The loop of main.py reads
+    # the devices inline, the runtime reads them in producers through the
+    # async wrappers of the drivers; prints the delay from each control
+    # deadline to the end of the control step.
+    # Run from the root of the repository with python -m libs.scheduler.runtime
+
+    import random
+    import threading
+    import time
+
+    from .scheduler import RateScheduler
+
+    RATE = 100  # Hz
+    DURATION = 3.0  # s
+
+    class Device:
+        """
+        Blocking device: read() takes a random time and returns it, the
+        other methods of the drivers do the same.
+        """
+
+        def __init__(self, durations, seed):
+            self.durations = durations
+            self._rng = random.Random(seed)
+            self._lock = threading.Lock()  # a driver is not thread safe
+
+        def read(self):
+            with self._lock:
+                duration = self._rng.uniform(*self.durations)
+                time.sleep(duration)
+                return duration
+
+        def get_percent(self):
+            return self.read()
+
+    def control():
+        # filter and PID of both wheels, about 0.3 ms of Python
+        end = time.perf_counter() + 0.0003
+        while time.perf_counter() < end:
+            pass
+
+    def percentiles(delays):
+        delays = sorted(delays)
+        return (sum(delays) / len(delays),
+                delays[min(len(delays) - 1, int(0.99 * len(delays)))],
+                delays[-1])
+
+    def devices():
+        return (Device((0.0003, 0.0005), 0),  # MPU6050
+                Device((0.0050, 0.0300), 1),  # VL53L0
+                Device((0.0040, 0.0060), 2))  # PiSugar3
+
+    def run_inline(ranging):
+        imu, tof, battery = devices()
+        scheduler = RateScheduler(RATE)
+        delays = []
+        for i in scheduler:
+            deadline = scheduler.deadline
+            if i >= DURATION * RATE:
+                break
+            imu.read()
+            imu.read()
+            if ranging and i % round(RATE / 30) == 0:
+                tof.read()
+            if i % RATE == 0:
+                battery.read()
+            control()
+            delays.append(time.monotonic() - deadline)
+        return delays
+
+    def run_runtime(ranging):
+        imu, tof, battery = devices()
+        with AsyncMPU6050(imu) as imu, AsyncVL53L0(tof) as tof, AsyncPiSugar3(battery) as battery:
+
+            runtime = Runtime()
+            channels = [runtime.produce('imu', imu.read, 200),
+                        runtime.produce('battery', battery.get_percent, 1)]
+            if ranging:
+                channels.append(runtime.produce('tof', tof.read, 30))
+
+            def step():
+                # the latest readings, however old, never a wait
+                for channel in channels:
+                    channel.latest()
+                control()
+
+            runtime.periodic('control', step, RATE)
+            runtime.run(DURATION)
+
+        return runtime.get_stats()
+
+    print('{} Hz control loop for {} s, delay from the deadline to the end of the control step\n'.format(
+        RATE, DURATION))
+    print('{:<34}{:>12}{:>12}{:>12}'.format('', 'mean', 'p99', 'max'))
+
+    for ranging in (False, True):
+        load = 'with ToF' if ranging else 'without ToF'
+
+        mean, p99, worst = percentiles(run_inline(ranging))
+        print('{:<34}{:>9.3f} ms{:>9.3f} ms{:>9.3f} ms'.format(
+            'inline reads, ' + load, mean * 1e3, p99 * 1e3, worst * 1e3))
+
+        stats = run_runtime(ranging)
+        mean, p99, worst = (stats['control']['response_' + key] for key in ('mean', 'p99', 'max'))
+        print('{:<34}{:>9.3f} ms{:>9.3f} ms{:>9.3f} ms'.format(
+            'runtime, ' + load, mean * 1e3, p99 * 1e3, worst * 1e3))
+        print('  ' + ', '.join('{} {:.1f} Hz'.format(name, s['rate']) for name, s in stats.items()))
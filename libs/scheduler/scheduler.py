@@ -0,0 +1,288 @@
+import enum
+import math
+import time
+
+from .stats import Window
+
+
+class Policy(enum.Enum):
+    SKIP = 0  # after an overrun, drop the deadlines already missed
+    CATCH_UP = 1  # after an overrun, run the missed iterations back to back
+
+
+class RateScheduler:
+    """
+    Paces a loop at a fixed rate.
+
+    The iterations are scheduled on absolute deadlines of a monotonic
+    clock, start + k * period, so the rate does not drift with the time
+    spent in each iteration or with the delay of each wakeup. An
+    iteration that ends after the next deadline is an overrun: with
+    Policy.SKIP the deadlines already missed are dropped and the loop
+    keeps its phase, with Policy.CATCH_UP the missed iterations run back
+    to back (up to max_backlog of them) so that the number of iterations
+    keeps matching the elapsed time.
+
+    time.sleep() wakes up late by up to a few hundred microseconds; spin
+    seconds before each deadline the scheduler stops sleeping and busy
+    waits instead, trading CPU for a more precise wakeup.
+
+    on_slack, if given, is called before sleeping with the seconds left
+    until the next deadline, to do deferrable work (e.g. collect garbage,
+    see RealtimeProfile.collect_in_slack()) when it cannot delay the loop.
+
+    Usage:
+
+        scheduler = RateScheduler(100)
+        while True:
+            ...  # work
+            scheduler.wait()
+
+    or equivalently `for _ in scheduler: ...`.
+
+    ...
+
+    Methods
+    -------
+    start()
+        sets the first deadline, called by the first wait() otherwise.
+
+    wait()
+        sleeps until the next deadline.
+
+    get_stats()
+        returns the achieved rate, the overruns and the timing of the
+        iterations.
+
+    reset()
+        forgets the deadlines and the statistics.
+    """
+
+    def __init__(self, rate, policy=Policy.SKIP, max_backlog=10, spin=0.0, history=1000,
+                 on_slack=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        Parameters
+        ----------
+        rate : float
+            iterations per second
+        policy : Policy
+            what to do after an overrun
+        max_backlog : int
+            with Policy.CATCH_UP, most iterations run back to back, the
+            older missed deadlines are dropped
+        spin : float
+            seconds before each deadline spent busy waiting
+        history : int
+            number of iterations kept to compute the percentiles
+        on_slack : callable
+            called before sleeping with the seconds left until the next
+            deadline, slack -> None
+        clock, sleep : callable
+            time.monotonic() and time.sleep() or their simulated
+            equivalents
+        """
+
+        if rate <= 0:
+            error_msg = 'The rate must be positive, got {}'.format(rate)
+            raise ValueError(error_msg)
+
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.policy = policy
+        self.max_backlog = max_backlog
+        self.spin = spin
+        self.on_slack = on_slack
+        self.clock = clock
+        self.sleep = sleep
+
+        self._history = history
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the deadlines and the statistics, the next wait() starts
+        over.
+        """
+
+        self._start_time = None
+        self._deadline = None
+        self._wakeup = None  # when the current iteration started
+
+        # statistics
+        self._lateness = Window(self._history)  # wakeup delay of the iterations
+        self._work = Window(self._history)  # duration of the iterations
+        self._iterations = 0
+        self._overruns = 0
+        self._skipped = 0
+        self._busy = 0.0
+
+    def start(self):
+        """
+        Starts the schedule: the current time is the deadline of the first
+        iteration, which is running.
+        """
+        self._start_time = self._deadline = self._wakeup = self.clock()
+
+    @property
+    def deadline(self):
+        """
+        Deadline of the current iteration, None before start().
+        """
+        return self._deadline
+
+    def wait(self):
+        """
+        Ends the current iteration and sleeps until the deadline of the
+        next one (returns immediately if it has already passed).
+
+        Returns
+        -------
+        lateness : float
+            delay in seconds of the wakeup with respect to the deadline
+        """
+
+        if self._start_time is None:
+            self.start()
+
+        now = self.clock()
+        work = now - self._wakeup
+        self._work.add(work)
+        self._busy += work
+        self._iterations += 1
+
+        period = self.period
+        self._deadline += period
+
+        if now > self._deadline:
+            # overrun: the next deadline has already passed
+            self._overruns += 1
+            missed = math.floor((now - self._deadline) / period) + 1
+            if self.policy == Policy.SKIP:
+                skipped = missed
+            else:
+                skipped = max(0, missed - self.max_backlog)
+            self._deadline += skipped * period
+            self._skipped += skipped
+
+        # sleep, then busy wait the last spin seconds
+        remaining = self._deadline - self.clock()
+        if self.on_slack is not None and remaining > 0:
+            self.on_slack(remaining)
+            remaining = self._deadline - self.clock()
+        if remaining > self.spin:
+            self.sleep(remaining - self.spin)
+        if self.spin > 0:
+            while self.clock() < self._deadline:
+                pass
+
+        self._wakeup = self.clock()
+        lateness = max(0.0, self._wakeup - self._deadline)
+        self._lateness.add(lateness)
+
+        return lateness
+
+    def __iter__(self):
+        """
+        Yields the index of each iteration, forever, waiting for its
+        deadline in between.
+        """
+        self.start()
+        index = 0
+        while True:
+            yield index
+            self.wait()
+            index += 1
+
+    def get_stats(self):
+        """
+        Returns the statistics of the loop.
+
+        Returns
+        -------
+        stats : dict
+            iterations: iterations completed so far
+            rate: achieved iterations per second
+            overruns: iterations that ended after the next deadline
+            skipped: deadlines dropped without running an iteration
+            jitter_mean, jitter_p99, jitter_max: delay of the wakeups
+                with respect to their deadlines, in seconds
+            work_mean, work_p99, work_max: duration of the iterations, in
+                seconds
+            load: fraction of the time spent in the iterations
+            (means and p99 over the last iterations)
+        """
+
+        iterations = self._iterations
+        elapsed = max(self.clock() - self._start_time, 1e-9) if iterations else 1.0
+
+        stats = {
+            'iterations': iterations,
+            'rate': iterations / elapsed,
+            'overruns': self._overruns,
+            'skipped': self._skipped,
+            'load': self._busy / elapsed,
+        }
+        stats.update(self._lateness.summary('jitter'))
+        stats.update(self._work.summary('work'))
+
+        return stats
+
+
+# ----------------------------------- main ----------------------------------- #
+
+if __name__ == '__main__':
+
+    # Holds 100 Hz for a few seconds with iterations of random length, a
+    # few of which overrun, with the loop of main.py (sleep the rest of the
+    # interval, re-based on each start) and with each policy of the
+    # scheduler, then prints how many iterations each one ran and the
+    # timing of the wakeups. Run from the root of the repository with
+    # python -m libs.scheduler.scheduler
+
+    import random
+
+    RATE = 100  # Hz
+    DURATION = 3.0  # s
+
+    def work(rng):
+        # 2 to 6 ms, one iteration in a hundred takes 25 ms
+        duration = 0.025 if rng.random() < 0.01 else rng.uniform(0.002, 0.006)
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            pass
+
+    def run_rebased():
+        rng = random.Random(0)
+        interval = 1 / RATE
+        iterations = 0
+        start = time.monotonic()
+        while time.monotonic() - start < DURATION:
+            start_time = time.monotonic()
+            work(rng)
+            iterations += 1
+            time.sleep(max(0.0, interval - (time.monotonic() - start_time)))
+        return iterations
+
+    def run_scheduler(**kwargs):
+        rng = random.Random(0)
+        scheduler = RateScheduler(RATE, **kwargs)
+        start = time.monotonic()
+        for _ in scheduler:
+            if time.monotonic() - start >= DURATION:
+                break
+            work(rng)
+        return scheduler.get_stats()
+
+    print('{} Hz for {} s: {} iterations expected\n'.format(RATE, DURATION, int(RATE * DURATION)))
+    print('{:<24}{:>12}{:>10}{:>10}{:>14}{:>14}'.format(
+        'loop', 'iterations', 'overruns', 'skipped', 'jitter p99', 'jitter max'))
+
+    print('{:<24}{:>12}'.format('re-based sleep', run_rebased()))
+
+    for name, kwargs in (('scheduler, skip', {'policy': Policy.SKIP}),
+                         ('scheduler, catch up', {'policy': Policy.CATCH_UP}),
+                         ('scheduler, skip, spin', {'policy': Policy.SKIP, 'spin': 0.0005})):
+        stats = run_scheduler(**kwargs)
+        print('{:<24}{:>12}{:>10}{:>10}{:>11.3f} ms{:>11.3f} ms'.format(
+            name, stats['iterations'], stats['overruns'], stats['skipped'],
+            stats['jitter_p99'] * 1e3, stats['jitter_max'] * 1e3))
@@ -0,0 +1,60 @@
+class Window:
+    """
+    Statistics of a timing measured at every iteration of a loop (wakeup
+    delay, duration, ...): the mean and the 99th percentile over the last
+    size values, kept in a ring buffer allocated once, and the maximum
+    over all of them.
+
+    A single thread adds the values; another one may read the summary,
+    which is then approximate (a slot may be overwritten while sorted).
+
+    ...
+
+    Attributes
+    ----------
+    count : int
+        values added so far
+    max : float
+        largest value added so far
+    """
+
+    def __init__(self, size=1000):
+
+        self.size = size
+        self.reset()
+
+    def reset(self):
+
+        self._values = [0.0] * self.size
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, value):
+
+        self._values[self.count % self.size] = value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def summary(self, name):
+        """
+        Returns the statistics of the window.
+
+        Returns
+        -------
+        stats : dict
+            name_mean, name_p99: mean and 99th percentile of the last
+                values
+            name_max: largest value so far
+            all 0.0 if no value has been added
+        """
+
+        values = sorted(self._values[:min(self.count, self.size)])
+        if not values:
+            return {name + '_mean': 0.0, name + '_p99': 0.0, name + '_max': 0.0}
+
+        return {
+            name + '_mean': sum(values) / len(values),
+            name + '_p99': values[min(len(values) - 1, int(0.99 * len(values)))],
+            name + '_max': self.max,
+        }
@@ -1,4 +1,7 @@
-import time
+import sys
+
+from libs.scheduler.realtime import RealtimeProfile
+from libs.scheduler.scheduler import RateScheduler
 
 
 
@@ -21,12 +24,21 @@ command = [(10, 10), 10]
 # desired frequency in Hz
 frequency = 10
 
-# compute the time duration between iterations
-interval = 1 / frequency
+# opt-in realtime profile (python main.py --realtime): SCHED_FIFO, CPU
+# affinity, mlockall and a frozen heap, applied after the initialization;
+# the settings that need missing privileges are skipped
+profile = None
+if '--realtime' in sys.argv:
+    profile = RealtimeProfile()
+    profile.apply()
+    print(profile.report())
+
+# sleeps to absolute deadlines, an overrun skips the missed ones; with
+# the realtime profile the garbage is collected in the slack
+scheduler = RateScheduler(
+    frequency, on_slack=profile.collect_in_slack if profile is not None else None)
 while True:
 
-    start_time = time.perf_counter()
-
     if command:
 
         # read unicicle
@@ -39,9 +51,4 @@ while True:
         robot.update_motors(vl, vr)
 
 
-    elapsed_time = time.perf_counter() - start_time
-    sleep_time = interval - elapsed_time
-
-    #if sleep_time > 0:
-    #   time.sleep(sleep_time)
-    time.sleep(sleep_time)
+    scheduler.wait()
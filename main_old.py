@@ -78,6 +78,10 @@ def main():
     config = configparser.ConfigParser()
     config.read(CONFIG_PATH)
 
+    # fail now if two drivers would claim the same pin
+    from libs.pins.pins import check_config
+    check_config(config)
+
     IN_1_LEFT = int(config['PINS']['IN_1_LEFT'])
     IN_2_LEFT = int(config['PINS']['IN_2_LEFT'])
     IN_1_RIGHT = int(config['PINS']['IN_1_RIGHT'])
@@ -89,6 +93,8 @@ def main():
     RIGHT_ENC_CLK = int(config['PINS']['RIGHT_ENC_CLK'])
     RIGHT_ENC_DT = int(config['PINS']['RIGHT_ENC_DT'])
 
+    MIN_PULSE_WIDTH = float(config['ENCODER']['MIN_PULSE_WIDTH']) * 1e-6  # s
+
     # ----------------------------------- main ----------------------------------- #
 
     from datetime import datetime
@@ -101,19 +107,18 @@ def main():
 
     with Encoder(
         PIN_CLK=LEFT_ENC_CLK,
-        PIN_DT=LEFT_ENC_DT
+        PIN_DT=LEFT_ENC_DT,
+        min_pulse_width=MIN_PULSE_WIDTH
     ) as left_encoder, Encoder(
         PIN_CLK=RIGHT_ENC_CLK,
-        PIN_DT=RIGHT_ENC_DT
+        PIN_DT=RIGHT_ENC_DT,
+        min_pulse_width=MIN_PULSE_WIDTH
     ) as right_encoder, DRV8833(
         IN_1_A=IN_1_LEFT, IN_2_A=IN_2_LEFT,
-        IN_1_B=None, IN_2_B=None,
-        ENABLE=ENABLE
-    ) as left_motor, DRV8833(
-        IN_1_A=None, IN_2_A=None,
         IN_1_B=IN_1_RIGHT, IN_2_B=IN_2_RIGHT,
-        ENABLE=ENABLE
-    ) as right_motor:
+        ENABLE=ENABLE,
+        epsilon=0.5
+    ) as motor_driver:
 
         # motors
         target_speed = 1.0
@@ -121,12 +126,11 @@ def main():
         prev_right_speed = target_speed
         current_left_speed = prev_left_speed
         current_right_speed = prev_right_speed
-        left_motor.write('a', current_left_speed)
-        right_motor.write('b', current_right_speed)
+        motor_driver.write_both(current_left_speed, current_right_speed)
 
-        # PID
-        left_motor_PID = PID(0.08, 0.01, 0.01)
-        right_motor_PID = PID(0.08, 0.01, 0.01)
+        # PID, gains from the [PID] section of config.ini
+        left_motor_PID = PID.from_config(config)
+        right_motor_PID = PID.from_config(config)
 
         conversion_factor = 260
         poles = 1
@@ -167,8 +171,8 @@ def main():
         while time.time() < t_end:
 
             # get encoder ticks
-            left_encoder_val = left_encoder.read_count()  # encoder ticks in the sampling interval
-            right_encoder_val = right_encoder.read_count()
+            left_encoder_val, _, _ = left_encoder.take_delta()  # encoder ticks in the sampling interval
+            right_encoder_val, _, _ = right_encoder.take_delta()
             current_left_RPM = (left_encoder_val * 1 / sampling_rate * 60) / conversion_factor / poles
             current_right_RPM = (right_encoder_val * 1 / sampling_rate * 60) / conversion_factor / poles
 
@@ -185,8 +189,7 @@ def main():
                 prev_right_speed = current_right_speed
                 current_right_speed = right_motor_PID.update(current_right_speed, target_speed)
 
-                left_motor.write('a', current_left_speed)
-                right_motor.write('b', current_right_speed)
+                motor_driver.write_both(current_left_speed, current_right_speed)
 
             # log the results
             result = 'Left ticks[{:5.2f}]\tRPM[{:5.2f}]\tprev_speed[{:5.2f}]\tcurr_speed[{:5.2f}]\t'        \
@@ -197,9 +200,8 @@ def main():
             logger.debug(result)
             print(result)
 
-            # reset the encoders and repeat the loop
-            left_encoder.reset()
-            right_encoder.reset()
+            # repeat the loop, take_delta() already returns the ticks
+            # since the last iteration so the encoders are not reset
             time.sleep(sampling_rate)
 
     now_str = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
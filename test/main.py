@@ -1,4 +1,4 @@
-import time
+from libs.scheduler.scheduler import RateScheduler
 
 
 
@@ -20,12 +20,10 @@ def main():
     # desired frequency in Hz
     frequency = 10
 
-    # compute the time duration between iterations
-    interval = 1 / frequency
+    # sleeps to absolute deadlines, an overrun skips the missed ones
+    scheduler = RateScheduler(frequency)
     while True:
 
-        start_time = time.perf_counter()
-
         if command:
 
             # read unicicle
@@ -39,10 +37,4 @@ def main():
             robot.update_odometry()
 
 
-        elapsed_time = time.perf_counter() - start_time
-        sleep_time = interval - elapsed_time
-
-        #if sleep_time > 0:
-        #   time.sleep(sleep_time)
-        time.sleep(sleep_time)
-
+        scheduler.wait()
@@ -1,70 +1,823 @@
+from array import array
+import enum
 import math
+import time
 
+# NumPy is only needed to replay logs with Cobalt.replay()
+
+try:
+    import numpy as np
+except ImportError:  # not installed on the robot
+    np = None
+
+
+# ------------------------------- integrators -------------------------------- #
+
+class Integrator(enum.Enum):
+    EULER = 0  # moves along the old heading
+    MIDPOINT = 1  # moves along the heading halfway through the step (RK2)
+    ARC = 2  # moves along the circular arc the wheels describe (exact)
+
+
+# below this heading change the arc is computed with its Taylor expansion,
+# sin(h) / h loses precision as h goes to 0
+_SMALL_ANGLE = 1e-4
+
+
+def normalize_angle(theta):
+    """
+    Wraps an angle into (-pi, pi].
+    """
+    theta = math.fmod(theta, 2 * math.pi)
+    if theta <= -math.pi:
+        theta += 2 * math.pi
+    elif theta > math.pi:
+        theta -= 2 * math.pi
+    return theta
+
+
+def integrate(x, y, theta, distance, delta_theta, integrator=Integrator.ARC):
+    """
+    Moves a pose by the distance travelled by the center of the robot and
+    the change of heading measured over a step.
+
+    With constant wheel speeds over the step the robot moves along a
+    circular arc, which ARC follows exactly; EULER and MIDPOINT are its
+    first and second order approximations.
+
+    Returns
+    -------
+        tuple containing:
+            new x
+            new y
+            new theta, in (-pi, pi]
+    """
+
+    if integrator == Integrator.EULER:
+        heading = theta
+        chord = distance
+    else:
+        half = delta_theta / 2
+        heading = theta + half
+        if integrator == Integrator.MIDPOINT:
+            chord = distance
+        elif abs(half) < _SMALL_ANGLE:
+            chord = distance * (1 - half * half / 6)
+        else:
+            # chord of the arc of length distance and angle delta_theta
+            chord = distance * math.sin(half) / half
+
+    return (x + chord * math.cos(heading),
+            y + chord * math.sin(heading),
+            normalize_angle(theta + delta_theta))
+
+
+def integrate_batch(x, y, theta, distances, delta_thetas, integrator=Integrator.ARC):
+    """
+    Same as integrate() over a whole sequence of steps, in one vectorized
+    pass: the headings are the cumulative sum of the changes of heading,
+    the positions the cumulative sum of the displacements.
+
+    Parameters
+    ----------
+    x, y, theta : float
+        pose before the first step
+    distances : numpy.ndarray
+        distance travelled by the center of the robot at each step
+    delta_thetas : numpy.ndarray
+        change of heading at each step
+
+    Returns
+    -------
+        tuple containing:
+            x after each step, numpy.ndarray
+            y after each step, numpy.ndarray
+            theta after each step in (-pi, pi], numpy.ndarray
+
+    Raises
+    ------
+    ImportError
+        if NumPy is not installed.
+    """
+
+    if np is None:
+        raise ImportError('NumPy is not available, install it to integrate in batch')
+
+    distances = np.asarray(distances, dtype=float)
+    delta_thetas = np.asarray(delta_thetas, dtype=float)
+
+    # heading before and after each step, not wrapped
+    after = theta + np.cumsum(delta_thetas)
+    before = np.empty_like(after)
+    before[:1] = theta
+    before[1:] = after[:-1]
+
+    if integrator == Integrator.EULER:
+        heading = before
+        chord = distances
+    else:
+        half = delta_thetas / 2
+        heading = before + half
+        if integrator == Integrator.MIDPOINT:
+            chord = distances
+        else:
+            small = np.abs(half) < _SMALL_ANGLE
+            safe_half = np.where(small, 1.0, half)
+            chord = distances * np.where(small, 1 - half * half / 6, np.sin(safe_half) / safe_half)
+
+    xs = x + np.cumsum(chord * np.cos(heading))
+    ys = y + np.cumsum(chord * np.sin(heading))
+
+    # wrap into (-pi, pi] as normalize_angle()
+    thetas = np.fmod(after, 2 * np.pi)
+    thetas[thetas <= -np.pi] += 2 * np.pi
+    thetas[thetas > np.pi] -= 2 * np.pi
+
+    return xs, ys, thetas
+
+
+# ------------------------------- pose history ------------------------------- #
+
+def interpolate(pose_0, pose_1, s):
+    """
+    Interpolates between two poses on SE(2): the robot moves from pose_0
+    to pose_1 along the circular arc joining them (constant linear and
+    angular speed), s = 0 gives pose_0 and s = 1 gives pose_1.
+    """
+
+    x0, y0, theta0 = pose_0
+    x1, y1, theta1 = pose_1
+
+    # pose_1 in the frame of pose_0
+    c, s0 = math.cos(theta0), math.sin(theta0)
+    dx, dy = x1 - x0, y1 - y0
+    local_x = c * dx + s0 * dy
+    local_y = -s0 * dx + c * dy
+    delta_theta = normalize_angle(theta1 - theta0)
+
+    # logarithm: the twist that moves pose_0 into pose_1 in unit time
+    a, b = _arc_coefficients(delta_theta)
+    det = a * a + b * b
+    u_x = (a * local_x + b * local_y) / det
+    u_y = (-b * local_x + a * local_y) / det
+
+    # exponential of the scaled twist
+    phi = s * delta_theta
+    a, b = _arc_coefficients(phi)
+    t_x = s * (a * u_x - b * u_y)
+    t_y = s * (b * u_x + a * u_y)
+
+    return (x0 + c * t_x - s0 * t_y,
+            y0 + s0 * t_x + c * t_y,
+            normalize_angle(theta0 + phi))
+
+
+def _arc_coefficients(angle):
+    # sin(angle) / angle and (1 - cos(angle)) / angle, with their Taylor
+    # expansion for small angles
+    if abs(angle) < _SMALL_ANGLE:
+        return 1 - angle * angle / 6, angle / 2
+    return math.sin(angle) / angle, (1 - math.cos(angle)) / angle
+
+
+class PoseHistory:
+    """
+    Fixed capacity history of timestamped poses, to find where the robot
+    was when a sensor reading was taken.
+
+    The poses are kept in a ring buffer of arrays allocated once, so
+    recording a pose is a single slot write; get_pose_at() does a binary
+    search over the timestamps, which must be recorded in increasing
+    order, and interpolates between the two poses around t.
+
+    A single writer thread and any number of reader threads share it
+    without a lock: the writer may overwrite the oldest slots while a
+    reader searches them, so get_pose_at() checks afterwards that none of
+    the slots it read has been reached and, otherwise, searches again.
+    """
+
+    def __init__(self, capacity=1024):
+
+        self.capacity = capacity
+
+        self._times = array('d', [0.0]) * capacity
+        self._x = array('d', [0.0]) * capacity
+        self._y = array('d', [0.0]) * capacity
+        self._theta = array('d', [0.0]) * capacity
+        self._poses = 0  # total number of poses written so far
+
+    def append(self, t, x, y, theta):
+        """
+        Records the pose at time t.
+        """
+        slot = self._poses % self.capacity
+        self._times[slot] = t
+        self._x[slot] = x
+        self._y[slot] = y
+        self._theta[slot] = theta
+        self._poses += 1  # publishes the slot
+
+    def clear(self):
+        self._poses = 0
+
+    def __len__(self):
+        return min(self._poses, self.capacity - 1)
+
+    def span(self):
+        """
+        Returns the timestamps of the oldest and of the newest pose,
+        None if the history is empty.
+        """
+        poses = self._poses
+        if poses == 0:
+            return None
+        oldest = max(0, poses - self.capacity + 1)
+        return self._times[oldest % self.capacity], self._times[(poses - 1) % self.capacity]
+
+    def get_pose_at(self, t):
+        """
+        Returns the pose of the robot at time t, interpolated on SE(2)
+        between the recorded poses around t.
+
+        Parameters
+        ----------
+        t : float
+            time on the clock of the recorded timestamps
+
+        Returns
+        -------
+        pose : tuple
+            (x, y, theta), None if t is outside the recorded span
+        """
+
+        while True:
+            poses = self._poses  # the writer may keep appending meanwhile
+            pose, oldest = self._search(t, poses)
+
+            # the append() in progress writes the logical index
+            # self._poses, over the slot of self._poses - capacity
+            if self._poses - self.capacity < oldest:
+                return pose
+
+    def _search(self, t, poses):
+        # returns the pose at t among the first poses written, and the
+        # oldest logical index read
+
+        capacity = self.capacity
+        times = self._times
+
+        if poses == 0:
+            return None, 0
+
+        # binary search over the logical indices, oldest to newest
+        lo = max(0, poses - capacity + 1)
+        hi = poses - 1
+        oldest = lo
+        if t < times[lo % capacity] or t > times[hi % capacity]:
+            return None, oldest
+
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if times[mid % capacity] <= t:
+                lo = mid
+            else:
+                hi = mid
+
+        i, j = lo % capacity, hi % capacity
+        pose_0 = (self._x[i], self._y[i], self._theta[i])
+        if i == j or times[j] == times[i]:
+            return pose_0, oldest
+
+        pose_1 = (self._x[j], self._y[j], self._theta[j])
+        return interpolate(pose_0, pose_1, (t - times[i]) / (times[j] - times[i])), oldest
+
+
+# ------------------------------ heading fusion ------------------------------ #
+
+# chi-square value of a single measurement with 1% false alarm probability
+_CHI2_99 = 6.635
+
+
+class HeadingFilter:
+    """
+    Kalman filter fusing the yaw rate of the gyroscope with the one of
+    the wheel odometry.
+
+    The state is [w, b]: the yaw rate of the robot and the bias of the
+    gyroscope, both modelled as random walks. The gyroscope measures
+    w + b, the wheels measure w. The gyroscope is precise over a step but
+    drifts with its bias; the wheels do not drift but are coarse (a tick
+    over the short wheel base is a large angle) and wrong when a wheel
+    slips. Together they give the bias, which is tracked online.
+
+    The encoders count whole ticks, so the wheel yaw rate of a step is
+    off by up to a tick of each wheel: with wheel_resolution, the yaw of
+    a tick, the filter adds the variance of this quantization,
+    wheel_resolution^2 / 3 / dt^2, to wheel_noise at every step. Cobalt
+    sets it from its geometry.
+
+    A wheel measurement whose innovation fails a chi-square test (1%
+    false alarm) is taken as slip and discarded, so that during slip the
+    heading follows the gyroscope alone.
+
+    ...
+
+    Attributes
+    ----------
+    rate : float
+        estimated yaw rate in rad/s
+    bias : float
+        estimated gyroscope bias in rad/s
+    slips : int
+        wheel measurements rejected so far
+    """
+
+    def __init__(self,
+                 gyro_noise=0.005,  # standard deviation of a gyroscope reading, rad/s
+                 wheel_noise=0.01,  # standard deviation of the wheel yaw rate besides the ticks, rad/s
+                 wheel_resolution=None,  # yaw of a tick, meters_per_tick / wheel_base, rad
+                 acceleration=5.0,  # standard deviation of the yaw acceleration, rad/s^2
+                 bias_drift=1e-3,  # standard deviation of the bias drift, rad/s / sqrt(s)
+                 initial_bias=0.02,  # standard deviation of the initial bias, rad/s
+                 gate=_CHI2_99):
+
+        self.R_gyro = gyro_noise ** 2
+        self.R_wheel = wheel_noise ** 2
+        self.wheel_resolution = wheel_resolution
+        self.Q_rate = acceleration ** 2
+        self.Q_bias = bias_drift ** 2
+        self.gate = gate
+        self._initial_bias = initial_bias
+
+        self.reset()
+
+    def reset(self):
+
+        self.rate = 0.0
+        self.bias = 0.0
+        self.slips = 0
+
+        # covariance, symmetric: [[P_ww, P_wb], [P_wb, P_bb]]
+        self.P_ww = 1.0
+        self.P_wb = 0.0
+        self.P_bb = self._initial_bias ** 2
+
+    def _correct(self, innovation, h_w, h_b, R):
+        # scalar measurement z = h_w * w + h_b * b
+        Ph_w = self.P_ww * h_w + self.P_wb * h_b
+        Ph_b = self.P_wb * h_w + self.P_bb * h_b
+        S = h_w * Ph_w + h_b * Ph_b + R
+
+        K_w, K_b = Ph_w / S, Ph_b / S
+        self.rate += K_w * innovation
+        self.bias += K_b * innovation
+
+        self.P_ww -= K_w * Ph_w
+        self.P_wb -= K_w * Ph_b
+        self.P_bb -= K_b * Ph_b
+
+    def update(self, gyro_rate, wheel_rate, dt):
+        """
+        Runs a step of the filter.
+
+        Parameters
+        ----------
+        gyro_rate : float
+            yaw rate read from the gyroscope, rad/s
+        wheel_rate : float
+            yaw rate from the wheels over the step, rad/s
+        dt : float
+            length of the step in seconds
+
+        Returns
+        -------
+        rate : float
+            estimated yaw rate in rad/s
+        """
+
+        # predict: the rate and the bias are random walks
+        self.P_ww += self.Q_rate * dt
+        self.P_bb += self.Q_bias * dt
+
+        # gyroscope: z = w + b
+        self._correct(gyro_rate - (self.rate + self.bias), 1.0, 1.0, self.R_gyro)
+
+        # wheels: z = w, gated against slip; each wheel is off by a
+        # uniform fraction of a tick at both ends of the step
+        R_wheel = self.R_wheel
+        if self.wheel_resolution is not None:
+            R_wheel += (self.wheel_resolution / dt) ** 2 / 3
+        innovation = wheel_rate - self.rate
+        if innovation * innovation > self.gate * (self.P_ww + R_wheel):
+            self.slips += 1
+        else:
+            self._correct(innovation, 1.0, 0.0, R_wheel)
+
+        return self.rate
+
+
+# ---------------------------------- robot ----------------------------------- #
 
 class Cobalt:
 
-    def __init__(self):
+    def __init__(self,
+                 left_encoder=None, right_encoder=None,
+                 left_motor=None, right_motor=None,
+                 ticks_per_revolution=7 * 260,  # 1x decoding, REDUCTION_RATIO = 260
+                 wheel_base=0.04,  # m
+                 wheel_radius=0.025,  # m
+                 integrator=Integrator.ARC,
+                 history_size=1024,  # poses kept for get_pose_at()
+                 imu=None,  # MPU6050 for the heading fusion
+                 heading_filter=None):  # HeadingFilter, a default one if None and imu is set
 
         # components
-        self.left_encoder = None
-        self.right_encoder = None
+        self.left_encoder = left_encoder
+        self.right_encoder = right_encoder
 
-        self.left_motor = None
-        self.right_motor = None
+        self.left_motor = left_motor
+        self.right_motor = right_motor
+
+        self.imu = imu
 
         # last encoder value at the beginning is 0
         self.last_left_count = 0
         self.last_right_count = 0
 
         # robot geometry
-        self.wheel_base = 0.04
-        self.wheel_radius = 0.025
+        self.wheel_base = wheel_base
+        self.wheel_radius = wheel_radius
+        self.ticks_per_revolution = ticks_per_revolution
 
         # meters per tick
-        self.meters_per_tick_left = (2 * math.pi * self.wheel_radius) / self.left_encoder.ticks_per_revolution
+        self.meters_per_tick_left = (2 * math.pi * self.wheel_radius) / self.ticks_per_revolution
         self.meters_per_tick_right = self.meters_per_tick_left
 
+        # odometry integration scheme
+        self.integrator = integrator
+
+        # the heading comes from the wheels alone unless a gyroscope
+        # is fused in, its wheel measurements quantized by the ticks
+        if heading_filter is None and imu is not None:
+            heading_filter = HeadingFilter()
+        if heading_filter is not None and heading_filter.wheel_resolution is None:
+            heading_filter.wheel_resolution = self.meters_per_tick_left / self.wheel_base
+        self.heading_filter = heading_filter
+        self._last_timestamp = None
+
         # pose of the robot
         self.x = 0
         self.y = 0
         self.theta = 0
 
+        # past poses, to place the sensor readings
+        self.history = PoseHistory(history_size)
+
     def get_pose(self):
         return self.x, self.y, self.theta
+
+    def get_pose_at(self, t):
+        """
+        Returns the pose of the robot at time t (time.monotonic() clock),
+        None if t is older than the history or newer than the last
+        odometry update.
+        """
+        return self.history.get_pose_at(t)
     
     def set_pose(self, x, y, theta):
         self.x = x
         self.y = y
-        self.theta = theta
+        self.theta = normalize_angle(theta)
+        self.history.clear()  # the robot has been moved
+        self._last_timestamp = None
 
     def reset_pose(self):
         self.x = 0
         self.y = 0
         self.theta = 0
+        self.history.clear()
+        self._last_timestamp = None
     
     def update_odometry(self):
 
-        # compute ticks delta from last read
-        delta_ticks_left = (self.left_encoder.count - self.last_left_count) * self.left_encoder.direction
-        delta_ticks_right = (self.right_encoder.count - self.last_right_count) * self.right_encoder.direction
+        # compute ticks delta from last read, the counts are signed
+        left_count, _, timestamp = self.left_encoder.snapshot()
+        right_count = self.right_encoder.read_count()
+        delta_ticks_left = left_count - self.last_left_count
+        delta_ticks_right = right_count - self.last_right_count
 
         # update counters
-        self.last_left_count = self.left_encoder.count
-        self.last_right_count = self.right_encoder.count
+        self.last_left_count = left_count
+        self.last_right_count = right_count
 
-        # compute new pose
-        left_distance = self.meters_per_tick_left * delta_ticks_left
-        right_distance = self.meters_per_tick_right * delta_ticks_right
-        center_distance = (right_distance + left_distance) / 2
+        # yaw rate, MPU6050.read() returns it in degrees per second
+        gyro_rate = None
+        if self.imu is not None:
+            gyro_rate = math.radians(self.imu.read()[5])
 
-        # compute new pose delta
-        delta_x = center_distance * math.cos(self.theta)
-        delta_y = center_distance * math.sin(self.theta)
+        return self.update_pose(
+            self.meters_per_tick_left * delta_ticks_left,
+            self.meters_per_tick_right * delta_ticks_right,
+            timestamp, gyro_rate)
+
+    def update_pose(self, left_distance, right_distance, timestamp=None, gyro_rate=None):
+        """
+        Moves the pose by the distance travelled by each wheel and
+        records it in the history at timestamp, time.monotonic() if None.
+
+        If a heading filter is set and the yaw rate of the gyroscope
+        (rad/s) is given, the change of heading comes from the filter
+        instead of the difference of the wheels.
+        """
+
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        center_distance = (right_distance + left_distance) / 2
         delta_theta = (right_distance - left_distance) / self.wheel_base
 
+        # fuse the gyroscope, from the second update on (dt is needed)
+        if self.heading_filter is not None and gyro_rate is not None:
+            if self._last_timestamp is not None and timestamp > self._last_timestamp:
+                dt = timestamp - self._last_timestamp
+                delta_theta = self.heading_filter.update(gyro_rate, delta_theta / dt, dt) * dt
+        self._last_timestamp = timestamp
+
         # compute new pose
-        self.x += delta_x
-        self.y += delta_y
-        self.theta += delta_theta
+        self.x, self.y, self.theta = integrate(
+            self.x, self.y, self.theta, center_distance, delta_theta, self.integrator)
+
+        self.history.append(timestamp, self.x, self.y, self.theta)
 
         return self.x, self.y, self.theta
+
+    def replay(self, left_ticks, right_ticks, timestamps=None):
+        """
+        Runs the odometry over a log of encoder readings in one vectorized
+        pass, e.g. to re-run it offline after changing the calibration of
+        wheel_base or wheel_radius. Gives the same poses as calling
+        update_pose() once per sample, except that the heading comes from
+        the wheels only (the heading filter is not used).
+
+        The replay starts from the current pose and leaves the robot at
+        the last pose; if timestamps are given the last poses are also
+        recorded in the history.
+
+        Parameters
+        ----------
+        left_ticks, right_ticks : numpy.ndarray
+            ticks counted by each encoder since the previous sample
+        timestamps : numpy.ndarray
+            time of each sample, increasing
+
+        Returns
+        -------
+            tuple containing:
+                x after each sample, numpy.ndarray
+                y after each sample, numpy.ndarray
+                theta after each sample, numpy.ndarray
+        """
+
+        if np is None:
+            raise ImportError('NumPy is not available, install it to replay logs')
+
+        left_distances = np.asarray(left_ticks, dtype=float) * self.meters_per_tick_left
+        right_distances = np.asarray(right_ticks, dtype=float) * self.meters_per_tick_right
+
+        xs, ys, thetas = integrate_batch(
+            self.x, self.y, self.theta,
+            (right_distances + left_distances) / 2,
+            (right_distances - left_distances) / self.wheel_base,
+            self.integrator)
+
+        if len(xs) == 0:
+            return xs, ys, thetas
+
+        self.x, self.y, self.theta = float(xs[-1]), float(ys[-1]), float(thetas[-1])
+
+        if timestamps is not None:
+            first = max(0, len(xs) - self.history.capacity)
+            for t, x, y, theta in zip(timestamps[first:], xs[first:], ys[first:], thetas[first:]):
+                self.history.append(float(t), float(x), float(y), float(theta))
+            self._last_timestamp = float(timestamps[-1])
+
+        return xs, ys, thetas
+
+
+# ----------------------------------- main ----------------------------------- #
+
+if __name__ == '__main__':
+
+    # Scores each integrator against ground-truth trajectories: the true
+    # pose is integrated along exact arcs with a 0.1 ms step, the odometry
+    # gets the distance travelled by each wheel every control period. Run
+    # from the root of the repository with python test/robot.py
+
+    import time
+
+    RATE = 50  # odometry updates per second
+    SUBSTEPS = 200  # ground truth steps per update
+    DURATION = 30.0  # s
+    WHEEL_BASE = 0.04  # m
+
+    # wheel speed profiles, t -> (left, right) in m/s
+    trajectories = {
+        'tight circle': lambda t: (0.02, 0.12),
+        'spin in place': lambda t: (-0.1, 0.1),
+        'slalom': lambda t: (0.1 - 0.06 * math.sin(2 * t), 0.1 + 0.06 * math.sin(2 * t)),
+        'accelerating spiral': lambda t: (0.01 + 0.002 * t, 0.05 + 0.002 * t),
+    }
+
+    def run(profile, integrator):
+        """
+        Returns the largest position and heading errors over the run and
+        the cost of an update.
+        """
+
+        robot = Cobalt(wheel_base=WHEEL_BASE, integrator=integrator)
+        truth = (0.0, 0.0, 0.0)
+
+        h = 1 / (RATE * SUBSTEPS)
+        max_position_error, max_heading_error, cost = 0.0, 0.0, 0.0
+        for step in range(int(DURATION * RATE)):
+
+            # ground truth, and distance travelled by each wheel
+            left, right = 0.0, 0.0
+            for i in range(SUBSTEPS):
+                t = (step * SUBSTEPS + i + 0.5) * h
+                v_left, v_right = profile(t)
+                left += v_left * h
+                right += v_right * h
+                truth = integrate(*truth, (v_left + v_right) / 2 * h,
+                                  (v_right - v_left) / WHEEL_BASE * h, Integrator.ARC)
+
+            start = time.perf_counter()
+            x, y, theta = robot.update_pose(left, right, (step + 1) / RATE)
+            cost += time.perf_counter() - start
+
+            max_position_error = max(max_position_error, math.hypot(x - truth[0], y - truth[1]))
+            max_heading_error = max(max_heading_error, abs(normalize_angle(theta - truth[2])))
+
+        return max_position_error, max_heading_error, cost / (DURATION * RATE)
+
+    print('{} s at {} Hz, wheel base {} m\n'.format(DURATION, RATE, WHEEL_BASE))
+    print('{:<22}{:<10}{:>20}{:>20}{:>12}'.format(
+        'trajectory', 'integrator', 'max position [mm]', 'max heading [mrad]', 'cost [us]'))
+
+    for name, profile in trajectories.items():
+        for integrator in Integrator:
+            position_error, heading_error, cost = run(profile, integrator)
+            print('{:<22}{:<10}{:>20.4f}{:>20.4f}{:>12.2f}'.format(
+                name, integrator.name, position_error * 1e3, heading_error * 1e3, cost * 1e6))
+
+    # --------------------------- pose history lookup ---------------------------- #
+
+    # record the slalom at RATE, then look the pose up halfway between two
+    # updates and compare it with the ground truth at that time
+
+    profile = trajectories['slalom']
+    robot = Cobalt(wheel_base=WHEEL_BASE, history_size=int(DURATION * RATE) + 1)
+    h = 1 / (RATE * SUBSTEPS)
+    truth = (0.0, 0.0, 0.0)
+    halfway = []  # (t, true pose)
+    for step in range(int(DURATION * RATE)):
+        left, right = 0.0, 0.0
+        for i in range(SUBSTEPS):
+            v_left, v_right = profile((step * SUBSTEPS + i + 0.5) * h)
+            left += v_left * h
+            right += v_right * h
+            truth = integrate(*truth, (v_left + v_right) / 2 * h,
+                              (v_right - v_left) / WHEEL_BASE * h, Integrator.ARC)
+            if i == SUBSTEPS // 2 - 1 and step > 0:
+                halfway.append(((step * SUBSTEPS + i + 1) * h, truth))
+        robot.update_pose(left, right, (step + 1) / RATE)
+
+    # the error includes the one of the odometry itself
+    start = time.perf_counter()
+    poses = [robot.get_pose_at(t) for t, _ in halfway]
+    cost = (time.perf_counter() - start) / len(halfway)
+
+    errors = [math.hypot(p[0] - q[0], p[1] - q[1]) for p, (_, q) in zip(poses, halfway)]
+    print('\nget_pose_at() on the slalom, {} poses: max error {:.4f} mm, {:.2f} us per query'.format(
+        len(robot.history), max(errors) * 1e3, cost * 1e6))
+
+    # ------------------------------ heading fusion ------------------------------ #
+
+    # drives the slalom with quantized encoders whose left wheel slips
+    # (spins faster than the ground moves) in a few intervals, and a
+    # gyroscope with a drifting bias and white noise; compares the heading
+    # of the wheels alone, of the gyroscope alone and of the fusion
+
+    import random
+
+    TICKS_PER_REVOLUTION = 7 * 260
+    WHEEL_RADIUS = 0.025  # m
+    meters_per_tick = 2 * math.pi * WHEEL_RADIUS / TICKS_PER_REVOLUTION
+
+    SLIPS = ((5.0, 6.0), (12.0, 12.5), (20.0, 22.0))  # s
+    SLIP_SPEED = 0.05  # m/s the left wheel spins on top of its speed
+    GYRO_BIAS = 0.03  # rad/s at the start
+    GYRO_BIAS_DRIFT = 0.0005  # rad/s per s
+    GYRO_NOISE = 0.005  # rad/s
+
+    rng = random.Random(0)
+
+    wheels = Cobalt(wheel_base=WHEEL_BASE)
+    fused = Cobalt(wheel_base=WHEEL_BASE, heading_filter=HeadingFilter(gyro_noise=GYRO_NOISE))
+    gyro_heading = 0.0
+
+    truth = (0.0, 0.0, 0.0)
+    encoder_left, encoder_right = 0.0, 0.0  # distance seen by the encoders
+    ticks_left, ticks_right = 0, 0
+    errors = {'wheels only': 0.0, 'gyroscope only': 0.0, 'fused': 0.0}
+    cost = 0.0
+    for step in range(int(DURATION * RATE)):
+
+        yaw = 0.0
+        for i in range(SUBSTEPS):
+            t = (step * SUBSTEPS + i + 0.5) * h
+            v_left, v_right = profile(t)
+            slipping = any(start <= t < end for start, end in SLIPS)
+            encoder_left += (v_left + (SLIP_SPEED if slipping else 0.0)) * h
+            encoder_right += v_right * h
+            yaw += (v_right - v_left) / WHEEL_BASE * h
+            truth = integrate(*truth, (v_left + v_right) / 2 * h,
+                              (v_right - v_left) / WHEEL_BASE * h, Integrator.ARC)
+
+        # encoders count whole ticks
+        delta_left = int(encoder_left / meters_per_tick) - ticks_left
+        delta_right = int(encoder_right / meters_per_tick) - ticks_right
+        ticks_left += delta_left
+        ticks_right += delta_right
+        left, right = delta_left * meters_per_tick, delta_right * meters_per_tick
+
+        # gyroscope sampled at the update, average rate over the period
+        timestamp = (step + 1) / RATE
+        gyro_rate = yaw * RATE + GYRO_BIAS + GYRO_BIAS_DRIFT * timestamp + rng.gauss(0.0, GYRO_NOISE)
+        gyro_heading += gyro_rate / RATE
+
+        wheels.update_pose(left, right, timestamp)
+        start = time.perf_counter()
+        fused.update_pose(left, right, timestamp, gyro_rate)
+        cost += time.perf_counter() - start
+
+        for name, theta in (('wheels only', wheels.theta),
+                            ('gyroscope only', gyro_heading),
+                            ('fused', fused.theta)):
+            errors[name] = max(errors[name], abs(normalize_angle(theta - truth[2])))
+
+    heading_filter = fused.heading_filter
+    print('\nheading fusion on the slalom, {} s of slip, gyroscope bias {} -> {} rad/s'.format(
+        sum(end - start for start, end in SLIPS), GYRO_BIAS, GYRO_BIAS + GYRO_BIAS_DRIFT * DURATION))
+    for name, error in errors.items():
+        print('  {:<16} max heading error {:8.2f} mrad'.format(name, error * 1e3))
+    print('  estimated bias {:.4f} rad/s, {} wheel updates rejected as slip ({} slipped), {:.2f} us per update'.format(
+        heading_filter.bias, heading_filter.slips, round(sum(end - start for start, end in SLIPS) * RATE),
+        cost / (DURATION * RATE) * 1e6))
+
+    # ------------------------------- batch replay ------------------------------- #
+
+    # replays a log of random tick deltas (wheels between -0.15 and 0.15
+    # m/s at RATE) with update_pose() sample by sample and with replay(),
+    # checks that the trajectories match and times both
+
+    if np is None:
+        print('\nNumPy not installed, batch replay skipped')
+    else:
+        SAMPLES = 2_000_000
+        CHECKED = 200_000  # samples also replayed one by one
+
+        robot = Cobalt(wheel_base=WHEEL_BASE)
+        max_ticks = int(0.15 / RATE / robot.meters_per_tick_left)
+
+        log_rng = np.random.default_rng(0)
+        left_ticks = np.cumsum(log_rng.integers(-2, 3, SAMPLES)).clip(-max_ticks, max_ticks)
+        right_ticks = np.cumsum(log_rng.integers(-2, 3, SAMPLES)).clip(-max_ticks, max_ticks)
+        timestamps = np.arange(1, SAMPLES + 1) / RATE
+
+        for integrator in Integrator:
+
+            incremental = Cobalt(wheel_base=WHEEL_BASE, integrator=integrator)
+            start = time.perf_counter()
+            poses = [incremental.update_pose(left * incremental.meters_per_tick_left,
+                                             right * incremental.meters_per_tick_right, t)
+                     for left, right, t in zip(left_ticks[:CHECKED].tolist(),
+                                               right_ticks[:CHECKED].tolist(),
+                                               timestamps[:CHECKED].tolist())]
+            incremental_cost = (time.perf_counter() - start) / CHECKED
+
+            batch = Cobalt(wheel_base=WHEEL_BASE, integrator=integrator)
+            xs, ys, thetas = batch.replay(left_ticks[:CHECKED], right_ticks[:CHECKED])
+            poses = np.array(poses)
+            position_error = np.max(np.hypot(xs - poses[:, 0], ys - poses[:, 1]))
+            heading_error = np.max(np.abs(np.angle(np.exp(1j * (thetas - poses[:, 2])))))
+
+            batch = Cobalt(wheel_base=WHEEL_BASE, integrator=integrator)
+            start = time.perf_counter()
+            batch.replay(left_ticks, right_ticks, timestamps)
+            batch_cost = (time.perf_counter() - start) / SAMPLES
+
+            print('\nreplay() {} on {} samples: {:.3f} s, {:.1f}x faster than update_pose()'.format(
+                integrator.name, SAMPLES, batch_cost * SAMPLES, incremental_cost / batch_cost))
+            print('  over the first {} samples: max position difference {:.2e} m, heading {:.2e} rad'.format(
+                CHECKED, position_error, heading_error))